@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the self-healing loop on a synthetic case corpus.
+
+Generates a seeded corpus (see corpus.py), runs every case through the stage 1
+validate → test → fix loop against the deterministic FakeLLM and the green
+ones through stage 2, and reports wall time per attempt and per stage,
+time-to-green and disk usage. With the same seed and options every run takes
+the same attempts, so the timings can be saved as a baseline and later runs
+compared against it.
+"""
+import argparse
+import importlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from stages import GenerateStage, ValidateStage, load_stage
+
+# metric -> True if higher is better
+COMPARED_METRICS = {
+    "green_rate": True,
+    "validate_seconds": False,
+    "generate_seconds": False,
+    "attempt_p50_seconds": False,
+    "attempt_p95_seconds": False,
+    "time_to_green_p50_seconds": False,
+    "time_to_green_p95_seconds": False,
+    "disk_workspace_mb": False,
+    "disk_venv_cache_mb": False,
+}
+
+def percentile(values, q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+def disk_usage_mb(path: Path) -> float:
+    """Allocated size of everything under path; hard-linked files (venv clones) count once."""
+    seen, total = set(), 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            st = os.lstat(os.path.join(dirpath, name))
+            if (st.st_dev, st.st_ino) not in seen:
+                seen.add((st.st_dev, st.st_ino))
+                total += st.st_blocks * 512
+    return round(total / 1024 / 1024, 1)
+
+def attempt_times(events) -> dict:
+    """Durations of the traced stage 1 attempts, as {attempt number: [seconds, ...]}."""
+    times = {}
+    for e in events:
+        if e["name"] == "attempt" and e["cat"] == "validate" and e["ph"] == "X":
+            times.setdefault(e["args"]["attempt"], []).append(e["dur"] / 1e6)
+    return times
+
+def run_scenario(args, run_dir: Path) -> dict:
+    corpus = importlib.import_module("corpus")
+    tracing = importlib.import_module("tracing")
+    tracer = tracing.enable(args.trace or run_dir / "trace.json", "benchmark")
+
+    workspace, valid_cases, output = run_dir / "workspace", run_dir / "valid", run_dir / "output"
+    venv_cache = Path(args.venv_cache) if args.venv_cache else run_dir / "venv_cache"
+    specs = corpus.generate_corpus(workspace, args.cases, args.seed, args.max_bugs)
+    client = corpus.FakeLLM(specs, args.llm_latency_ms / 1000)
+
+    validate = ValidateStage(
+        args.concurrency, client=client, workspace=str(workspace), valid_cases=str(valid_cases),
+        venv_cache=str(venv_cache), no_venv_cache=args.no_venv_cache, wheelhouse=args.wheelhouse,
+        offline=args.offline, blob_store=None, llm_cache=None, warm_pytest=args.warm_pytest,
+        speculative=args.speculative, max_attempts=args.max_attempts or args.max_bugs + 2,
+    )
+    started = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max(1, args.concurrency)) as pool:
+            reports = list(pool.map(validate.report, [spec["name"] for spec in specs]))
+    finally:
+        validate.close()
+    validate_seconds = time.perf_counter() - started
+
+    green = [r for r in reports if r.outcome == "valid"]
+    generate = GenerateStage(args.concurrency, str(valid_cases), output_path=str(output), wheelhouse=None)
+    started = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max(1, args.concurrency)) as pool:
+            list(pool.map(generate, [r.case_name for r in green]))
+    finally:
+        generate.close()
+    generate_seconds = time.perf_counter() - started
+
+    if args.trace:
+        tracing.finish()
+    else:
+        tracing.print_summary(tracing.disable().summary())
+
+    by_number = attempt_times(tracer.events)
+    attempts = [t for times in by_number.values() for t in times]
+    to_green = [r.wall_time for r in green]
+    bugs = {spec["name"]: len(spec["bugs"]) for spec in specs}
+    return {
+        "cases": len(reports),
+        "green": len(green),
+        "green_rate": round(len(green) / len(reports), 3) if reports else 0.0,
+        "validate_seconds": round(validate_seconds, 3),
+        "generate_seconds": round(generate_seconds, 3),
+        "total_seconds": round(validate_seconds + generate_seconds, 3),
+        "attempts": len(attempts),
+        "attempt_mean_seconds": round(sum(attempts) / len(attempts), 3) if attempts else 0.0,
+        "attempt_p50_seconds": round(percentile(attempts, 0.50), 3),
+        "attempt_p95_seconds": round(percentile(attempts, 0.95), 3),
+        "attempt_mean_seconds_by_number": {str(n): round(sum(t) / len(t), 3) for n, t in sorted(by_number.items())},
+        "attempts_to_green_mean": round(sum(r.attempts for r in green) / len(green), 2) if green else 0.0,
+        "time_to_green_p50_seconds": round(percentile(to_green, 0.50), 3),
+        "time_to_green_p95_seconds": round(percentile(to_green, 0.95), 3),
+        "time_to_green_max_seconds": round(max(to_green, default=0.0), 3),
+        "llm_calls": client.calls,
+        "disk_workspace_mb": disk_usage_mb(workspace),
+        "disk_venv_cache_mb": disk_usage_mb(venv_cache),
+        "disk_valid_mb": disk_usage_mb(valid_cases),
+        "disk_output_mb": disk_usage_mb(output),
+        "case_results": {r.case_name: {"outcome": r.outcome, "attempts": r.attempts, "bugs": bugs[r.case_name],
+                                       "seconds": round(r.wall_time, 3)} for r in reports},
+    }
+
+def scenario_name(args) -> str:
+    name = (f"{args.cases}cases-seed{args.seed}-bugs{args.max_bugs}-c{args.concurrency}"
+            f"-spec{args.speculative}-llm{args.llm_latency_ms:g}ms")
+    if args.warm_pytest:
+        name += "-warm"
+    if args.no_venv_cache:
+        name += "-novenvcache"
+    if args.wheelhouse:
+        name += "-wheelhouse" + ("-offline" if args.offline else "")
+    return name
+
+def compare(result: dict, baseline: dict, tolerance: float):
+    """Returns a list of (metric, baseline, current, change, regressed)."""
+    rows = []
+    for metric, higher_is_better in COMPARED_METRICS.items():
+        old, new = baseline.get(metric), result.get(metric)
+        if not old or new is None:
+            continue
+        change = (new - old) / old
+        regressed = change < -tolerance if higher_is_better else change > tolerance
+        rows.append((metric, old, new, change, regressed))
+    return rows
+
+def print_comparison(name: str, result: dict, baseline: dict, tolerance: float) -> bool:
+    """Print result against baseline; returns True if any metric regressed."""
+    regressed = False
+    print(f"📊 {name}")
+    for metric, old, new, change, bad in compare(result, baseline, tolerance):
+        regressed |= bad
+        print(f"  {'❌' if bad else '✅'} {metric:>26}: {old} → {new} ({change:+.1%})")
+    return regressed
+
+def load_baselines(path: Path) -> dict:
+    return json.loads(path.read_text(encoding="utf-8")) if path.exists() else {}
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the validate and generate stages on a synthetic case corpus")
+    parser.add_argument("--cases", type=int, default=8, help="Cases in the corpus")
+    parser.add_argument("--seed", type=int, default=1, help="Corpus seed")
+    parser.add_argument("--max-bugs", type=int, default=2, help="Most injected bugs per case (each takes one fix attempt)")
+    parser.add_argument("--max-attempts", type=int, help="Stage 1 attempts per case (default: max bugs + 2)")
+    parser.add_argument("--concurrency", type=int, default=2, help="Cases validated and generated at once")
+    parser.add_argument("--speculative", type=int, default=1, help="Fix candidates per failed attempt (as stage 1 --speculative)")
+    parser.add_argument("--warm-pytest", action=argparse.BooleanOptionalAction, default=False,
+                        help="Run tests in long-lived pytest workers per dependency set (as stage 1 --warm-pytest)")
+    parser.add_argument("--llm-latency-ms", type=float, default=0, help="Simulated latency of every LLM call")
+    parser.add_argument("--venv-cache", help="Venv cache to use (default: a fresh one per run)")
+    parser.add_argument("--no-venv-cache", action="store_true", help="Build every venv from scratch")
+    parser.add_argument("--wheelhouse", help="Wheelhouse for venv installs")
+    parser.add_argument("--offline", action="store_true", help="Install only from the wheelhouse")
+    parser.add_argument("--keep", help="Run in this folder and keep it (default: a temporary folder)")
+    parser.add_argument("--trace", help="Also write the run's Chrome trace to this file")
+    parser.add_argument("--save", help="Store the result in this baseline file")
+    parser.add_argument("--baseline", help="Compare against this baseline file")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="Compare two baseline files without running")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative regression per metric")
+    args = parser.parse_args()
+
+    if args.compare:
+        old, new = (load_baselines(Path(p)).get("scenarios", {}) for p in args.compare)
+        shared = sorted(set(old) & set(new))
+        if not shared:
+            print(f"⚠️ No scenario in both {args.compare[0]} and {args.compare[1]}")
+        regressed = False
+        for name in shared:
+            regressed |= print_comparison(name, new[name], old[name], args.tolerance)
+        sys.exit(1 if regressed else 0)
+
+    # Puts the stage 1 folder on sys.path, for corpus.FakeLLM (prompts) and tracing
+    load_stage("validate")
+    name = scenario_name(args)
+    print(f"⏱️ Running {name}")
+    run_dir = Path(args.keep) if args.keep else Path(tempfile.mkdtemp(prefix="pipeline-bench-"))
+    try:
+        result = run_scenario(args, run_dir.resolve())
+    finally:
+        if not args.keep:
+            shutil.rmtree(run_dir, ignore_errors=True)
+    for key, value in result.items():
+        if key != "case_results":
+            print(f"  {key:>30}: {value}")
+    unexpected = {case: r for case, r in result["case_results"].items() if r["attempts"] != r["bugs"] + 1}
+    if unexpected:
+        print(f"⚠️ {len(unexpected)} case(s) did not go green on attempt bugs + 1: {unexpected}")
+
+    regressed = False
+    if args.baseline:
+        baseline_file = Path(args.baseline)
+        baseline = load_baselines(baseline_file).get("scenarios", {}).get(name)
+        if baseline is None:
+            print(f"⚠️ No baseline for {name} in {baseline_file}")
+        else:
+            regressed = print_comparison(name, result, baseline, args.tolerance)
+
+    if args.save:
+        save_file = Path(args.save)
+        baselines = load_baselines(save_file)
+        baselines.setdefault("scenarios", {})[name] = {**result, "recorded_at": time.strftime("%Y-%m-%dT%H:%M:%S")}
+        save_file.parent.mkdir(parents=True, exist_ok=True)
+        save_file.write_text(json.dumps(baselines, indent=2), encoding="utf-8")
+        print(f"💾 Saved baseline for {name} to {save_file}")
+
+    sys.exit(1 if regressed else 0)
+
+if __name__ == "__main__":
+    main()
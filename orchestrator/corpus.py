@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Synthetic case corpus for the pipeline benchmark, plus the deterministic fake
+LLM that repairs it.
+
+Every case is a script.py with a random ResultDto shape, run() signature and
+dependency set. Up to max_bugs known bugs are injected into it. Each bug takes
+exactly one fix round, so a case with n bugs goes green on attempt n + 1. The
+fake LLM writes the tests from the case spec and answers a fix request by
+removing the next remaining bug, so a run with the same seed always takes the
+same path.
+"""
+import json
+import random
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+MANIFEST_FILE = "corpus.json"
+
+# ResultDto field kind -> (annotation, value expression in terms of the loop index i, isinstance check)
+FIELD_KINDS = {
+    "int": ("int", "i", "int"),
+    "float": ("float", "i * 0.5", "float"),
+    "str": ("str", "f'item-{i}'", "str"),
+    "bool": ("bool", "i % 2 == 0", "bool"),
+    "datetime": ("datetime", "datetime(2024, 1, 1) + timedelta(minutes=i)", "datetime"),
+    "decimal": ("Decimal", "Decimal(i) / 4", "Decimal"),
+    "uuid": ("UUID", "UUID(int=i)", "UUID"),
+    "list": ("List[int]", "list(range(i % 4))", "list"),
+    "dict": ("Dict[str, int]", "{'n': i}", "dict"),
+    "optional": ("Optional[str]", "None if i % 2 else 'odd'", "(str, type(None))"),
+}
+
+# run() signatures of the plain, resumable and sharded contracts (consumer mode needs a RequestDto, left out)
+SIGNATURES = {
+    "plain": "",
+    "resumable": "resume_token: Optional[str] = None",
+    "sharded": "shard_index: int = 0, shard_count: int = 1",
+}
+
+# Requirement -> module it is imported as
+PACKAGES = {"six": "six", "attrs": "attr", "python-dateutil": "dateutil"}
+DEFAULT_DEPENDENCY_SETS = [[], ["six"], ["attrs"], ["six", "python-dateutil"]]
+
+# Injectable bugs. Each one is removed by one fix; bugs in the same group touch the same line and are never combined.
+BUGS = {
+    "missing_dependency": "requirements",  # imports a package missing from requirements.txt
+    "name_error": "range",                 # loops over an undefined name
+    "short_output": "range",               # yields one result too few
+    "wrong_type": "field",                 # first checked field gets a value of the wrong type
+}
+
+def case_spec(name: str, rng: random.Random, dependency_sets: List[List[str]], max_bugs: int) -> dict:
+    kinds = rng.sample(sorted(FIELD_KINDS), rng.randint(1, 6))
+    dependencies = list(rng.choice(dependency_sets))
+    spec = {
+        "name": name,
+        "fields": [{"name": f"f{i}_{kind}", "kind": kind} for i, kind in enumerate(kinds)],
+        "signature": rng.choice(sorted(SIGNATURES)),
+        "dependencies": dependencies,
+        "count": rng.randint(2, 8),
+        "bugs": [],
+    }
+    candidates = [bug for bug in sorted(BUGS) if bug != "wrong_type" or _typed_field(spec) is not None]
+    if not set(PACKAGES) - set(dependencies):
+        candidates.remove("missing_dependency")
+    rng.shuffle(candidates)
+    wanted = rng.randint(0, max_bugs)
+    groups = set()
+    for bug in candidates:
+        if len(spec["bugs"]) >= wanted:
+            break
+        if BUGS[bug] not in groups:
+            groups.add(BUGS[bug])
+            spec["bugs"].append(bug)
+    if "missing_dependency" in spec["bugs"]:
+        spec["missing_package"] = rng.choice(sorted(set(PACKAGES) - set(dependencies)))
+        # Fixed last: it leaves script.py unchanged, so FakeLLM can only tell it apart once no other bug is left
+        spec["bugs"].remove("missing_dependency")
+        spec["bugs"].append("missing_dependency")
+    return spec
+
+def _typed_field(spec: dict) -> Optional[dict]:
+    """The field the wrong_type bug targets (an Optional[str] accepts any string, so it cannot)."""
+    return next((f for f in spec["fields"] if f["kind"] != "optional"), None)
+
+def render_script(spec: dict, fixes: int = 0) -> str:
+    """script.py of a case with its first `fixes` bugs repaired."""
+    active = set(spec["bugs"][fixes:])
+    packages = spec["dependencies"] + ([spec["missing_package"]] if "missing_package" in spec else [])
+    count = "cnt" if "name_error" in active else "COUNT - 1" if "short_output" in active else "COUNT"
+    wrong = _typed_field(spec)["name"] if "wrong_type" in active else None
+    values = []
+    for f in spec["fields"]:
+        expr = FIELD_KINDS[f["kind"]][1]
+        if f["name"] == wrong:
+            expr = f"len(str({expr}))" if f["kind"] == "str" else f"repr({expr})"
+        values.append(f"{f['name']}={expr}")
+    shard_filter = "        if i % shard_count != shard_index:\n            continue\n" if spec["signature"] == "sharded" else ""
+    lines = [
+        f"# benchmark case: {spec['name']}",
+        "import asyncio",
+        "from dataclasses import dataclass",
+        "from datetime import datetime, timedelta",
+        "from decimal import Decimal",
+        "from typing import AsyncGenerator, Dict, List, Optional",
+        "from uuid import UUID",
+        *(f"import {PACKAGES[p]}  # noqa: F401" for p in packages),
+        "",
+        f"COUNT = {spec['count']}",
+        "",
+        "@dataclass",
+        "class ResultDto:",
+        *(f"    {f['name']}: {FIELD_KINDS[f['kind']][0]}" for f in spec["fields"]),
+        "",
+        f"async def run({SIGNATURES[spec['signature']]}) -> AsyncGenerator[ResultDto, None]:",
+        f"    for i in range({count}):",
+    ]
+    return "\n".join(lines) + "\n" + shard_filter + (
+        "        await asyncio.sleep(0)\n"
+        f"        yield ResultDto({', '.join(values)})\n")
+
+def render_requirements(spec: dict, fixes: int = 0) -> str:
+    packages = list(spec["dependencies"])
+    if "missing_package" in spec and "missing_dependency" in spec["bugs"][:fixes]:
+        packages.append(spec["missing_package"])
+    return "".join(f"{p}\n" for p in packages)
+
+def render_tests(spec: dict) -> str:
+    checks = "".join(f"        assert isinstance(item.{f['name']}, {FIELD_KINDS[f['kind']][2]})\n" for f in spec["fields"])
+    return (
+        "import asyncio\n"
+        "from datetime import datetime\n"
+        "from decimal import Decimal\n"
+        "from uuid import UUID\n\n"
+        "import script\n\n"
+        "def collect():\n"
+        "    async def gather():\n"
+        "        return [item async for item in script.run()]\n"
+        "    return asyncio.run(gather())\n\n"
+        "def test_yields_every_result():\n"
+        f"    assert len(collect()) == {spec['count']}\n\n"
+        "def test_result_types():\n"
+        "    for item in collect():\n"
+        "        assert isinstance(item, script.ResultDto)\n"
+        f"{checks}"
+    )
+
+def render_readme(spec: dict) -> str:
+    return f"# {spec['name']}\n\nSynthetic benchmark case yielding {spec['count']} ResultDto items.\n"
+
+def generate_corpus(root: Path, cases: int, seed: int, max_bugs: int = 2,
+                    dependency_sets: Optional[List[List[str]]] = None) -> List[dict]:
+    """Write `cases` case folders (script.py, requirements.txt, readme.md) under root and return their specs."""
+    rng = random.Random(seed)
+    root = Path(root)
+    root.mkdir(parents=True, exist_ok=True)
+    specs = [case_spec(f"case_{i:03d}", rng, dependency_sets or DEFAULT_DEPENDENCY_SETS, max_bugs) for i in range(cases)]
+    for spec in specs:
+        case_dir = root / spec["name"]
+        case_dir.mkdir(parents=True, exist_ok=True)
+        (case_dir / "script.py").write_text(render_script(spec), encoding="utf-8")
+        (case_dir / "requirements.txt").write_text(render_requirements(spec), encoding="utf-8")
+        (case_dir / "readme.md").write_text(render_readme(spec), encoding="utf-8")
+    (root / MANIFEST_FILE).write_text(json.dumps({"seed": seed, "cases": specs}, indent=2), encoding="utf-8")
+    return specs
+
+CASE_MARKER = re.compile(r"# benchmark case: (\S+)")
+
+class FakeLLM:
+    """
+    Stand-in for the stage 1 LLM client. Test requests get the case's tests;
+    fix requests get the script with one more bug removed, found by matching
+    the script quoted in the prompt, so speculative candidates agree. Every
+    call waits `latency` seconds.
+    """
+    def __init__(self, specs: List[dict], latency: float = 0.0):
+        from prompts import TEST_GEN_SYSTEM
+        self.test_system_prompt = TEST_GEN_SYSTEM
+        self.specs: Dict[str, dict] = {spec["name"]: spec for spec in specs}
+        self.latency = latency
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def complete_json(self, system_prompt: str, user_prompt: str, response_format=None) -> dict:
+        import tracing
+        with tracing.span("complete_json", "validate", prompt_chars=len(system_prompt) + len(user_prompt), fake=True) as s:
+            with self._lock:
+                self.calls += 1
+            if self.latency:
+                time.sleep(self.latency)
+            response = self._answer(system_prompt, user_prompt)
+            s["response_chars"] = sum(len(v) for v in response.values() if isinstance(v, str))
+            return response
+
+    def _answer(self, system_prompt: str, user_prompt: str) -> dict:
+        match = CASE_MARKER.search(user_prompt)
+        if not match or match.group(1) not in self.specs:
+            raise ValueError("prompt does not quote a benchmark case")
+        spec = self.specs[match.group(1)]
+        fixes = next((n for n in range(len(spec["bugs"]), -1, -1) if render_script(spec, n) in user_prompt), None)
+        if fixes is None:
+            raise ValueError(f"prompt quotes an unknown version of {spec['name']}")
+        if system_prompt == self.test_system_prompt:
+            return {"tests": [{"path": "test_script.py", "content": render_tests(spec)}]}
+        fixes = min(fixes + 1, len(spec["bugs"]))
+        return {"script_py": render_script(spec, fixes), "requirements_txt": render_requirements(spec, fixes),
+                "readme_md": render_readme(spec)}
+
+    def close(self):
+        pass
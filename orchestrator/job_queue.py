@@ -0,0 +1,162 @@
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional
+
+STAGES = ("validate", "generate", "deploy")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    case_name TEXT NOT NULL UNIQUE,
+    stage TEXT NOT NULL,
+    state TEXT NOT NULL,            -- pending, running, done, failed
+    priority INTEGER NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,  -- failed attempts at the current stage
+    last_error TEXT,
+    available_at REAL NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_claim ON jobs (stage, state, priority DESC, available_at);
+CREATE TABLE IF NOT EXISTS runs (
+    job_id INTEGER NOT NULL REFERENCES jobs(id),
+    stage TEXT NOT NULL,
+    started_at REAL NOT NULL,
+    finished_at REAL NOT NULL,
+    ok INTEGER NOT NULL,
+    detail TEXT
+);
+"""
+
+@dataclass
+class Job:
+    id: int
+    case_name: str
+    stage: str
+    state: str
+    priority: int
+    attempts: int
+    last_error: Optional[str]
+    available_at: float
+
+def _job(row) -> Optional[Job]:
+    return Job(*row) if row else None
+
+JOB_COLUMNS = "id, case_name, stage, state, priority, attempts, last_error, available_at"
+
+class JobQueue:
+    """
+    Persistent job queue in one SQLite file: one job per case, moved through
+    STAGES one stage at a time. A job's stage only advances once the stage
+    finished, so after a crash running jobs are requeued at the stage they
+    were in (see recover()) and finished stages are not repeated.
+    """
+    def __init__(self, path: Path):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(path), check_same_thread=False, isolation_level=None, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+        self.lock = threading.Lock()
+        # Notified whenever a job becomes claimable or finishes
+        self.changed = threading.Condition(self.lock)
+
+    def submit(self, case_name: str, priority: int = 0, stage: str = STAGES[0]) -> Job:
+        """Queue a case at stage; a finished, failed or pending job for it is reset (running ones are left alone)."""
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT INTO jobs (case_name, stage, state, priority, created_at, updated_at) VALUES (?, ?, 'pending', ?, ?, ?) "
+                "ON CONFLICT(case_name) DO UPDATE SET stage = excluded.stage, state = 'pending', priority = excluded.priority, "
+                "attempts = 0, last_error = NULL, available_at = 0, updated_at = excluded.updated_at WHERE state != 'running'",
+                (case_name, stage, priority, now, now))
+            self.changed.notify_all()
+            return _job(self.conn.execute(f"SELECT {JOB_COLUMNS} FROM jobs WHERE case_name = ?", (case_name,)).fetchone())
+
+    def recover(self) -> int:
+        """Requeue jobs left running by a crashed or killed orchestrator. Returns how many."""
+        with self.lock:
+            return self.conn.execute("UPDATE jobs SET state = 'pending', updated_at = ? WHERE state = 'running'",
+                                     (time.time(),)).rowcount
+
+    def claim(self, stage: str) -> Optional[Job]:
+        """Take the highest-priority, oldest claimable job of stage and mark it running."""
+        now = time.time()
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.conn.execute(
+                    f"SELECT {JOB_COLUMNS} FROM jobs WHERE stage = ? AND state = 'pending' AND available_at <= ? "
+                    "ORDER BY priority DESC, id LIMIT 1", (stage, now)).fetchone()
+                if row:
+                    self.conn.execute("UPDATE jobs SET state = 'running', updated_at = ? WHERE id = ?", (now, row[0]))
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+        job = _job(row)
+        if job:
+            job.state = "running"
+        return job
+
+    def _record_run(self, job: Job, started: float, ok: bool, detail: str):
+        self.conn.execute("INSERT INTO runs (job_id, stage, started_at, finished_at, ok, detail) VALUES (?, ?, ?, ?, ?, ?)",
+                          (job.id, job.stage, started, time.time(), int(ok), detail))
+
+    def complete(self, job: Job, started: float, next_stage: Optional[str], detail: str = ""):
+        """Record the finished stage and queue the job at next_stage (None = the job is done)."""
+        with self.lock:
+            self._record_run(job, started, True, detail)
+            self.conn.execute(
+                "UPDATE jobs SET stage = ?, state = ?, attempts = 0, last_error = NULL, available_at = 0, updated_at = ? WHERE id = ?",
+                (next_stage or job.stage, "pending" if next_stage else "done", time.time(), job.id))
+            self.changed.notify_all()
+
+    def fail(self, job: Job, started: float, error: str, retries: int, backoff: float, retryable: bool = True) -> bool:
+        """Record a failed attempt. Requeues the job after an exponential backoff while its retry budget lasts; returns True if requeued."""
+        attempts = job.attempts + 1
+        retry = retryable and attempts <= retries
+        with self.lock:
+            self._record_run(job, started, False, error)
+            self.conn.execute(
+                "UPDATE jobs SET state = ?, attempts = ?, last_error = ?, available_at = ?, updated_at = ? WHERE id = ?",
+                ("pending" if retry else "failed", attempts, error,
+                 time.time() + backoff * 2 ** (attempts - 1) if retry else 0, time.time(), job.id))
+            self.changed.notify_all()
+        return retry
+
+    def wait(self, timeout: float):
+        """Block until a job changes or timeout passes (jobs submitted by other processes are seen on the next poll)."""
+        with self.changed:
+            self.changed.wait(timeout)
+
+    def active(self, stages=STAGES) -> bool:
+        """True while a job of one of stages is pending or running."""
+        marks = ", ".join("?" * len(stages))
+        with self.lock:
+            return self.conn.execute(f"SELECT 1 FROM jobs WHERE state IN ('pending', 'running') AND stage IN ({marks}) LIMIT 1",
+                                     tuple(stages)).fetchone() is not None
+
+    def jobs(self, state: Optional[str] = None) -> List[Job]:
+        query = f"SELECT {JOB_COLUMNS} FROM jobs" + (" WHERE state = ?" if state else "") + " ORDER BY priority DESC, id"
+        with self.lock:
+            return [_job(r) for r in self.conn.execute(query, (state,) if state else ())]
+
+    def counts(self) -> Dict[str, int]:
+        """Jobs per '<stage>/<state>'."""
+        with self.lock:
+            rows = self.conn.execute("SELECT stage, state, COUNT(*) FROM jobs GROUP BY stage, state").fetchall()
+        return {f"{stage}/{state}": n for stage, state, n in rows}
+
+    def stage_times(self) -> Dict[str, dict]:
+        """Runs, failures and total/mean seconds per stage."""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT stage, COUNT(*), SUM(1 - ok), SUM(finished_at - started_at) FROM runs GROUP BY stage").fetchall()
+        return {stage: {"runs": n, "failed": failed, "seconds": total, "mean": total / n} for stage, n, failed, total in rows}
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+import argparse
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from job_queue import STAGES, Job, JobQueue
+from stages import DeployStage, GenerateStage, StageOutcome, ValidateStage, enable_tracing, load_stage, load_stage_config
+
+def load_config_from_env(DEBUG):
+    """Load configuration defaults from .env file"""
+    if DEBUG == 0:
+        from dotenv import load_dotenv
+        load_dotenv()
+
+    return {
+        "db_path": os.getenv("ORCHESTRATOR_DB_PATH"),
+        "workers": {stage: int(os.getenv(f"{stage.upper()}_WORKERS", "2")) for stage in STAGES},
+        "retries": {stage: int(os.getenv(f"{stage.upper()}_RETRIES", "1")) for stage in STAGES},
+        "backoff": float(os.getenv("RETRY_BACKOFF_SECONDS", "5")),
+        "poll": float(os.getenv("ORCHESTRATOR_POLL_SECONDS", "2")),
+        "stop_after": os.getenv("ORCHESTRATOR_STOP_AFTER", STAGES[-1]),
+        "trace_path": os.getenv("TRACE_PATH"),
+    }
+
+class Pipeline:
+    """
+    Moves queued cases through validate → generate → deploy.
+
+    Every stage has its own pool of worker threads, so one case can deploy
+    while others are still being validated; `workers` caps each stage's
+    concurrency and `retries` its retry budget. Stages after `stop_after`
+    are not run and jobs finish there.
+    """
+    def __init__(self, queue: JobQueue, handlers: Dict[str, Callable[[str], StageOutcome]],
+                 workers: Dict[str, int], retries: Dict[str, int], backoff: float = 5.0,
+                 poll: float = 2.0, stop_after: str = STAGES[-1]):
+        self.queue = queue
+        self.stages = STAGES[:STAGES.index(stop_after) + 1]
+        self.handlers = handlers
+        self.workers = workers
+        self.retries = retries
+        self.backoff = backoff
+        self.poll = poll
+        self.stop = threading.Event()
+
+    def next_stage(self, stage: str) -> Optional[str]:
+        i = self.stages.index(stage) + 1
+        return self.stages[i] if i < len(self.stages) else None
+
+    def run_job(self, job: Job):
+        started = time.time()
+        print(f"▶️ [{job.case_name}] {job.stage}")
+        try:
+            outcome = self.handlers[job.stage](job.case_name)
+        except Exception as e:
+            outcome = StageOutcome(False, f"{type(e).__name__}: {e}")
+        if outcome.ok:
+            next_stage = self.next_stage(job.stage)
+            self.queue.complete(job, started, next_stage, outcome.detail)
+            print(f"✅ [{job.case_name}] {job.stage} done in {time.time() - started:.1f}s"
+                  + (f" → {next_stage}" if next_stage else ""))
+        elif self.queue.fail(job, started, outcome.detail, self.retries[job.stage], self.backoff, outcome.retryable):
+            print(f"🔁 [{job.case_name}] {job.stage} failed, retrying: {outcome.detail}")
+        else:
+            print(f"❌ [{job.case_name}] {job.stage} failed: {outcome.detail}")
+
+    def worker(self, stage: str, watch: bool):
+        while not self.stop.is_set():
+            job = self.queue.claim(stage)
+            if job:
+                self.run_job(job)
+            elif not watch and not self.queue.active(self.stages):
+                return
+            else:
+                # Woken early when another worker finishes a job (which may hand one to this stage)
+                self.queue.wait(self.poll)
+
+    def run(self, watch: bool = False, discover: Optional[Callable[[], List[str]]] = None):
+        """Process jobs until none are left (or, with watch, until stop is set), submitting discover() results as they appear."""
+        recovered = self.queue.recover()
+        if recovered:
+            print(f"♻️ Resuming {recovered} interrupted job(s)")
+        threads = [threading.Thread(target=self.worker, args=(stage, watch), name=f"{stage}-{i}", daemon=True)
+                   for stage in self.stages for i in range(max(1, self.workers[stage]))]
+        for t in threads:
+            t.start()
+        try:
+            while any(t.is_alive() for t in threads):
+                if watch and discover:
+                    known = {job.case_name for job in self.queue.jobs()}
+                    for case_name in discover():
+                        if case_name not in known:
+                            self.queue.submit(case_name)
+                            print(f"📥 Queued new case {case_name}")
+                for t in threads:
+                    t.join(self.poll)
+        except KeyboardInterrupt:
+            # Running jobs are requeued by recover() on the next start
+            print("⏹️ Stopping; interrupted jobs resume on the next run")
+            self.stop.set()
+            with self.queue.changed:
+                self.queue.changed.notify_all()
+            raise
+
+def create_handlers(stages, workers: Dict[str, int], dry_run: bool = False, verbose: bool = False, force: bool = False):
+    """Build the stage handlers used by a pipeline running stages (each stage's .env is read once, here)."""
+    handlers = {}
+    if "validate" in stages:
+        handlers["validate"] = ValidateStage(workers["validate"], dry_run=dry_run, verbose=verbose)
+    if "generate" in stages:
+        valid_cases = load_stage_config("validate", load_stage("validate"))["valid_cases"]
+        handlers["generate"] = GenerateStage(workers["generate"], valid_cases)
+    if "deploy" in stages:
+        # Deploy reads the generated services where stage 2 writes them, without setting stage 2 up
+        output_path = load_stage_config("generate", load_stage("generate"))["output_path"]
+        handlers["deploy"] = DeployStage(output_path, force=force)
+    return handlers
+
+def print_status(queue: JobQueue):
+    jobs = queue.jobs()
+    if not jobs:
+        print("📭 No jobs")
+        return
+    print(f"{'case':<30} {'stage':<10} {'state':<8} {'prio':>4} {'tries':>5}  last error")
+    for job in jobs:
+        print(f"{job.case_name:<30} {job.stage:<10} {job.state:<8} {job.priority:>4} {job.attempts:>5}  {job.last_error or ''}")
+    for stage, t in queue.stage_times().items():
+        print(f"⏱️ {stage}: {t['runs']} runs, {t['failed']} failed, {t['seconds']:.1f}s total, {t['mean']:.1f}s mean")
+
+def main():
+    DEBUG = 0
+
+    env_config = load_config_from_env(DEBUG)
+
+    parser = argparse.ArgumentParser(description="Run cases through validate → generate → deploy from a persistent job queue")
+    parser.add_argument("--db", default=env_config["db_path"], help="Job queue database")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    submit = commands.add_parser("submit", help="Queue cases")
+    submit.add_argument("cases", nargs="*", help="Case names in the stage 1 workspace")
+    submit.add_argument("--all", action="store_true", help="Queue every case in the stage 1 workspace")
+    submit.add_argument("--priority", type=int, default=0, help="Higher priorities are claimed first")
+    submit.add_argument("--stage", choices=STAGES, default=STAGES[0], help="Stage to start at")
+
+    run = commands.add_parser("run", help="Process queued jobs")
+    run.add_argument("--watch", action="store_true", help="Keep running and queue new workspace cases as they appear")
+    run.add_argument("--stop-after", choices=STAGES, default=env_config["stop_after"], help="Last stage to run")
+    for stage in STAGES:
+        run.add_argument(f"--{stage}-workers", type=int, default=env_config["workers"][stage], help=f"Concurrent {stage} jobs")
+        run.add_argument(f"--{stage}-retries", type=int, default=env_config["retries"][stage], help=f"Retries of a failed {stage} job")
+    run.add_argument("--backoff", type=float, default=env_config["backoff"], help="Seconds before the first retry; doubles per retry")
+    run.add_argument("--dry-run", action="store_true", help="Validate without calling the LLM (as stage 1 --dry-run)")
+    run.add_argument("--force", action="store_true", help="Deploy without consulting the deploy ledger")
+    run.add_argument("--trace", default=env_config["trace_path"], help="Write a Chrome trace of every stage's steps and a per-stage summary to this file")
+    run.add_argument("--verbose", action="store_true")
+
+    commands.add_parser("status", help="Show every job and the time spent per stage")
+
+    retry = commands.add_parser("retry", help="Requeue failed jobs at the stage they failed in")
+    retry.add_argument("cases", nargs="*", help="Case names (default: every failed job)")
+
+    args = parser.parse_args()
+
+    queue = JobQueue(Path(args.db))
+    try:
+        if args.command == "submit":
+            cases = args.cases
+            if args.all:
+                validate = load_stage("validate")
+                cases = cases + validate.list_cases(Path(load_stage_config("validate", validate)["workspace"]))
+            if not cases:
+                parser.error("give case names or --all")
+            for case_name in cases:
+                queue.submit(case_name, args.priority, args.stage)
+            print(f"📥 Queued {len(cases)} case(s) at {args.stage}")
+        elif args.command == "status":
+            print_status(queue)
+        elif args.command == "retry":
+            failed = [job for job in queue.jobs("failed") if not args.cases or job.case_name in args.cases]
+            for job in failed:
+                queue.submit(job.case_name, job.priority, job.stage)
+            print(f"🔁 Requeued {len(failed)} job(s)")
+        else:
+            if args.trace:
+                enable_tracing(args.trace)
+            stages = STAGES[:STAGES.index(args.stop_after) + 1]
+            workers = {stage: getattr(args, f"{stage}_workers") for stage in STAGES}
+            retries = {stage: getattr(args, f"{stage}_retries") for stage in STAGES}
+            handlers = create_handlers(stages, workers, dry_run=args.dry_run, verbose=args.verbose, force=args.force)
+            pipeline = Pipeline(queue, handlers, workers, retries, args.backoff, env_config["poll"], args.stop_after)
+            discover = handlers["validate"].cases if "validate" in handlers else None
+            started = time.perf_counter()
+            try:
+                pipeline.run(watch=args.watch, discover=discover)
+            finally:
+                for handler in handlers.values():
+                    handler.close()
+            print(f"⏱️ Pipeline finished in {time.perf_counter() - started:.1f}s")
+            print_status(queue)
+            if queue.jobs("failed"):
+                sys.exit(1)
+    finally:
+        queue.close()
+
+if __name__ == "__main__":
+    main()
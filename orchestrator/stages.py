@@ -0,0 +1,196 @@
+import argparse
+import asyncio
+import contextlib
+import importlib.util
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from types import ModuleType
+from typing import Dict
+
+from dotenv import dotenv_values
+
+ROOT = Path(__file__).resolve().parent.parent
+STAGE_DIRS = {
+    "validate": ROOT / "stage1-input_manager",
+    "generate": ROOT / "stage2-service_generator",
+    "deploy": ROOT / "stage3-deployer",
+}
+# Config keys holding paths; they are relative to the stage folder in its .env
+PATH_KEYS = {"workspace", "valid_cases", "source_path", "output_path", "service_path", "logs_path"}
+
+_load_lock = threading.Lock()
+
+def load_stage(stage: str) -> ModuleType:
+    """
+    Import a stage's agent.py as module '<stage>_agent'. Every stage has an
+    agent.py, so they cannot be imported by name; their own sibling modules
+    (utils, generation_manifest, ...) are found through the stage folder on sys.path.
+    """
+    name = f"{stage}_agent"
+    with _load_lock:
+        if name in sys.modules:
+            return sys.modules[name]
+        stage_dir = STAGE_DIRS[stage]
+        if str(stage_dir) not in sys.path:
+            sys.path.insert(0, str(stage_dir))
+        spec = importlib.util.spec_from_file_location(name, stage_dir / "agent.py")
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[name] = module
+        spec.loader.exec_module(module)
+        return module
+
+def enable_tracing(path: str):
+    """Trace every stage run by this process into one file (all stages use stage 1's tracing module)."""
+    load_stage("validate")
+    importlib.import_module("tracing").enable(path, "pipeline")
+
+@contextlib.contextmanager
+def stage_environment(stage: str):
+    """The stage's .env applied on top of os.environ (real environment variables win, as with load_dotenv)."""
+    added = []
+    for key, value in dotenv_values(STAGE_DIRS[stage] / ".env").items():
+        if key not in os.environ and value is not None:
+            os.environ[key] = value
+            added.append(key)
+    try:
+        yield
+    finally:
+        for key in added:
+            os.environ.pop(key, None)
+
+def load_stage_config(stage: str, module: ModuleType) -> dict:
+    """The stage's own load_config_from_env() defaults, read once, with paths resolved against the stage folder."""
+    with stage_environment(stage):
+        config = module.load_config_from_env(1)
+    for key, value in config.items():
+        if value and isinstance(value, str) and (key in PATH_KEYS or key.endswith("_path")):
+            config[key] = str((STAGE_DIRS[stage] / value).resolve())
+    return config
+
+@dataclass
+class StageOutcome:
+    ok: bool
+    detail: str = ""
+    retryable: bool = True
+
+class ValidateStage:
+    """
+    Stage 1: the validate → test → fix loop of one case, with the LLM client and
+    caches shared by all workers. overrides replace stage 1 CLI options (workspace,
+    venv_cache, ...); client replaces the OpenAI client.
+    """
+    def __init__(self, workers: int, dry_run: bool = False, verbose: bool = False, client=None, **overrides):
+        self.agent = load_stage("validate")
+        config = load_stage_config("validate", self.agent)
+        self.config = config
+        self.args = argparse.Namespace(
+            workspace=config["workspace"], valid_cases=config["valid_cases"],
+            max_attempts=config["max_attempts"], model=config["model"], temperature=config["temperature"],
+            venv_cache=config["venv_cache_path"], no_venv_cache=False,
+            wheelhouse=config["wheelhouse_path"], offline=config["wheelhouse_offline"],
+            llm_cache=config["llm_cache_path"], llm_cache_mode=config["llm_cache_mode"],
+            llm_concurrency=config["llm_concurrency"], llm_rps=config["llm_rps"],
+            blob_store=config["blob_store_path"], digest_tokens=config["digest_tokens"],
+            warm_pytest=config["pytest_workers"], speculative=config["speculative"],
+            concurrency=workers, dry_run=dry_run, verbose=verbose,
+        )
+        vars(self.args).update(overrides)
+        if client is not None or dry_run:
+            self.client = client
+        else:
+            with stage_environment("validate"):
+                self.client = self.agent.create_llm_client(self.args, config, pooled=True)
+        self.wheelhouse, self.venv_cache, self.blob_store, self.workers = self.agent.create_resources(self.args, config)
+
+    def cases(self):
+        return self.agent.list_cases(Path(self.args.workspace))
+
+    def report(self, case_name: str):
+        """Run one case; returns stage 1's CaseReport."""
+        return self.agent.process_case(case_name, self.args, self.client, self.venv_cache, self.wheelhouse,
+                                       log_prefix=f"[{case_name}] ", workers=self.workers, blob_store=self.blob_store)
+
+    def __call__(self, case_name: str) -> StageOutcome:
+        report = self.report(case_name)
+        # A case that exhausted its fix attempts or breaks the contract will not pass on a plain retry
+        return StageOutcome(report.outcome == "valid", report.detail or report.outcome, report.outcome == "error")
+
+    def close(self):
+        if self.client is not None:
+            self.client.close()
+        if self.workers is not None:
+            self.workers.close()
+
+class GenerateStage:
+    """Stage 2: generate the service of a validated case, sharing one template environment. overrides replace stage 2 CLI options."""
+    def __init__(self, workers: int, source_path: str, **overrides):
+        self.agent = load_stage("generate")
+        config = load_stage_config("generate", self.agent)
+        self.args = argparse.Namespace(
+            source_path=source_path, output_path=config["output_path"], image_tag="latest",
+            rabbitmq_network=config["rabbitmq_network"], routing_key=None,
+            wheelhouse=config["wheelhouse_path"], offline=config["wheelhouse_offline"],
+            message_format=config["message_format"], metrics_port=config["metrics_port"],
+            replicas=config["replicas"], shard_workers=config["shard_workers"],
+            consumer_prefetch=config["consumer_prefetch"], consumer_concurrency=config["consumer_concurrency"],
+            compile_bytecode=config["compile_bytecode"], docker_user=config["docker_user"], force=False,
+        )
+        vars(self.args).update(overrides)
+        self.env = self.agent.create_environment()
+        self.digests = self.agent.template_digests(self.env)
+        self.copy_pool = ThreadPoolExecutor(max(1, workers) * 2)
+        self.agent.generate_rabbitmq(self.env, self.args)
+
+    @property
+    def output_path(self) -> Path:
+        return Path(self.args.output_path)
+
+    def __call__(self, case_name: str) -> StageOutcome:
+        manifest = self.agent.generate_service(self.env, self.digests, case_name, self.args, self.copy_pool)
+        return StageOutcome(True, f"{manifest.written} written, {manifest.unchanged} unchanged")
+
+    def close(self):
+        self.copy_pool.shutdown()
+
+class DeployStage:
+    """Stage 3: deploy a generated service; the RabbitMQ stack is brought up once, before the first service."""
+    def __init__(self, output_path: Path, force: bool = False):
+        self.agent = load_stage("deploy")
+        config = load_stage_config("deploy", self.agent)
+        self.logs_path = config["logs_path"]
+        self.wheelhouse = config["wheelhouse_path"]
+        self.output_path = Path(output_path)
+        self.force = force
+        self.ledger = self.agent.DeployLedger(Path(config["ledger_path"]) if config["ledger_path"]
+                                              else Path(self.logs_path) / "deploy_ledger.json")
+        self._infra_lock = threading.Lock()
+        self._infra: Dict[str, bool] = {}
+
+    def _deploy(self, service_path: Path):
+        return asyncio.run(self.agent.deploy_service_async(
+            service_path, self.logs_path, self.wheelhouse, ledger=self.ledger, force=self.force))
+
+    def _ensure_infrastructure(self) -> bool:
+        with self._infra_lock:
+            for path in sorted(p for p in self.output_path.iterdir() if (p / "docker-compose.yml").is_file()
+                               and self.agent.deploy_tier(p) == self.agent.INFRA_TIER):
+                if not self._infra.get(path.name):
+                    self._infra[path.name] = self._deploy(path).ok
+                if not self._infra[path.name]:
+                    # Try again with the next service rather than giving up on the stack for good
+                    del self._infra[path.name]
+                    return False
+        return True
+
+    def __call__(self, case_name: str) -> StageOutcome:
+        if not self._ensure_infrastructure():
+            return StageOutcome(False, "infrastructure stack failed to deploy")
+        result = self._deploy(self.output_path / case_name)
+        return StageOutcome(result.ok, result.message or result.action or result.status)
+
+    def close(self):
+        pass
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# Stage modules import each other by bare name, as when run from the stage folder
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
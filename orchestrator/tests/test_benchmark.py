@@ -0,0 +1,52 @@
+import argparse
+import importlib
+import importlib.util
+import os
+import sys
+
+from stages import load_stage
+
+# Stage 2 has a benchmark.py too, so this one is loaded by path
+_spec = importlib.util.spec_from_file_location("pipeline_benchmark", os.path.join(os.path.dirname(__file__), "..", "benchmark.py"))
+benchmark = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(benchmark)
+
+
+def host_pytest_venv(folder, cache, wheelhouse):
+    """create_venv_and_install stand-in: a bin/pytest that runs this interpreter's pytest, so nothing is installed."""
+    venv_dir = folder / ".venv"
+    pytest = venv_dir / "bin" / "pytest"
+    pytest.parent.mkdir(parents=True, exist_ok=True)
+    pytest.write_text(f"#!{sys.executable}\nimport sys\nimport pytest\nsys.exit(pytest.console_main())\n")
+    pytest.chmod(0o755)
+    return venv_dir, str(venv_dir / "bin" / "pip")
+
+
+def test_benchmark_reports_a_two_case_corpus(tmp_path, monkeypatch):
+    agent = load_stage("validate")
+    corpus = importlib.import_module("corpus")
+    # No third-party packages, so no case needs an install (nor a missing_dependency bug)
+    monkeypatch.setattr(corpus, "PACKAGES", {})
+    monkeypatch.setattr(corpus, "DEFAULT_DEPENDENCY_SETS", [[]])
+    monkeypatch.setattr(agent, "create_venv_and_install", host_pytest_venv)
+    args = argparse.Namespace(
+        cases=2, seed=1, max_bugs=1, max_attempts=None, concurrency=2, speculative=1, warm_pytest=False,
+        llm_latency_ms=0, venv_cache=None, no_venv_cache=False, wheelhouse=None, offline=False, trace=None,
+    )
+
+    result = benchmark.run_scenario(args, tmp_path)
+
+    assert (result["cases"], result["green"], result["green_rate"]) == (2, 2, 1.0)
+    assert set(result["case_results"]) == {"case_000", "case_001"}
+    for case in result["case_results"].values():
+        assert set(case) == {"outcome", "attempts", "bugs", "seconds"}
+        assert case["outcome"] == "valid" and case["attempts"] == case["bugs"] + 1
+    assert result["attempts"] == sum(case["attempts"] for case in result["case_results"].values())
+    assert set(result["attempt_mean_seconds_by_number"]) <= {"1", "2"}
+    # At least a test request per case and a fix per bug
+    assert result["llm_calls"] >= 2 + sum(case["bugs"] for case in result["case_results"].values())
+    for key in ("validate_seconds", "generate_seconds", "total_seconds", "attempt_p95_seconds", "disk_output_mb"):
+        assert isinstance(result[key], float)
+    # Without --trace the run is only summarised, and tracing is off again
+    assert not importlib.import_module("tracing").enabled()
+    assert all((tmp_path / "output" / case / "docker-compose.yml").exists() for case in result["case_results"])
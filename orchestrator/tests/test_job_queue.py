@@ -0,0 +1,140 @@
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import pipeline
+from job_queue import JobQueue
+from stages import StageOutcome
+
+ORCHESTRATOR_DIR = Path(pipeline.__file__).resolve().parent
+
+
+def test_claim_fail_retry_recover(tmp_path):
+    queue = JobQueue(tmp_path / "jobs.db")
+    queue.submit("low")
+    queue.submit("high", priority=5)
+
+    job = queue.claim("validate")
+    assert (job.case_name, job.state) == ("high", "running")
+    assert queue.claim("generate") is None
+
+    # Retried after the backoff, then failed for good once the budget is spent
+    started = time.time()
+    assert queue.fail(job, started, "boom", retries=1, backoff=0.2)
+    assert queue.claim("validate").case_name == "low"
+    assert queue.claim("validate") is None
+    time.sleep(0.25)
+    job = queue.claim("validate")
+    assert (job.case_name, job.attempts) == ("high", 1)
+    assert not queue.fail(job, started, "boom again", retries=1, backoff=0.2)
+    assert [(j.case_name, j.state, j.last_error) for j in queue.jobs("failed")] == [("high", "failed", "boom again")]
+
+    # "low" is still running, as after a crash: recover() requeues it at the same stage
+    queue.close()
+    queue = JobQueue(tmp_path / "jobs.db")
+    assert queue.recover() == 1
+    job = queue.claim("validate")
+    assert job.case_name == "low"
+    queue.complete(job, time.time(), "generate")
+    assert queue.claim("generate").case_name == "low"
+    assert queue.stage_times()["validate"]["runs"] == 3
+    queue.close()
+
+
+def test_handlers_only_for_stages_run(monkeypatch):
+    built = []
+    for name in ("ValidateStage", "GenerateStage", "DeployStage"):
+        monkeypatch.setattr(pipeline, name, lambda *args, _name=name, **kwargs: built.append(_name) or _name)
+    workers = {"validate": 1, "generate": 1, "deploy": 1}
+
+    assert pipeline.create_handlers(["validate"], workers) == {"validate": "ValidateStage"}
+    assert built == ["ValidateStage"]
+    built.clear()
+    assert set(pipeline.create_handlers(["deploy"], workers)) == {"deploy"}
+    assert built == ["DeployStage"]
+
+
+def test_submit_leaves_a_running_job_alone(tmp_path):
+    queue = JobQueue(tmp_path / "jobs.db")
+    queue.submit("case")
+    job = queue.claim("validate")
+    queue.complete(job, time.time(), "generate")
+    job = queue.claim("generate")
+
+    queue.submit("case", priority=9)
+
+    [stored] = queue.jobs()
+    assert (stored.stage, stored.state, stored.priority) == ("generate", "running", 0)
+    queue.close()
+
+
+def test_backoff_gates_claim(tmp_path):
+    queue = JobQueue(tmp_path / "jobs.db")
+    queue.submit("flaky", priority=5)
+    queue.submit("steady")
+
+    job = queue.claim("validate")
+    before = time.time()
+    assert queue.fail(job, before, "boom", retries=3, backoff=60)
+    # The retried job waits out its backoff without holding up the rest
+    assert queue.claim("validate").case_name == "steady"
+    assert queue.claim("validate") is None
+    [flaky] = [j for j in queue.jobs() if j.case_name == "flaky"]
+    assert before + 60 <= flaky.available_at <= time.time() + 60
+
+    # Once available_at has passed the job is claimable, and the next backoff doubles
+    queue.conn.execute("UPDATE jobs SET available_at = 0 WHERE id = ?", (flaky.id,))
+    job = queue.claim("validate")
+    assert job.case_name == "flaky"
+    before = time.time()
+    assert queue.fail(job, before, "boom", retries=3, backoff=60)
+    assert queue.jobs("pending")[0].available_at >= before + 120
+    queue.close()
+
+
+# Runs one job until its generate stage, where the process is killed
+KILLED_RUN = """
+import os, signal, sys
+sys.path.insert(0, sys.argv[2])
+from job_queue import JobQueue
+from pipeline import Pipeline
+from stages import StageOutcome
+
+def validate(case_name):
+    with open(sys.argv[3], "a") as f:
+        f.write(f"validate {case_name}\\n")
+    return StageOutcome(True)
+
+def generate(case_name):
+    os.kill(os.getpid(), signal.SIGKILL)
+
+queue = JobQueue(sys.argv[1])
+queue.submit("case")
+handlers = {"validate": validate, "generate": generate, "deploy": validate}
+Pipeline(queue, handlers, {"validate": 1, "generate": 1, "deploy": 1}, {"validate": 0, "generate": 0, "deploy": 0},
+         poll=0.1).run()
+"""
+
+
+def test_killed_run_resumes_at_the_interrupted_stage(tmp_path):
+    db, calls = tmp_path / "jobs.db", tmp_path / "calls.log"
+    killed = subprocess.run([sys.executable, "-c", KILLED_RUN, str(db), str(ORCHESTRATOR_DIR), str(calls)])
+    assert killed.returncode == -9
+    queue = JobQueue(db)
+    [job] = queue.jobs()
+    assert (job.stage, job.state) == ("generate", "running")
+
+    ran = []
+
+    def handler(stage):
+        return lambda case_name: ran.append((stage, case_name)) or StageOutcome(True)
+    handlers = {stage: handler(stage) for stage in ("validate", "generate", "deploy")}
+    workers = {"validate": 1, "generate": 1, "deploy": 1}
+    pipeline.Pipeline(queue, handlers, workers, {"validate": 0, "generate": 0, "deploy": 0}, poll=0.1).run()
+
+    # Validation finished before the kill and is not repeated
+    assert calls.read_text().splitlines() == ["validate case"]
+    assert ran == [("generate", "case"), ("deploy", "case")]
+    assert [(j.stage, j.state) for j in queue.jobs()] == [("deploy", "done")]
+    queue.close()
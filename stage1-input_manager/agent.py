@@ -1,15 +1,31 @@
 
 #!/usr/bin/env python3
 import os
+import re
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
 from dotenv import load_dotenv
 from pathlib import Path
+from typing import List, Optional
 
-from prompts import TEST_GEN_SYSTEM, TEST_GEN_USER_TEMPLATE, FIX_CODE_SYSTEM, FIX_CODE_USER_TEMPLATE
+from prompts import (
+    TEST_GEN_SYSTEM, TEST_GEN_USER_TEMPLATE, FIX_CODE_SYSTEM, FIX_CODE_USER_TEMPLATE,
+    SPECULATIVE_FIX_SUFFIX,
+)
 from utils import (
-    copy_valid_version, ensure_dir, copy_tree, detect_current_version_folder,
+    copy_valid_version, export_valid_case, ensure_dir, copy_tree, detect_current_version_folder,
     create_venv_and_install, run_pytest, increment_version_folder,
-    TestResult, validate_script_contract,
+    TestResult, validate_script_contract, replace_text,
 )
+import tracing
+from blob_store import BlobStore
+from failure_digest import failure_digest
+from pytest_worker import PytestWorkerPool
+from venv_cache import VenvCache
+from wheelhouse import Wheelhouse
 
 def load_case_files(folder: Path):
     script = (folder / "script.py").read_text(encoding="utf-8")
@@ -21,12 +37,24 @@ def write_tests(version_folder: Path, tests_dict):
     for item in tests_dict.get("tests", []):
         path = version_folder / item["path"]
         ensure_dir(path.parent)
-        path.write_text(item["content"], encoding="utf-8")
+        replace_text(path, item["content"])
 
 def write_fixed_files(dest_folder: Path, fix_dict):
-    (dest_folder / "script.py").write_text(fix_dict["script_py"], encoding="utf-8")
-    (dest_folder / "requirements.txt").write_text(fix_dict["requirements_txt"], encoding="utf-8")
-    (dest_folder / "readme.md").write_text(fix_dict["readme_md"], encoding="utf-8")
+    replace_text(dest_folder / "script.py", fix_dict["script_py"])
+    replace_text(dest_folder / "requirements.txt", fix_dict["requirements_txt"])
+    replace_text(dest_folder / "readme.md", fix_dict["readme_md"])
+
+@dataclass
+class CaseReport:
+    case_name: str
+    outcome: str  # "valid", "failed", "invalid_contract" or "error"
+    attempts: int = 0
+    wall_time: float = 0.0
+    detail: str = ""
+
+def list_cases(workspace: Path) -> List[str]:
+    """Every folder under workspace that holds a script.py"""
+    return sorted(p.name for p in workspace.iterdir() if p.is_dir() and (p / "script.py").exists())
 
 def load_config_from_env(DEBUG):
     """Load configuration defaults from .env file"""
@@ -40,63 +68,157 @@ def load_config_from_env(DEBUG):
         "max_attempts": int(os.getenv("MAX_ATTEMPTS", "3")),
         "model": os.getenv("OPENAI_MODEL", "gpt-4o-mini"),
         "temperature": float(os.getenv("OPENAI_TEMPERATURE", 0.2)),
+        "venv_cache_path": os.getenv("VENV_CACHE_PATH"),
+        "venv_cache_max_entries": int(os.getenv("VENV_CACHE_MAX_ENTRIES", "20")),
+        "venv_cache_max_bytes": int(os.getenv("VENV_CACHE_MAX_BYTES", "0")),
+        "wheelhouse_path": os.getenv("WHEELHOUSE_PATH"),
+        "wheelhouse_offline": os.getenv("WHEELHOUSE_OFFLINE", "false").lower() == "true",
+        "concurrency": int(os.getenv("BATCH_CONCURRENCY", "4")),
+        "speculative": int(os.getenv("SPECULATIVE_FIXES", "1")),
+        "blob_store_path": os.getenv("BLOB_STORE_PATH"),
+        "digest_tokens": int(os.getenv("FAILURE_DIGEST_TOKENS", "1500")),
+        "pytest_workers": os.getenv("PYTEST_WORKERS", "false").lower() == "true",
+        "pytest_worker_max_runs": int(os.getenv("PYTEST_WORKER_MAX_RUNS", "50")),
+        "pytest_worker_max_rss_mb": float(os.getenv("PYTEST_WORKER_MAX_RSS_MB", "1024")),
+        "pytest_worker_max_idle": int(os.getenv("PYTEST_WORKER_MAX_IDLE", "4")),
+        "llm_cache_path": os.getenv("LLM_CACHE_PATH"),
+        "llm_cache_mode": os.getenv("LLM_CACHE_MODE", "cache"),
+        "llm_cache_ttl": float(os.getenv("LLM_CACHE_TTL", "0")),
+        "llm_cache_max_bytes": int(os.getenv("LLM_CACHE_MAX_BYTES", "0")),
+        "llm_concurrency": int(os.getenv("LLM_MAX_CONCURRENCY", "8")),
+        "llm_rps": float(os.getenv("LLM_REQUESTS_PER_SECOND", "0")),
+        "trace_path": os.getenv("TRACE_PATH"),
     }
 
-def main():
-    import argparse
+def request_fix_candidates(client, fix_prompt: str, n: int) -> List[dict]:
+    """Ask for n independent fixes at once; malformed or failed responses are dropped."""
+    prompts = [
+        (FIX_CODE_SYSTEM, fix_prompt + SPECULATIVE_FIX_SUFFIX.format(index=i + 1, total=n))
+        for i in range(n)
+    ]
+    if hasattr(client, "complete_json_batch"):
+        responses = client.complete_json_batch(prompts, return_exceptions=True)
+    else:
+        with ThreadPoolExecutor(max_workers=n) as pool:
+            futures = [pool.submit(client.complete_json, system, user) for system, user in prompts]
+            responses = [f.exception() or f.result() for f in futures]
+    required = ("script_py", "requirements_txt", "readme_md")
+    return [r for r in responses if isinstance(r, dict) and all(k in r for k in required)]
 
-    DEBUG = 0
+def _failure_count(result: TestResult) -> int:
+    counts = re.findall(r"(\d+) (?:failed|errors?)", result.raw_output)
+    return sum(int(c) for c in counts) if counts else 1_000_000
 
-    env_config = load_config_from_env(DEBUG)
+def run_fix_candidates(version_folder: Path, candidates: List[dict], venv_cache, wheelhouse, workers=None):
+    """
+    Materialize each candidate in its own sandbox next to the version folders,
+    run the current test files against all of them in parallel and cancel the
+    rest as soon as one passes.
+    Returns (winning folder or None, folder to continue from).
+    """
+    sandbox_root = version_folder.parent / "candidates" / version_folder.name
+    if sandbox_root.exists():
+        shutil.rmtree(sandbox_root)
 
-    parser = argparse.ArgumentParser(description="Input Manager Agent")
-    parser.add_argument("--case-name", required=True, help="Case name folder under workspace")
-    parser.add_argument("--workspace", default=env_config["workspace"], help="Workspace path")
-    parser.add_argument("--valid-cases", default=env_config["valid_cases"], help="Valid cases path")
-    parser.add_argument("--max-attempts", type=int, default=env_config["max_attempts"], help="Max iterations before giving up")
-    parser.add_argument("--model", default=env_config["model"], help="OpenAI model name")
-    parser.add_argument("--temperature", type=float, default=env_config["temperature"], help="OpenAI temperature")
-    parser.add_argument("--dry-run", action="store_true", help="Run without calling OpenAI")
-    parser.add_argument("--verbose", action="store_true")
+    folders = []
+    for i, fix_dict in enumerate(candidates):
+        folder = sandbox_root / f"{i + 1:02d}"
+        ensure_dir(folder)
+        write_fixed_files(folder, fix_dict)
+        for test_file in version_folder.glob("test_*.py"):
+            shutil.copy2(test_file, folder / test_file.name)
+        folders.append(folder)
 
-    args = parser.parse_args()
+    cancel = threading.Event()
+
+    def evaluate(folder: Path):
+        venv_dir, _ = create_venv_and_install(folder, venv_cache, wheelhouse)
+        if cancel.is_set():
+            return folder, None
+        return folder, run_pytest(folder, venv_dir, cancel, workers)
+
+    winner = None
+    results = []
+    with ThreadPoolExecutor(max_workers=len(folders)) as pool:
+        for future in as_completed([pool.submit(evaluate, f) for f in folders]):
+            folder, result = future.result()
+            if result is None or cancel.is_set():
+                continue
+            results.append((folder, result))
+            if result.success:
+                winner = folder
+                cancel.set()
+
+    if winner is not None:
+        return winner, winner
+    if results:
+        return None, min(results, key=lambda fr: _failure_count(fr[1]))[0]
+    return None, folders[0]
+
+def process_case(case_name: str, args, client, venv_cache: Optional[VenvCache], wheelhouse: Optional[Wheelhouse],
+                 log_prefix: str = "", workers: Optional[PytestWorkerPool] = None,
+                 blob_store: Optional[BlobStore] = None) -> CaseReport:
+    """Run the validate → test → fix loop for one case and report how it ended."""
+    started = time.perf_counter()
+    attempt_started = None  # perf_counter() at the start of the current attempt
+
+    def log(msg: str):
+        print(f"{log_prefix}{msg}")
+
+    def end_attempt():
+        if attempt_started is not None:
+            tracing.record("attempt", "validate", attempt_started, case=case_name, attempt=attempt)
+
+    def report(outcome: str, attempts: int, detail: str = "") -> CaseReport:
+        end_attempt()
+        tracing.record("case", "validate", started, case=case_name, outcome=outcome, attempts=attempts)
+        return CaseReport(case_name, outcome, attempts, time.perf_counter() - started, detail)
 
     workspace = Path(args.workspace).resolve()
     valid_cases = Path(args.valid_cases).resolve()
-    case_path = workspace / args.case_name
+    case_path = workspace / case_name
     ensure_dir(case_path)
     ensure_dir(valid_cases)
 
     # Validate script contract
     validation_result = validate_script_contract(case_path / "script.py")
     if not validation_result.has_correct_return_type:
-        print("❌ run() must return AsyncGenerator[ResultDto, None]")
-        return
+        log("❌ run() must return AsyncGenerator[ResultDto, None]")
+        return report("invalid_contract", 0, "run() must return AsyncGenerator[ResultDto, None]")
 
     if not validation_result.has_result_dto:
-        print("❌ script.py must define a dataclass named ResultDto")
-        return
+        log("❌ script.py must define a dataclass named ResultDto")
+        return report("invalid_contract", 0, "missing ResultDto dataclass")
 
     if not validation_result.has_run or not validation_result.run_is_async:
-        print("❌ script.py must define an async def run() function")
-        return
-    
-    if args.verbose:
-        print("✅ script.py contract validated: run() -> AsyncGenerator[ResultDto, None]")
+        log("❌ script.py must define an async def run() function")
+        return report("invalid_contract", 0, "missing async def run()")
 
-    # Lazy import to allow --dry-run without openai installed
-    client = None
-    if not args.dry_run:
-        from openai_client import OpenAIClient
-        client = OpenAIClient(model=args.model, temperature=args.temperature)
+    if not validation_result.has_valid_signature:
+        log("❌ run() may only take a single request argument, or optional resume_token and/or shard_index + shard_count arguments")
+        return report("invalid_contract", 0, "run() takes only request, or optional resume_token / shard_index + shard_count")
+
+    if args.verbose:
+        log("✅ script.py contract validated: run() -> AsyncGenerator[ResultDto, None]")
+        if validation_result.is_resumable:
+            log("✅ run(resume_token) is resumable: the service wrapper will checkpoint its position")
+        if validation_result.is_consumer:
+            log("✅ run(request) is a per-request transform: the service will be generated in consumer mode")
+        if validation_result.is_sharded:
+            log("✅ run(shard_index, shard_count) is sharded: the service wrapper can run one shard per process")
+    if validation_result.resumes_by_count:
+        log("⚠️ ResultDto has no resume_token field: the resume token is the number of results already delivered, "
+            "so run(resume_token) must skip exactly that many or resumed results are published twice")
 
     attempt = 0
     while attempt < args.max_attempts:
+        end_attempt()
         attempt += 1
+        attempt_started = time.perf_counter()
         # 1) detect current version (initialize if none)
         version_folder = detect_current_version_folder(case_path)
         if args.verbose:
-            print(f"[attempt {attempt}] Working folder: {version_folder}")
+            log(f"[attempt {attempt}] Working folder: {version_folder}")
 
         # 2) Generate tests
         script, reqs, readme = load_case_files(version_folder)
@@ -110,29 +232,59 @@ def main():
             write_tests(version_folder, tests_json)
 
         # 3) Create sandbox & install deps
-        venv_dir, pip = create_venv_and_install(version_folder)
+        venv_dir, pip = create_venv_and_install(version_folder, venv_cache, wheelhouse)
 
         # 4) Run tests
-        result: TestResult = run_pytest(version_folder, venv_dir)
+        result: TestResult = run_pytest(version_folder, venv_dir, workers=workers)
         if args.verbose:
-            print(result.raw_output[:2000])
+            log(result.raw_output[:2000])
+        if blob_store is not None:
+            blob_store.snapshot(version_folder)
 
         # 5) Evaluate
         if result.success:
             # copy to valid cases and exit success
-            dest = valid_cases / args.case_name
-            copy_valid_version(version_folder, dest)
+            dest = valid_cases / case_name
+            export_valid_case(version_folder, dest, blob_store)
 
             if args.verbose:
-                print(f"✅ Success. Copied validated case to: {dest}")
-                
-            return
+                log(f"✅ Success. Copied validated case to: {dest}")
+
+            return report("valid", attempt, str(dest))
 
         if attempt >= args.max_attempts:
-            print(f"❌ Max attempts reached ({args.max_attempts}). See {result.output_path}")
-            return
+            log(f"❌ Max attempts reached ({args.max_attempts}). See {result.output_path}")
+            return report("failed", attempt, str(result.output_path))
 
         # else, request a fix from OpenAI and advance version
+        if args.speculative > 1:
+            if args.dry_run:
+                candidates = [{"script_py": script, "requirements_txt": reqs, "readme_md": readme}] * args.speculative
+            else:
+                fix_prompt = FIX_CODE_USER_TEMPLATE.format(
+                    failures=failure_digest(result, args.digest_tokens),
+                    readme_content=readme,
+                    requirements_content=reqs,
+                    script_content=script
+                )
+                candidates = request_fix_candidates(client, fix_prompt, args.speculative)
+
+            if candidates:
+                winner, chosen = run_fix_candidates(version_folder, candidates, venv_cache, wheelhouse, workers)
+                next_version = increment_version_folder(version_folder)
+                copy_valid_version(chosen, next_version, blob_store)
+                shutil.rmtree(chosen.parent, ignore_errors=True)
+                if winner is not None:
+                    dest = valid_cases / case_name
+                    export_valid_case(next_version, dest, blob_store)
+                    if args.verbose:
+                        log(f"✅ Fix candidate {winner.name} passed. Copied validated case to: {dest}")
+                    return report("valid", attempt + 1, str(dest))
+                if args.verbose:
+                    log(f"→ No fix candidate passed; continuing from {chosen.name} as {next_version}")
+                continue
+            log("⚠️ No usable fix candidates returned; falling back to a single fix request")
+
         if args.dry_run:
             fix_dict = {
                 "script_py": script, 
@@ -141,7 +293,7 @@ def main():
             }
         else:
             fix_prompt = FIX_CODE_USER_TEMPLATE.format(
-                failures=result.raw_output,
+                failures=failure_digest(result, args.digest_tokens),
                 readme_content=readme,
                 requirements_content=reqs,
                 script_content=script
@@ -152,9 +304,147 @@ def main():
         ensure_dir(next_version)
         write_fixed_files(next_version, fix_dict)
         if args.verbose:
-            print(f"→ Wrote next version: {next_version}")
+            log(f"→ Wrote next version: {next_version}")
+
+    log("❌ Exiting without success.")
+    return report("failed", attempt)
+
+def run_batch(case_names: List[str], args, client, venv_cache, wheelhouse, workers=None,
+              blob_store=None) -> List[CaseReport]:
+    """
+    Process many cases on a pool of `args.concurrency` workers.
+    Venv builds and pytest already run as child processes and LLM calls are
+    network-bound, so threads are enough to keep all of them overlapping.
+    """
+    def work(case_name: str) -> CaseReport:
+        try:
+            return process_case(case_name, args, client, venv_cache, wheelhouse,
+                                log_prefix=f"[{case_name}] ", workers=workers, blob_store=blob_store)
+        except Exception as e:
+            return CaseReport(case_name, "error", detail=f"{type(e).__name__}: {e}")
+
+    with ThreadPoolExecutor(max_workers=max(1, args.concurrency)) as pool:
+        return list(pool.map(work, case_names))
+
+def print_summary(reports: List[CaseReport], wall_time: float):
+    width = max([len(r.case_name) for r in reports] + [4])
+    print(f"\n{'case':<{width}}  {'outcome':<16}  {'attempts':>8}  {'wall(s)':>8}  detail")
+    for r in reports:
+        print(f"{r.case_name:<{width}}  {r.outcome:<16}  {r.attempts:>8}  {r.wall_time:>8.1f}  {r.detail}")
+    valid = sum(1 for r in reports if r.outcome == "valid")
+    print(f"\n{valid}/{len(reports)} cases valid in {wall_time:.1f}s")
+
+def create_llm_client(args, env_config, pooled: bool):
+    """OpenAI client with the response cache; pooled clients share one connection pool and rate limit across workers."""
+    # Lazy import to allow --dry-run without openai installed
+    from openai_client import OpenAIClient, PooledOpenAIClient
+    from llm_cache import ResponseCache
+    llm_cache = None
+    if args.llm_cache and args.llm_cache_mode != "off":
+        llm_cache = ResponseCache(
+            Path(args.llm_cache),
+            ttl_seconds=env_config["llm_cache_ttl"],
+            max_bytes=env_config["llm_cache_max_bytes"],
+        )
+    if not pooled:
+        return OpenAIClient(model=args.model, temperature=args.temperature,
+                            cache=llm_cache, cache_mode=args.llm_cache_mode)
+    # Batch workers share one async connection pool and one global rate limit
+    return PooledOpenAIClient(model=args.model, temperature=args.temperature,
+                              cache=llm_cache, cache_mode=args.llm_cache_mode,
+                              max_concurrency=args.llm_concurrency,
+                              requests_per_second=args.llm_rps)
+
+def create_resources(args, env_config):
+    """Shared wheelhouse, venv cache, blob store and warm pytest workers (each None when disabled)."""
+    wheelhouse = None
+    if args.wheelhouse:
+        wheelhouse = Wheelhouse(Path(args.wheelhouse), offline=args.offline)
+
+    venv_cache = None
+    if args.venv_cache and not args.no_venv_cache:
+        venv_cache = VenvCache(
+            Path(args.venv_cache),
+            max_entries=env_config["venv_cache_max_entries"],
+            max_bytes=env_config["venv_cache_max_bytes"],
+            wheelhouse=wheelhouse,
+        )
+
+    blob_store = BlobStore(Path(args.blob_store)) if args.blob_store else None
+
+    workers = None
+    if args.warm_pytest:
+        workers = PytestWorkerPool(
+            venv_cache,
+            max_runs=env_config["pytest_worker_max_runs"],
+            max_rss_mb=env_config["pytest_worker_max_rss_mb"],
+            max_idle=env_config["pytest_worker_max_idle"],
+        )
+    return wheelhouse, venv_cache, blob_store, workers
+
+def main():
+    import argparse
+
+    DEBUG = 0
+
+    env_config = load_config_from_env(DEBUG)
+
+    parser = argparse.ArgumentParser(description="Input Manager Agent")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--case-name", help="Case name folder under workspace")
+    target.add_argument("--cases", nargs="+", help="Several case names to process as a batch")
+    target.add_argument("--all", action="store_true", help="Process every case under workspace as a batch")
+    parser.add_argument("--concurrency", type=int, default=env_config["concurrency"], help="Cases processed at once in batch mode")
+    parser.add_argument("--speculative", type=int, default=env_config["speculative"], help="Fix candidates requested and tested in parallel per round (1 = off)")
+    parser.add_argument("--workspace", default=env_config["workspace"], help="Workspace path")
+    parser.add_argument("--valid-cases", default=env_config["valid_cases"], help="Valid cases path")
+    parser.add_argument("--max-attempts", type=int, default=env_config["max_attempts"], help="Max iterations before giving up")
+    parser.add_argument("--model", default=env_config["model"], help="OpenAI model name")
+    parser.add_argument("--temperature", type=float, default=env_config["temperature"], help="OpenAI temperature")
+    parser.add_argument("--venv-cache", default=env_config["venv_cache_path"], help="Shared venv cache path")
+    parser.add_argument("--no-venv-cache", action="store_true", help="Build a fresh venv in every version folder")
+    parser.add_argument("--wheelhouse", default=env_config["wheelhouse_path"], help="Shared wheelhouse path")
+    parser.add_argument("--offline", action="store_true", default=env_config["wheelhouse_offline"], help="Install only from the wheelhouse")
+    parser.add_argument("--llm-cache", default=env_config["llm_cache_path"], help="LLM response cache path")
+    parser.add_argument("--llm-cache-mode", choices=["off", "cache", "record", "replay"], default=env_config["llm_cache_mode"],
+                        help="cache: reuse identical requests, record: refresh recordings, replay: never call the API")
+    parser.add_argument("--llm-concurrency", type=int, default=env_config["llm_concurrency"], help="Max LLM requests in flight (batch mode)")
+    parser.add_argument("--llm-rps", type=float, default=env_config["llm_rps"], help="Max LLM requests per second, 0 = unlimited (batch mode)")
+    parser.add_argument("--blob-store", default=env_config["blob_store_path"], help="Content-addressed store for version folder files")
+    parser.add_argument("--digest-tokens", type=int, default=env_config["digest_tokens"], help="Token budget for the failure digest sent with fix requests")
+    parser.add_argument("--warm-pytest", action=argparse.BooleanOptionalAction, default=env_config["pytest_workers"],
+                        help="Run tests in long-lived pytest workers per dependency set")
+    parser.add_argument("--trace", default=env_config["trace_path"], help="Write a Chrome trace of every step and a per-stage summary to this file")
+    parser.add_argument("--dry-run", action="store_true", help="Run without calling OpenAI")
+    parser.add_argument("--verbose", action="store_true")
+
+    args = parser.parse_args()
+    if args.trace:
+        tracing.enable(args.trace, "validate")
+
+    client = None if args.dry_run else create_llm_client(args, env_config, pooled=not args.case_name)
+    wheelhouse, venv_cache, blob_store, workers = create_resources(args, env_config)
+
+    if args.case_name:
+        try:
+            process_case(args.case_name, args, client, venv_cache, wheelhouse, workers=workers, blob_store=blob_store)
+        finally:
+            if client is not None:
+                client.close()
+            if workers is not None:
+                workers.close()
+        return
 
-    print("❌ Exiting without success.")
+    case_names = args.cases if args.cases else list_cases(Path(args.workspace).resolve())
+    started = time.perf_counter()
+    try:
+        reports = run_batch(case_names, args, client, venv_cache, wheelhouse, workers, blob_store)
+    finally:
+        if client is not None:
+            client.close()
+        if workers is not None:
+            workers.close()
+    print_summary(reports, time.perf_counter() - started)
 
 if __name__ == "__main__":
     main()
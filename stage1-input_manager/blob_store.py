@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+import hashlib
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Set
+
+MANIFEST_FILE = ".manifest.json"
+TRACKED_FILES = ("script.py", "requirements.txt", "readme.md")
+
+# Linux FICLONE ioctl: copy-on-write clone on btrfs/xfs
+FICLONE = 0x40049409
+# gc() leaves a put()'s temp file alone while its process lives, and this long after its last link change
+TMP_GRACE_SECONDS = 3600
+
+def file_digest(path: Path) -> str:
+    """SHA-256 of a file's content (also used by the stage 2 generation manifest and stage 3 fingerprints)."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def _reflink(src: Path, dst: Path) -> bool:
+    try:
+        import fcntl
+    except ImportError:
+        return False
+    try:
+        with open(src, "rb") as s, open(dst, "wb") as d:
+            fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+        return True
+    except OSError:
+        dst.unlink(missing_ok=True)
+        return False
+
+def link_file(src: Path, dst: Path):
+    """
+    Zero-copy file export: reflink where the filesystem supports it, otherwise a
+    hardlink, otherwise a plain copy. Hardlinked files share content, so writers
+    must replace files (see utils.replace_text) rather than edit them in place.
+    """
+    src, dst = Path(src), Path(dst)
+    if dst.exists() or dst.is_symlink():
+        dst.unlink()
+    if _reflink(src, dst):
+        return
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+def tracked_files(folder: Path) -> List[Path]:
+    files = [folder / name for name in TRACKED_FILES if (folder / name).is_file()]
+    files += sorted(p for p in folder.glob("test_*.py") if p.is_file())
+    return files
+
+def load_manifest(folder: Path) -> Dict[str, str]:
+    return json.loads((folder / MANIFEST_FILE).read_text(encoding="utf-8"))["files"]
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def _stale_tmp(path: Path) -> bool:
+    """True for a temp file (<name>.<pid>.tmp) whose writer is gone or that is older than TMP_GRACE_SECONDS."""
+    pid = path.name.rsplit(".", 2)[-2]
+    if pid.isdigit() and not _pid_alive(int(pid)):
+        return True
+    try:
+        # ctime, not mtime: put() hardlinks the source file, which keeps the source's mtime
+        return time.time() - path.stat().st_ctime > TMP_GRACE_SECONDS
+    except FileNotFoundError:
+        return False
+
+def dehydrate(folder: Path) -> bool:
+    """Reduce a snapshotted version folder to its manifest; BlobStore.checkout() brings the files back."""
+    if not (folder / MANIFEST_FILE).is_file():
+        return False
+    for p in folder.iterdir():
+        if p.name == MANIFEST_FILE:
+            continue
+        if p.is_dir() and not p.is_symlink():
+            shutil.rmtree(p, ignore_errors=True)
+        else:
+            p.unlink(missing_ok=True)
+    return True
+
+class BlobStore:
+    """
+    Content-addressed storage for version folder files.
+
+    <root>/objects/<sha[:2]>/<sha>  one object per distinct file content
+
+    snapshot() hashes a version folder's tracked files, stores each content once
+    and turns the files into hardlinks of their object, then records the
+    mapping in <version>/.manifest.json. Identical files across versions and
+    cases therefore share a single inode on disk.
+    """
+    def __init__(self, root: Path):
+        self.root = Path(root).resolve()
+        self.objects = self.root / "objects"
+        self.objects.mkdir(parents=True, exist_ok=True)
+
+    def object_path(self, digest: str) -> Path:
+        return self.objects / digest[:2] / digest
+
+    def put(self, path: Path) -> str:
+        """Store path's content and make path a hardlink of the stored object."""
+        digest = file_digest(path)
+        obj = self.object_path(digest)
+        obj.parent.mkdir(parents=True, exist_ok=True)
+        tmp = obj.with_name(f"{digest}.{os.getpid()}.tmp")
+        if not obj.exists():
+            try:
+                os.link(path, tmp)
+            except OSError:
+                shutil.copy2(path, tmp)
+            os.replace(tmp, obj)
+            return digest
+        try:
+            if os.path.samefile(path, obj):
+                return digest
+            tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+            os.link(obj, tmp)
+            os.replace(tmp, path)
+        except OSError:
+            # Different filesystem: keep the private copy, content is still recorded
+            pass
+        return digest
+
+    def snapshot(self, folder: Path) -> Dict[str, str]:
+        files = {p.relative_to(folder).as_posix(): self.put(p) for p in tracked_files(folder)}
+        (folder / MANIFEST_FILE).write_text(json.dumps({"files": files}, indent=2), encoding="utf-8")
+        return files
+
+    def materialize(self, manifest: Dict[str, str], dest: Path):
+        """Recreate the files of a manifest under dest as links to their objects."""
+        dest.mkdir(parents=True, exist_ok=True)
+        for rel, digest in manifest.items():
+            target = dest / rel
+            target.parent.mkdir(parents=True, exist_ok=True)
+            link_file(self.object_path(digest), target)
+
+    def checkout(self, folder: Path) -> Dict[str, str]:
+        """Materialize the files of a (dehydrated) version folder from its manifest."""
+        manifest = load_manifest(folder)
+        self.materialize(manifest, folder)
+        return manifest
+
+    def gc(self, workspace: Path) -> List[str]:
+        """Delete objects no manifest under workspace refers to, and abandoned temp files. Returns removed names."""
+        referenced = referenced_digests(workspace)
+        removed = []
+        for obj in self.objects.glob("*/*"):
+            if obj.name.endswith(".tmp") and not _stale_tmp(obj):
+                continue
+            if obj.name.endswith(".tmp") or obj.name not in referenced:
+                obj.unlink(missing_ok=True)
+                removed.append(obj.name)
+        return removed
+
+def referenced_digests(workspace: Path) -> Set[str]:
+    digests = set()
+    for manifest in Path(workspace).glob(f"**/{MANIFEST_FILE}"):
+        try:
+            digests.update(load_manifest(manifest.parent).values())
+        except (OSError, ValueError, KeyError):
+            continue
+    return digests
+
+def version_folders(case_path: Path) -> List[Path]:
+    return sorted((p for p in case_path.iterdir() if p.is_dir() and p.name.isdigit()), key=lambda p: int(p.name))
+
+def collect_garbage(workspace: Path, keep_versions: int = 0, drop_venvs: bool = True,
+                    cases: Iterable[Path] = None, keep_manifests: bool = False) -> Dict[str, int]:
+    """
+    Remove what the self-healing loop no longer needs:
+    - .venv folders of every version but the latest (they are rebuilt or cloned on demand)
+    - leftover speculative candidate sandboxes
+    - superseded version folders beyond the newest keep_versions (0 = keep all); with
+      keep_manifests, snapshotted ones are dehydrated to their manifest instead
+    """
+    stats = {"venvs": 0, "versions": 0, "dehydrated": 0, "candidates": 0}
+    cases = cases if cases is not None else [p for p in Path(workspace).iterdir() if (p / "script.py").exists()]
+    for case_path in cases:
+        versions = version_folders(case_path)
+        if drop_venvs:
+            for v in versions[:-1]:
+                if (v / ".venv").exists():
+                    shutil.rmtree(v / ".venv", ignore_errors=True)
+                    stats["venvs"] += 1
+        if keep_versions:
+            for v in versions[:-keep_versions]:
+                if keep_manifests and dehydrate(v):
+                    stats["dehydrated"] += 1
+                    continue
+                shutil.rmtree(v, ignore_errors=True)
+                stats["versions"] += 1
+        if (case_path / "candidates").exists():
+            shutil.rmtree(case_path / "candidates", ignore_errors=True)
+            stats["candidates"] += 1
+    return stats
+
+def main():
+    import argparse
+    from dotenv import load_dotenv
+
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Garbage-collect the workspace and its blob store")
+    parser.add_argument("--workspace", default=os.getenv("WORKSPACE_PATH"), help="Workspace path")
+    parser.add_argument("--blob-store", default=os.getenv("BLOB_STORE_PATH"), help="Blob store path")
+    sub = parser.add_subparsers(dest="command", required=True)
+    gc = sub.add_parser("gc", help="Drop stale venvs, superseded versions and unreferenced blobs")
+    gc.add_argument("--keep-versions", type=int, default=0, help="Newest version folders kept per case (0 = all)")
+    gc.add_argument("--keep-venvs", action="store_true", help="Keep .venv folders of older versions")
+    gc.add_argument("--keep-manifests", action="store_true",
+                    help="Reduce superseded versions to their manifest instead of deleting them (see checkout)")
+    checkout = sub.add_parser("checkout", help="Materialize the files of version folders from their manifests")
+    checkout.add_argument("folders", nargs="+", help="Version folders, e.g. <workspace>/<case>/002")
+    sub.add_parser("stats", help="Show blob store size")
+
+    args = parser.parse_args()
+    if not args.workspace:
+        parser.error("--workspace or WORKSPACE_PATH is required")
+    workspace = Path(args.workspace).resolve()
+
+    if args.command == "gc":
+        if args.keep_manifests and not args.blob_store:
+            parser.error("--keep-manifests needs --blob-store or BLOB_STORE_PATH")
+        stats = collect_garbage(workspace, args.keep_versions, drop_venvs=not args.keep_venvs,
+                                keep_manifests=args.keep_manifests)
+        removed = BlobStore(Path(args.blob_store)).gc(workspace) if args.blob_store else []
+        print(f"Removed {stats['venvs']} venvs, {stats['versions']} versions, "
+              f"{stats['candidates']} candidate sandboxes, {len(removed)} blobs; "
+              f"dehydrated {stats['dehydrated']} versions")
+    elif args.command == "checkout":
+        if not args.blob_store:
+            parser.error("--blob-store or BLOB_STORE_PATH is required")
+        store = BlobStore(Path(args.blob_store))
+        for folder in args.folders:
+            files = store.checkout(Path(folder))
+            print(f"Checked out {len(files)} files into {folder}")
+    elif args.command == "stats":
+        if not args.blob_store:
+            parser.error("--blob-store or BLOB_STORE_PATH is required")
+        store = BlobStore(Path(args.blob_store))
+        objects = list(store.objects.glob("*/*"))
+        total = sum(p.stat().st_size for p in objects)
+        print(f"{len(objects)} blobs, {total} bytes, {len(referenced_digests(workspace))} referenced")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+import re
+import xml.etree.ElementTree as ET
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import List, Optional
+
+# Rough chars-per-token ratio for code and tracebacks; good enough for budgeting
+CHARS_PER_TOKEN = 4
+
+ADDRESS_RE = re.compile(r"0x[0-9a-fA-F]+")
+LOCATION_RE = re.compile(r"^(?P<file>[^\s:][^:]*?):(?P<line>\d+):(?: .*)?$")
+
+@dataclass
+class TestFailure:
+    test_id: str
+    kind: str  # "failed" or "error"
+    message: str
+    frames: List[str]
+    also: List[str] = field(default_factory=list)
+
+@dataclass
+class TestSummary:
+    total: int = 0
+    failed: int = 0
+    errors: int = 0
+    skipped: int = 0
+    failures: List[TestFailure] = field(default_factory=list)
+
+    @property
+    def passed(self) -> int:
+        return self.total - self.failed - self.errors - self.skipped
+
+def parse_junit(report_path: Path) -> Optional[TestSummary]:
+    """Read a pytest --junitxml report into a TestSummary (None if missing or unreadable)."""
+    try:
+        root = ET.parse(report_path).getroot()
+    except (OSError, ET.ParseError):
+        return None
+
+    summary = TestSummary()
+    for case in root.iter("testcase"):
+        summary.total += 1
+        test_id = "::".join(p for p in (case.get("classname", ""), case.get("name", "")) if p)
+        for tag, kind in (("failure", "failed"), ("error", "error")):
+            node = case.find(tag)
+            if node is None:
+                continue
+            if kind == "failed":
+                summary.failed += 1
+            else:
+                summary.errors += 1
+            message = (node.get("message") or "").strip()
+            summary.failures.append(TestFailure(test_id, kind, message, relevant_frames(node.text or "")))
+            break
+        else:
+            if case.find("skipped") is not None:
+                summary.skipped += 1
+    return summary
+
+def _is_case_file(path: str) -> bool:
+    name = Path(path).name
+    return name == "script.py" or name == "conftest.py" or (name.startswith("test_") and name.endswith(".py"))
+
+def relevant_frames(traceback_text: str) -> List[str]:
+    """
+    Reduce a pytest long traceback to the frames from script.py and the test
+    files: the failing source line ('>'), its 'E' lines and the location line.
+    Library frames are collapsed into a single marker line.
+    """
+    kept: List[str] = []
+    block: List[str] = []
+    skipped = 0
+
+    def flush(location: Optional[str]):
+        nonlocal skipped
+        if location is None or _is_case_file(LOCATION_RE.match(location).group("file")):
+            if skipped:
+                kept.append(f"... {skipped} library frame(s) omitted")
+                skipped = 0
+            source = [l for l in block if l.startswith(">")][-1:]
+            errors = [l for l in block if l.startswith("E ")]
+            kept.extend(source + errors + ([location] if location else []))
+        else:
+            skipped += 1
+
+    for line in traceback_text.splitlines():
+        if LOCATION_RE.match(line):
+            flush(line)
+            block = []
+        elif line.strip() and not set(line.strip()) <= {"_", " "}:
+            block.append(line)
+    if block:
+        flush(None)
+    elif skipped:
+        kept.append(f"... {skipped} library frame(s) omitted")
+    return kept
+
+def _signature(failure: TestFailure):
+    # Same frames (ignoring the test function itself) and same error → same root cause
+    errors = [ADDRESS_RE.sub("0x?", l) for l in failure.frames if l.startswith("E ")][:1]
+    locations = [l for l in failure.frames if LOCATION_RE.match(l) and Path(l.split(":")[0]).name == "script.py"]
+    return tuple(locations) + tuple(errors) if locations or errors else (failure.test_id,)
+
+def deduplicate(failures: List[TestFailure]) -> List[TestFailure]:
+    groups = {}
+    for f in failures:
+        sig = _signature(f)
+        if sig in groups:
+            groups[sig].also.append(f.test_id)
+        else:
+            groups[sig] = f
+    return list(groups.values())
+
+def build_failure_digest(summary: TestSummary, token_budget: int = 1500) -> str:
+    """Render deduplicated failures in test order, within token_budget."""
+    budget = token_budget * CHARS_PER_TOKEN
+    header = f"{summary.failed} failed, {summary.errors} errors, {summary.passed} passed, {summary.skipped} skipped"
+    parts = [header]
+    used = len(header)
+
+    groups = deduplicate(summary.failures)
+    for i, f in enumerate(groups):
+        lines = [f"\n## {f.test_id} [{f.kind}]"]
+        if f.message:
+            lines.append(f.message.splitlines()[0][:300])
+        lines.extend(f.frames)
+        if f.also:
+            shown = ", ".join(f.also[:10]) + (f" and {len(f.also) - 10} more" if len(f.also) > 10 else "")
+            lines.append(f"(same failure in: {shown})")
+        section = "\n".join(lines)
+
+        if used + len(section) > budget:
+            remaining = budget - used
+            omitted = len(groups) - i
+            if remaining > 200:
+                parts.append(section[:remaining - 20] + "\n... (truncated)")
+                omitted -= 1
+            if omitted:
+                parts.append(f"\n... {omitted} more distinct failure(s) omitted")
+            break
+        parts.append(section)
+        used += len(section)
+    return "\n".join(parts)
+
+def failure_digest(result, token_budget: int = 1500) -> str:
+    """Digest for a TestResult; falls back to the tail of the raw output without a usable report."""
+    summary = parse_junit(result.report_path) if result.report_path else None
+    if summary is None or not summary.failures:
+        return result.raw_output[-token_budget * CHARS_PER_TOKEN:]
+    return build_failure_digest(summary, token_budget)
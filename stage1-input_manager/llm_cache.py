@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+CACHE_MODES = ("off", "cache", "record", "replay")
+
+class CacheMiss(RuntimeError):
+    """Raised in replay mode when a request has no recorded response."""
+
+def request_key(model: str, temperature: float, system_prompt: str, user_prompt: str) -> str:
+    payload = json.dumps(
+        {"model": model, "temperature": temperature, "system": system_prompt, "user": user_prompt},
+        sort_keys=True, ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class ResponseCache:
+    """
+    On-disk cache of parsed LLM responses keyed by request_key().
+    Entries live in <root>/<key[:2]>/<key>.json. Entries older than ttl_seconds
+    are ignored (0 = never expire); once the store exceeds max_bytes the oldest
+    entries are evicted first.
+    """
+    def __init__(self, root: Path, ttl_seconds: float = 0, max_bytes: int = 0):
+        self.root = Path(root).resolve()
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def _path(self, key: str) -> Path:
+        return self.root / key[:2] / f"{key}.json"
+
+    def get(self, key: str, ignore_ttl: bool = False) -> Optional[Dict[str, Any]]:
+        path = self._path(key)
+        try:
+            entry = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+        if not ignore_ttl and self.ttl_seconds and time.time() - entry.get("created_at", 0) > self.ttl_seconds:
+            return None
+        return entry.get("response")
+
+    def put(self, key: str, request: Dict[str, Any], response: Dict[str, Any]):
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        entry = {"created_at": time.time(), "request": request, "response": response}
+        tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_text(json.dumps(entry, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, path)
+        if self.max_bytes:
+            self.evict()
+
+    def evict(self, max_bytes: Optional[int] = None) -> List[str]:
+        """Remove oldest entries until the store fits in max_bytes. Returns removed keys."""
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        removed = []
+        with self._lock:
+            files = [(p.stat().st_mtime, p.stat().st_size, p) for p in self.root.glob("*/*.json")]
+            total = sum(size for _, size, _ in files)
+            for _, size, p in sorted(files):
+                if not max_bytes or total <= max_bytes:
+                    break
+                p.unlink(missing_ok=True)
+                total -= size
+                removed.append(p.stem)
+        return removed
+
+    def purge_expired(self) -> List[str]:
+        removed = []
+        if not self.ttl_seconds:
+            return removed
+        now = time.time()
+        for p in self.root.glob("*/*.json"):
+            if now - p.stat().st_mtime > self.ttl_seconds:
+                p.unlink(missing_ok=True)
+                removed.append(p.stem)
+        return removed
+
+def main():
+    import argparse
+    from dotenv import load_dotenv
+
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Inspect and prune the LLM response cache")
+    parser.add_argument("--cache-path", default=os.getenv("LLM_CACHE_PATH"), help="LLM cache path")
+    parser.add_argument("--ttl", type=float, default=float(os.getenv("LLM_CACHE_TTL", "0")), help="Entry lifetime in seconds (0 = never expire)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("stats", help="Show entry count and size")
+    prune = sub.add_parser("prune", help="Drop expired entries and evict down to --max-bytes")
+    prune.add_argument("--max-bytes", type=int, default=int(os.getenv("LLM_CACHE_MAX_BYTES", "0")), help="0 = unlimited")
+
+    args = parser.parse_args()
+    if not args.cache_path:
+        parser.error("--cache-path or LLM_CACHE_PATH is required")
+
+    cache = ResponseCache(Path(args.cache_path), ttl_seconds=args.ttl)
+
+    if args.command == "stats":
+        files = list(cache.root.glob("*/*.json"))
+        total = sum(p.stat().st_size for p in files)
+        print(f"{len(files)} entries, {total} bytes in {cache.root}")
+    elif args.command == "prune":
+        removed = cache.purge_expired() + cache.evict(args.max_bytes)
+        print(f"Removed {len(removed)} entries")
+
+if __name__ == "__main__":
+    main()
@@ -1,40 +1,101 @@
 
 import os, json
-from typing import Dict, Any, Optional
-from openai import OpenAI
+import asyncio
+import random
+import threading
+import time
+from typing import Dict, Any, List, Optional, Tuple
+
+import tracing
+from llm_cache import CACHE_MODES, CacheMiss, ResponseCache, request_key
 
 class OpenAIClient:
     """
     Thin wrapper to call Chat Completions with system+user prompts and get text back.
-    Expects OPENAI_API_KEY in env.
+    Expects OPENAI_API_KEY in env (not needed in replay mode).
+
+    cache_mode (only used when a cache is given):
+      cache  - serve identical requests from the cache, call the API on a miss
+      record - always call the API and overwrite the cached response
+      replay - serve only from the cache; a miss raises CacheMiss
     """
-    def __init__(self, model: str = "gpt-4o-mini", temperature: float = 0.2):
+    def __init__(self, model: str = "gpt-4o-mini", temperature: float = 0.2,
+                 cache: Optional[ResponseCache] = None, cache_mode: str = "cache"):
+        if cache_mode not in CACHE_MODES:
+            raise ValueError(f"cache_mode must be one of {CACHE_MODES}")
         self.model = model
         self.temperature = temperature
+        self.cache = cache if cache_mode != "off" else None
+        self.cache_mode = cache_mode
+        self.client = None
+        if self.cache is not None and cache_mode == "replay":
+            return
         api_key = os.getenv("OPENAI_API_KEY")
         if not api_key:
             raise RuntimeError("OPENAI_API_KEY env var is required for non --dry-run mode.")
-        self.client = OpenAI(api_key=api_key)
+        self.client = self._connect(api_key)
+
+    def _connect(self, api_key: str):
+        from openai import OpenAI
+        return OpenAI(api_key=api_key)
 
     def complete_json(self, system_prompt: str, user_prompt: str, response_format: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """
         Returns dict parsed from model output. Assumes the model returns JSON in the message content.
         """
-        resp = self.client.chat.completions.create(
-            model=self.model,
-            temperature=self.temperature,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt},
-            ]
-        )
-        text = resp.choices[0].message.content
+        with tracing.span("complete_json", "validate", prompt_chars=len(system_prompt) + len(user_prompt)) as s:
+            key, cached = self._lookup(system_prompt, user_prompt)
+            s["cached"] = cached is not None
+            if cached is not None:
+                return cached
+
+            resp = self.client.chat.completions.create(
+                model=self.model,
+                temperature=self.temperature,
+                messages=self._messages(system_prompt, user_prompt)
+            )
+            content = resp.choices[0].message.content
+            s["response_chars"] = len(content or "")
+            return self._parse_and_store(key, content, system_prompt, user_prompt)
+
+    def close(self):
+        """Release the HTTP connection pool."""
+        if self.client is not None:
+            self.client.close()
+
+    @staticmethod
+    def _messages(system_prompt: str, user_prompt: str):
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt},
+        ]
+
+    def _lookup(self, system_prompt: str, user_prompt: str):
+        """Return (cache key, cached response); both None when caching is disabled."""
+        if self.cache is None:
+            return None, None
+        key = request_key(self.model, self.temperature, system_prompt, user_prompt)
+        if self.cache_mode in ("cache", "replay"):
+            cached = self.cache.get(key, ignore_ttl=self.cache_mode == "replay")
+            if cached is not None:
+                return key, cached
+        if self.cache_mode == "replay":
+            raise CacheMiss(f"No recorded response for request {key[:12]}")
+        return key, None
+
+    def _parse_and_store(self, key: Optional[str], text: str, system_prompt: str, user_prompt: str) -> Dict[str, Any]:
         json_str = self._extract_json(text)
         try:
-            return json.loads(json_str)
+            result = json.loads(json_str)
         except Exception:
             cleaned = json_str.strip().strip("`")
-            return json.loads(cleaned)
+            result = json.loads(cleaned)
+
+        if key is not None:
+            request = {"model": self.model, "temperature": self.temperature,
+                       "system": system_prompt, "user": user_prompt}
+            self.cache.put(key, request, result)
+        return result
 
     @staticmethod
     def _extract_json(text: str) -> str:
@@ -46,3 +107,145 @@ class OpenAIClient:
         if fence:
             return fence.group(1)
         return text
+
+class TokenBucket:
+    """
+    Async token bucket: `rate` requests per second with bursts up to `capacity`.
+    penalize() pushes every waiter back, used when the API answers 429.
+    """
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    await asyncio.sleep(self.blocked_until - now)
+                    continue
+                if self.rate <= 0:
+                    # Unlimited, but a 429 still holds everyone back until blocked_until
+                    return
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def penalize(self, seconds: float):
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+        self.tokens = 0
+
+class AsyncOpenAIClient(OpenAIClient):
+    """
+    asyncio variant of OpenAIClient. One AsyncOpenAI instance (one HTTP connection
+    pool) is shared by every request; at most `max_concurrency` requests are in
+    flight and `requests_per_second` (0 = unlimited) is enforced by a token bucket.
+    Rate limits, timeouts and 5xx answers are retried with exponential backoff.
+    Shares the response cache and cache modes of OpenAIClient.
+    """
+    def __init__(self, model: str = "gpt-4o-mini", temperature: float = 0.2,
+                 cache: Optional[ResponseCache] = None, cache_mode: str = "cache",
+                 max_concurrency: int = 8, requests_per_second: float = 0,
+                 max_retries: int = 5, base_url: Optional[str] = None, timeout: float = 120.0):
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.base_url = base_url
+        self.timeout = timeout
+        self.bucket = TokenBucket(requests_per_second)
+        self._semaphore = None
+        super().__init__(model, temperature, cache, cache_mode)
+
+    def _connect(self, api_key: str):
+        from openai import AsyncOpenAI
+        # Retries are handled here so they also go through the rate limiter
+        return AsyncOpenAI(api_key=api_key, base_url=self.base_url, timeout=self.timeout, max_retries=0)
+
+    async def complete_json(self, system_prompt: str, user_prompt: str, response_format: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        # Requests overlap on the event loop thread, hence concurrent
+        with tracing.span("complete_json", "validate", concurrent=True,
+                          prompt_chars=len(system_prompt) + len(user_prompt)) as s:
+            key, cached = self._lookup(system_prompt, user_prompt)
+            s["cached"] = cached is not None
+            if cached is not None:
+                return cached
+
+            import openai
+            if self._semaphore is None:
+                self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+            attempt = 0
+            while True:
+                try:
+                    # Slot first, then token: a token taken while queueing for a slot would be
+                    # spent late, letting queued requests burst past the rate limit
+                    async with self._semaphore:
+                        await self.bucket.acquire()
+                        resp = await self.client.chat.completions.create(
+                            model=self.model,
+                            temperature=self.temperature,
+                            messages=self._messages(system_prompt, user_prompt)
+                        )
+                    break
+                except (openai.RateLimitError, openai.APITimeoutError,
+                        openai.APIConnectionError, openai.InternalServerError) as e:
+                    attempt += 1
+                    s["retries"] = attempt
+                    if attempt > self.max_retries:
+                        raise
+                    delay = min(60.0, 2 ** attempt) * (0.5 + random.random() / 2)
+                    if isinstance(e, openai.RateLimitError):
+                        self.bucket.penalize(delay)
+                    await asyncio.sleep(delay)
+
+            content = resp.choices[0].message.content
+            s["response_chars"] = len(content or "")
+            return self._parse_and_store(key, content, system_prompt, user_prompt)
+
+    async def complete_json_batch(self, prompts: List[Tuple[str, str]],
+                                  return_exceptions: bool = False) -> List[Any]:
+        """Send many (system_prompt, user_prompt) pairs concurrently; results keep the input order."""
+        return await asyncio.gather(
+            *(self.complete_json(system, user) for system, user in prompts),
+            return_exceptions=return_exceptions,
+        )
+
+    async def aclose(self):
+        if self.client is not None:
+            await self.client.close()
+
+class PooledOpenAIClient:
+    """
+    Blocking facade over AsyncOpenAIClient for threaded callers (batch mode).
+    The async client lives on a private event loop thread, so every caller
+    shares its connection pool, concurrency limit and rate limit.
+    """
+    def __init__(self, **kwargs):
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="llm-pool", daemon=True)
+        self._thread.start()
+        self.client = self._call(self._create(kwargs))
+
+    @staticmethod
+    async def _create(kwargs):
+        return AsyncOpenAIClient(**kwargs)
+
+    def _call(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    def complete_json(self, system_prompt: str, user_prompt: str, response_format: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        return self._call(self.client.complete_json(system_prompt, user_prompt, response_format))
+
+    def complete_json_batch(self, prompts: List[Tuple[str, str]], return_exceptions: bool = False) -> List[Any]:
+        return self._call(self.client.complete_json_batch(prompts, return_exceptions))
+
+    def close(self):
+        self._call(self.client.aclose())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
@@ -31,6 +31,7 @@ Constraints:
 - When testing `run()`, use `pytest.mark.asyncio` and iterate results with:
     async for item in run():
         ...
+  If `run()` takes a `request` argument, call it with representative requests instead (`run(request)`), building them with `RequestDto` when script.py defines it.
 - Assert that each yielded item is an instance of ResultDto and check its fields for correctness.
 
 ---
@@ -70,7 +71,7 @@ Return STRICT JSON with this schema:
 }}
 
 Rules:
-- Preserve the required function signature: `async def run() -> AsyncGenerator[ResultDto, None]:`.
+- Preserve the required function signature: `async def run() -> AsyncGenerator[ResultDto, None]:`. If `run()` takes a `request` argument or optional `resume_token` / `shard_index`/`shard_count` arguments, keep them and keep their behavior.
 - Ensure that `run()` yields only instances of ResultDto (never raw dicts, strings, or other types).
 - If `run()` produces no output, it must exit gracefully without raising.
 - Avoid adding heavy dependencies unnecessarily.
@@ -92,3 +93,10 @@ Rules:
 # CURRENT script.py
 {script_content}
 """
+
+SPECULATIVE_FIX_SUFFIX = """\
+
+---
+This is candidate {index} of {total} independent fix attempts requested in parallel.
+Propose your own best fix; it does not need to match the other candidates.
+"""
@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""
+Warm pytest workers.
+
+The server half of this module runs *inside a case venv* (`<venv>/bin/python
+pytest_worker.py`), so it may only import the standard library at module level.
+It keeps third-party modules imported between runs and only drops modules that
+live in the version folder being tested (script.py, test files, conftest).
+
+Protocol: one JSON object per line on stdin ({"cwd", "args"}), one JSON object
+per line back ({"exit_code", "output", "recycle"}) on a private copy of stdout.
+"""
+import contextlib
+import io
+import json
+import os
+import queue
+import re
+import subprocess
+import sys
+import threading
+import traceback
+from collections import OrderedDict
+from pathlib import Path
+
+WORKER_SCRIPT = Path(__file__).resolve()
+
+def _rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def _purge_modules(folder: str):
+    """Forget modules loaded from folder so the next run re-imports fresh copies."""
+    prefix = os.path.realpath(folder) + os.sep
+    for name, module in list(sys.modules.items()):
+        path = getattr(module, "__file__", None)
+        if path and os.path.realpath(path).startswith(prefix):
+            del sys.modules[name]
+
+def _preload(distributions):
+    """Import the top-level modules of the given distributions so later runs start warm."""
+    from importlib import import_module, metadata
+    # pytest plugins are left to pytest itself so its assertion rewriting still applies
+    wanted = {re.sub(r"[-_.]+", "-", d).lower() for d in distributions if not d.lower().startswith("pytest")}
+    for module, dists in metadata.packages_distributions().items():
+        if module.startswith("_") or not any(re.sub(r"[-_.]+", "-", d).lower() in wanted for d in dists):
+            continue
+        try:
+            import_module(module)
+        except Exception:
+            pass
+
+def _run_once(cwd: str, args):
+    import pytest
+
+    saved_path = list(sys.path)
+    saved_cwd = os.getcwd()
+    buf = io.StringIO()
+    _purge_modules(cwd)
+    os.chdir(cwd)
+    try:
+        with contextlib.redirect_stdout(buf), contextlib.redirect_stderr(buf):
+            # Plugins stay imported across runs, so pytest cannot re-rewrite them
+            code = pytest.main([*args, "-W", "ignore::pytest.PytestAssertRewriteWarning"])
+    except BaseException:
+        buf.write(traceback.format_exc())
+        code = 3
+    finally:
+        os.chdir(saved_cwd)
+        sys.path[:] = saved_path
+        _purge_modules(cwd)
+    return int(code), buf.getvalue()
+
+def serve(max_runs: int, max_rss_mb: float, preload):
+    # Keep a private channel for the protocol; anything else written to fd 1
+    # (stray prints outside pytest's capture) goes to /dev/null.
+    proto = os.fdopen(os.dup(1), "w", buffering=1)
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, 1)
+    # The agent's own modules (utils, prompts, ...) must not shadow the case's
+    sys.path[:] = [p for p in sys.path if os.path.realpath(p or ".") != str(WORKER_SCRIPT.parent)]
+
+    import pytest  # noqa: F401  (warm import)
+    _preload(preload)
+
+    runs = 0
+    for line in sys.stdin:
+        request = json.loads(line)
+        exit_code, output = _run_once(request["cwd"], request["args"])
+        runs += 1
+        recycle = runs >= max_runs or (max_rss_mb and _rss_mb() > max_rss_mb)
+        proto.write(json.dumps({"exit_code": exit_code, "output": output, "recycle": bool(recycle)}) + "\n")
+        if recycle:
+            break
+
+class PytestWorker:
+    """One long-lived pytest process bound to a venv python."""
+    def __init__(self, python: Path, max_runs: int = 50, max_rss_mb: float = 1024, preload=()):
+        self.python = Path(python)
+        self.proc = subprocess.Popen(
+            [str(self.python), str(WORKER_SCRIPT), "--serve",
+             "--max-runs", str(max_runs), "--max-rss-mb", str(max_rss_mb),
+             "--preload", ",".join(preload)],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            text=True, bufsize=1,
+        )
+        self.alive = True
+        self._replies = queue.Queue()
+        threading.Thread(target=self._read_replies, daemon=True).start()
+
+    def _read_replies(self):
+        for line in self.proc.stdout:
+            self._replies.put(line)
+        self._replies.put(None)
+
+    def run(self, cwd: Path, args, timeout: float = 600.0, cancel: threading.Event = None):
+        """Returns (exit_code, output), or None if the worker died, timed out or was cancelled."""
+        try:
+            self.proc.stdin.write(json.dumps({"cwd": str(cwd), "args": list(args)}) + "\n")
+            self.proc.stdin.flush()
+        except OSError:
+            self.close()
+            return None
+
+        waited = 0.0
+        while True:
+            try:
+                line = self._replies.get(timeout=0.2)
+                break
+            except queue.Empty:
+                waited += 0.2
+                if waited >= timeout or (cancel is not None and cancel.is_set()):
+                    self.close()
+                    return None
+        if line is None:
+            self.close()
+            return None
+        reply = json.loads(line)
+        if reply["recycle"]:
+            self.close()
+        return reply["exit_code"], reply["output"]
+
+    def close(self):
+        self.alive = False
+        if self.proc.poll() is None:
+            self.proc.kill()
+        self.proc.wait()
+
+class PytestWorkerPool:
+    """
+    Idle warm workers grouped by dependency set.
+    With a VenvCache the workers run on the cached store venv for the folder's
+    requirements, so every version folder with the same requirements shares
+    them; otherwise each venv gets its own workers.
+
+    When a case moves on to a venv no other case uses, the idle workers of its
+    previous one are closed, and at most max_idle workers are kept idle in
+    total (least recently used go first).
+    """
+    def __init__(self, venv_cache=None, max_runs: int = 50, max_rss_mb: float = 1024, timeout: float = 600.0,
+                 max_idle: int = 4):
+        self.venv_cache = venv_cache
+        self.max_runs = max_runs
+        self.max_rss_mb = max_rss_mb
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self._idle = OrderedDict()  # interpreter -> idle workers, least recently used first
+        self._case_keys = {}        # case folder -> interpreter of its latest run
+        self._lock = threading.Lock()
+
+    def _python_for(self, version_path: Path, venv_dir: Path):
+        req = version_path / "requirements.txt"
+        text = req.read_text(encoding="utf-8") if req.exists() else ""
+        if self.venv_cache is not None:
+            from venv_cache import META_FILE, requirements_key
+            entry = self.venv_cache.root / requirements_key(text)
+            if (entry / META_FILE).exists():
+                return entry / ("Scripts/python.exe" if os.name == "nt" else "bin/python"), text
+        return venv_dir / ("Scripts/python.exe" if os.name == "nt" else "bin/python"), text
+
+    def run(self, version_path: Path, venv_dir: Path, args, cancel: threading.Event = None):
+        """Returns (exit_code, output), or None when no worker could complete the run."""
+        python, req_text = self._python_for(version_path, venv_dir)
+        key = str(python)
+        with self._lock:
+            stale = self._retarget(str(Path(version_path).resolve().parent), key)
+            idle = self._idle.setdefault(key, [])
+            self._idle.move_to_end(key)
+            worker = idle.pop() if idle else None
+        for w in stale:
+            w.close()
+        if worker is None or not worker.alive or not python.exists():
+            if worker is not None:
+                worker.close()
+            preload = [m.group(0) for m in (re.match(r"[A-Za-z0-9][A-Za-z0-9._-]*", line.strip())
+                                            for line in req_text.splitlines()) if m]
+            worker = PytestWorker(python, self.max_runs, self.max_rss_mb, preload)
+
+        reply = worker.run(version_path, args, self.timeout, cancel)
+        stale = []
+        if worker.alive:
+            with self._lock:
+                self._idle.setdefault(key, []).append(worker)
+                self._idle.move_to_end(key)
+                stale = self._trim()
+        for w in stale:
+            w.close()
+        return reply
+
+    def _retarget(self, case: str, key: str):
+        """Point case at key; returns the idle workers of its previous key once no case uses that key (lock held)."""
+        previous = self._case_keys.get(case)
+        self._case_keys[case] = key
+        if previous is None or previous == key or previous in self._case_keys.values():
+            return []
+        return self._idle.pop(previous, [])
+
+    def _trim(self):
+        """Remove least recently used idle workers beyond max_idle and return them (lock held)."""
+        stale = []
+        while sum(len(idle) for idle in self._idle.values()) > max(0, self.max_idle):
+            key, idle = next(iter(self._idle.items()))
+            stale.append(idle.pop(0))
+            if not idle:
+                del self._idle[key]
+        return stale
+
+    def close(self):
+        with self._lock:
+            workers = [w for idle in self._idle.values() for w in idle]
+            self._idle.clear()
+        for w in workers:
+            w.close()
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Warm pytest worker (runs inside a case venv)")
+    parser.add_argument("--serve", action="store_true", required=True)
+    parser.add_argument("--max-runs", type=int, default=50)
+    parser.add_argument("--max-rss-mb", type=float, default=1024)
+    parser.add_argument("--preload", default="")
+    args = parser.parse_args()
+    serve(args.max_runs, args.max_rss_mb, [d for d in args.preload.split(",") if d])
@@ -0,0 +1,13 @@
+import importlib.util
+import sys
+from pathlib import Path
+
+# Stage modules import each other by bare name, as when run from the stage folder
+STAGE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(STAGE_DIR))
+
+# Every stage has an agent.py: load this one as 'validate_agent', the name orchestrator/stages.py gives it
+if "validate_agent" not in sys.modules:
+    spec = importlib.util.spec_from_file_location("validate_agent", STAGE_DIR / "agent.py")
+    sys.modules["validate_agent"] = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(sys.modules["validate_agent"])
@@ -0,0 +1,61 @@
+import argparse
+import threading
+import time
+
+import validate_agent
+import utils
+
+SCRIPT = """
+from dataclasses import dataclass
+from typing import AsyncGenerator
+
+@dataclass
+class ResultDto:
+    n: int
+
+async def run() -> AsyncGenerator[ResultDto, None]:
+    yield ResultDto(1)
+"""
+
+def make_args(tmp_path, **overrides):
+    args = dict(workspace=str(tmp_path / "ws"), valid_cases=str(tmp_path / "valid"), max_attempts=2, speculative=1,
+                digest_tokens=1000, concurrency=2, dry_run=True, verbose=False)
+    return argparse.Namespace(**{**args, **overrides})
+
+def make_case(tmp_path, name, script=SCRIPT):
+    case = tmp_path / "ws" / name
+    case.mkdir(parents=True)
+    (case / "script.py").write_text(script, encoding="utf-8")
+    return case
+
+def test_batch_runs_cases_concurrently_and_reports_each(tmp_path, monkeypatch):
+    for name in ("a", "b", "c", "broken"):
+        make_case(tmp_path, name)
+    make_case(tmp_path, "no_dto", "async def run():\n    yield 1\n")
+    lock = threading.Lock()
+    running, peak = [0], [0]
+
+    def fake_pytest(folder, venv_dir, cancel=None, workers=None):
+        if folder.parent.name == "broken":
+            raise RuntimeError("pytest crashed")
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.2)
+        with lock:
+            running[0] -= 1
+        return utils.TestResult(success=True, output_path=folder / "test_output.txt", raw_output="1 passed")
+
+    monkeypatch.setattr(validate_agent, "create_venv_and_install", lambda folder, cache, wheelhouse: (folder / ".venv", "pip"))
+    monkeypatch.setattr(validate_agent, "run_pytest", fake_pytest)
+    names = validate_agent.list_cases(tmp_path / "ws")
+
+    reports = validate_agent.run_batch(names, make_args(tmp_path), None, None, None)
+
+    # One report per case, in the order given, whatever order they finished in
+    assert [(r.case_name, r.outcome) for r in reports] == [
+        ("a", "valid"), ("b", "valid"), ("broken", "error"), ("c", "valid"), ("no_dto", "invalid_contract")]
+    assert reports[2].detail == "RuntimeError: pytest crashed"
+    assert all(r.attempts == 1 for r in reports if r.outcome == "valid")
+    assert peak[0] == 2
+    assert sorted(p.name for p in (tmp_path / "valid").iterdir()) == ["a", "b", "c"]
@@ -0,0 +1,71 @@
+import os
+import subprocess
+
+from blob_store import MANIFEST_FILE, BlobStore, collect_garbage
+from utils import copy_valid_version, replace_text, stored_files
+
+def make_versions(workspace, count):
+    case = workspace / "case"
+    case.mkdir(parents=True)
+    (case / "script.py").write_text("v0")
+    for n in range(1, count + 1):
+        version = case / f"{n:03d}"
+        (version / ".venv").mkdir(parents=True)
+        (version / "script.py").write_text(f"v{n}")
+        (version / "readme.md").write_text("shared")
+        (version / "test_output.txt").write_text("log")
+    return case
+
+def test_gc_keeps_temp_files_of_live_writers(tmp_path):
+    case = make_versions(tmp_path / "ws", 1)
+    store = BlobStore(tmp_path / "store")
+    digest = store.snapshot(case / "001")["script.py"]
+    obj = store.object_path(digest)
+    live = obj.with_name(f"{digest}.{os.getpid()}.tmp")
+    os.link(obj, live)
+    exited = subprocess.Popen(["true"])
+    exited.wait()
+    abandoned = obj.with_name(f"{digest}.{exited.pid}.tmp")
+    os.link(obj, abandoned)
+
+    removed = store.gc(tmp_path / "ws")
+
+    assert removed == [abandoned.name]
+    assert live.exists() and obj.exists()
+
+def test_dehydrated_versions_check_out_from_their_manifest(tmp_path):
+    workspace = tmp_path / "ws"
+    case = make_versions(workspace, 3)
+    store = BlobStore(tmp_path / "store")
+    for version in ("001", "002", "003"):
+        store.snapshot(case / version)
+
+    stats = collect_garbage(workspace, keep_versions=1, keep_manifests=True)
+
+    assert stats["dehydrated"] == 2
+    assert [p.name for p in (case / "001").iterdir()] == [MANIFEST_FILE]
+    # Dehydrated versions still reference their blobs
+    assert store.gc(workspace) == []
+    store.checkout(case / "001")
+    assert (case / "001" / "script.py").read_text() == "v1"
+    assert os.path.samefile(case / "001" / "readme.md", case / "003" / "readme.md")
+
+def test_export_links_only_files_held_by_the_store(tmp_path):
+    case = make_versions(tmp_path / "ws", 1)
+    version = case / "001"
+
+    copy_valid_version(version, tmp_path / "plain")
+    for name in ("script.py", "readme.md"):
+        assert not os.path.samefile(version / name, tmp_path / "plain" / name)
+
+    store = BlobStore(tmp_path / "store")
+    store.snapshot(version)
+    # Rewritten after the snapshot: no longer the store's object, so it must be copied
+    replace_text(version / "script.py", "v1 fixed")
+    assert stored_files(version, store) == {"readme.md"}
+    assert stored_files(version, None) == set()
+
+    copy_valid_version(version, tmp_path / "linked", store)
+    assert not os.path.samefile(version / "script.py", tmp_path / "linked" / "script.py")
+    assert (tmp_path / "linked" / "script.py").read_text() == "v1 fixed"
+    assert (tmp_path / "linked" / "readme.md").read_text() == "shared"
@@ -0,0 +1,139 @@
+import textwrap
+
+import pytest
+
+from utils import extract_result_schema, validate_script_contract
+
+RESULT_DTO = """
+from dataclasses import dataclass
+from typing import AsyncGenerator, Optional
+
+@dataclass
+class ResultDto:
+    n: int
+"""
+
+def check(tmp_path, signature, result_dto=RESULT_DTO):
+    script = tmp_path / "script.py"
+    script.write_text(textwrap.dedent(result_dto) + textwrap.dedent(f"""
+        async def run({signature}) -> AsyncGenerator[ResultDto, None]:
+            yield ResultDto(1)
+    """), encoding="utf-8")
+    return validate_script_contract(str(script))
+
+def test_bare_run_is_valid(tmp_path):
+    result = check(tmp_path, "")
+    assert result.has_valid_signature and result.has_correct_return_type
+    assert not (result.is_resumable or result.is_sharded or result.is_consumer)
+
+@pytest.mark.parametrize("signature", [
+    "resume_token: Optional[str] = None",
+    "*, resume_token: Optional[str] = None",
+])
+def test_resume_token_with_default_is_resumable(tmp_path, signature):
+    result = check(tmp_path, signature)
+    assert result.has_valid_signature and result.is_resumable
+    # ResultDto has no resume_token field, so the token counts delivered results
+    assert result.resumes_by_count
+
+def test_resume_token_field_is_used_as_the_token(tmp_path):
+    result_dto = RESULT_DTO + "    resume_token: Optional[str] = None\n"
+    result = check(tmp_path, "resume_token: Optional[str] = None", result_dto)
+    assert result.is_resumable and not result.resumes_by_count
+
+@pytest.mark.parametrize("signature", [
+    "resume_token",                               # no default: run() is no longer callable bare
+    "*, resume_token",
+    "resume_token=None, resume_token2=None",      # unknown parameter
+    "resume_token=None, **kwargs",
+    "*args",
+])
+def test_rejected_resumable_signatures(tmp_path, signature):
+    result = check(tmp_path, signature)
+    assert not result.has_valid_signature and not result.is_resumable
+
+def test_result_schema_from_dataclass(tmp_path):
+    script = tmp_path / "script.py"
+    script.write_text(textwrap.dedent("""
+        from dataclasses import dataclass, field
+        from datetime import datetime
+        from typing import ClassVar, List, Optional, Union
+
+        @dataclass
+        class ResultDto:
+            VERSION: ClassVar[int] = 1
+            id: int
+            at: datetime
+            tags: List[str] = field(default_factory=list)
+            score: Optional[float] = None
+            note: str | None = None
+            value: Union[int, str] = 0
+
+        async def run():
+            yield ResultDto(1, datetime.now())
+    """), encoding="utf-8")
+
+    schema = extract_result_schema(str(script))
+
+    fields = {f["name"]: (f["kind"], f["nullable"], f["required"]) for f in schema["fields"]}
+    assert list(fields) == ["id", "at", "tags", "score", "note", "value"]
+    assert fields == {
+        "id": ("integer", False, True),
+        "at": ("datetime", False, True),
+        "tags": ("array", False, False),
+        "score": ("number", True, False),
+        "note": ("string", True, False),
+        "value": ("any", False, False),
+    }
+    assert schema["run_params"] == [] and "request" not in schema
+
+def test_no_result_schema_without_result_dto(tmp_path):
+    script = tmp_path / "script.py"
+    script.write_text("async def run():\n    yield 1\n", encoding="utf-8")
+    assert extract_result_schema(str(script)) is None
+
+@pytest.mark.parametrize("signature", [
+    "shard_index: int = 0, shard_count: int = 1",
+    "*, shard_count: int = 1, shard_index: int = 0",
+    "resume_token: Optional[str] = None, shard_index: int = 0, shard_count: int = 1",
+])
+def test_shard_pair_with_defaults_is_sharded(tmp_path, signature):
+    result = check(tmp_path, signature)
+    assert result.has_valid_signature and result.is_sharded
+    assert result.is_resumable == ("resume_token" in signature)
+
+@pytest.mark.parametrize("signature", [
+    "shard_index: int = 0",                       # half of the pair
+    "shard_count: int = 1",
+    "shard_index: int, shard_count: int",         # no defaults
+    "shard_index: int, shard_count: int = 1",
+    "*, shard_index: int = 0, shard_count: int",
+])
+def test_rejected_shard_signatures(tmp_path, signature):
+    result = check(tmp_path, signature)
+    assert not result.has_valid_signature and not result.is_sharded
+
+def test_request_signature_is_consumer_mode(tmp_path):
+    result_dto = RESULT_DTO + """
+@dataclass
+class RequestDto:
+    n: int
+    label: Optional[str] = None
+"""
+    result = check(tmp_path, "request: RequestDto", result_dto)
+    assert result.has_valid_signature and result.is_consumer
+    assert not (result.is_resumable or result.is_sharded)
+
+    schema = extract_result_schema(str(tmp_path / "script.py"))
+    assert schema["run_params"] == ["request"]
+    assert [(f["name"], f["kind"], f["required"]) for f in schema["request"]["fields"]] == [
+        ("n", "integer", True), ("label", "string", False)]
+
+@pytest.mark.parametrize("signature", [
+    "request, resume_token=None",                 # a request is not resumable
+    "request, shard_index=0, shard_count=1",      # nor sharded
+    "request, *args",
+])
+def test_rejected_request_signatures(tmp_path, signature):
+    result = check(tmp_path, signature)
+    assert not result.has_valid_signature and not result.is_consumer
@@ -0,0 +1,67 @@
+import subprocess
+import sys
+import textwrap
+
+from failure_digest import build_failure_digest, parse_junit
+
+SCRIPT = """
+import json
+
+def load(text):
+    return json.loads(text)
+"""
+
+TESTS = """
+import pytest
+from script import load
+
+@pytest.fixture
+def broken():
+    raise RuntimeError("fixture broke")
+
+def test_ok():
+    assert load("1") == 1
+
+def test_bad_a():
+    load("{")
+
+def test_bad_b():
+    load("{")
+
+def test_error(broken):
+    pass
+
+@pytest.mark.skip
+def test_skipped():
+    pass
+"""
+
+def test_junit_report_to_digest(tmp_path):
+    (tmp_path / "script.py").write_text(SCRIPT)
+    (tmp_path / "test_script.py").write_text(textwrap.dedent(TESTS))
+    report = tmp_path / "report.xml"
+    subprocess.run([sys.executable, "-m", "pytest", "-q", "-p", "no:cacheprovider", f"--junitxml={report}"],
+                   cwd=tmp_path, capture_output=True)
+
+    summary = parse_junit(report)
+    assert (summary.total, summary.passed, summary.failed, summary.errors, summary.skipped) == (5, 1, 2, 1, 1)
+    bad_a = next(f for f in summary.failures if f.test_id.endswith("test_bad_a"))
+    # json's own frames collapse into one marker; the script and test frames stay
+    assert any(l.startswith("... ") and "library frame(s) omitted" in l for l in bad_a.frames)
+    assert any(l.startswith("script.py:5:") for l in bad_a.frames)
+    assert "JSONDecodeError" in bad_a.message
+
+    digest = build_failure_digest(summary)
+    assert digest.splitlines()[0] == "2 failed, 1 errors, 1 passed, 1 skipped"
+    # Both test_bad_* hit the same line of script.py with the same error
+    assert digest.count("## ") == 2
+    assert "(same failure in: test_script::test_bad_b)" in digest
+    assert "fixture broke" in digest
+
+    tiny = build_failure_digest(summary, token_budget=20)
+    assert len(tiny) <= 20 * 4 + 60 and "omitted" in tiny
+
+def test_unreadable_report(tmp_path):
+    assert parse_junit(tmp_path / "missing.xml") is None
+    (tmp_path / "bad.xml").write_text("<testsuite")
+    assert parse_junit(tmp_path / "bad.xml") is None
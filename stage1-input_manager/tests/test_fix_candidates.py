@@ -0,0 +1,102 @@
+import time
+
+import pytest
+
+import utils
+import validate_agent
+from test_batch import SCRIPT, make_args, make_case
+
+def candidate(script):
+    return {"script_py": script, "requirements_txt": "", "readme_md": ""}
+
+def fake_pytest(outcomes):
+    """run_pytest stand-in; outcomes maps a folder to "pass", "fail N" or "slow" (runs until cancelled)."""
+    cancelled = []
+
+    def run(folder, venv_dir, cancel=None, workers=None):
+        outcome = outcomes(folder)
+        if outcome == "slow":
+            deadline = time.monotonic() + 5
+            while not cancel.is_set() and time.monotonic() < deadline:
+                time.sleep(0.01)
+            cancelled.append(folder.name)
+            return utils.TestResult(success=False, output_path=folder / "test_output.txt", raw_output="cancelled")
+        if outcome == "pass":
+            return utils.TestResult(success=True, output_path=folder / "test_output.txt", raw_output="3 passed")
+        return utils.TestResult(success=False, output_path=folder / "test_output.txt",
+                                raw_output=f"{outcome.split()[1]} failed, 1 passed")
+    return run, cancelled
+
+@pytest.fixture
+def stub_venvs(monkeypatch):
+    monkeypatch.setattr(validate_agent, "create_venv_and_install", lambda folder, cache, wheelhouse: (folder / ".venv", "pip"))
+
+def version_folder(tmp_path):
+    folder = tmp_path / "case" / "001"
+    folder.mkdir(parents=True)
+    (folder / "test_script.py").write_text("def test_ok():\n    pass\n")
+    return folder
+
+def test_first_green_candidate_wins_and_cancels_the_rest(tmp_path, monkeypatch, stub_venvs):
+    run, cancelled = fake_pytest(lambda folder: (folder / "script.py").read_text())
+    monkeypatch.setattr(validate_agent, "run_pytest", run)
+    folder = version_folder(tmp_path)
+
+    started = time.monotonic()
+    winner, chosen = validate_agent.run_fix_candidates(folder, [candidate("slow"), candidate("pass")], None, None)
+
+    assert winner == chosen == tmp_path / "case" / "candidates" / "001" / "02"
+    assert cancelled == ["01"] and time.monotonic() - started < 2
+    # Every candidate is tested against the current test files
+    assert (winner / "test_script.py").exists()
+
+def test_without_a_green_candidate_the_fewest_failures_is_kept(tmp_path, monkeypatch, stub_venvs):
+    run, _ = fake_pytest(lambda folder: (folder / "script.py").read_text())
+    monkeypatch.setattr(validate_agent, "run_pytest", run)
+    candidates = [candidate("fail 3"), candidate("fail 1"), candidate("fail 2")]
+
+    winner, chosen = validate_agent.run_fix_candidates(version_folder(tmp_path), candidates, None, None)
+
+    assert winner is None and chosen.name == "02"
+
+def test_candidate_folders_are_removed_once_one_is_kept(tmp_path, monkeypatch, stub_venvs):
+    case = make_case(tmp_path, "case", SCRIPT)
+    # The first version fails; of its dry-run candidates only the third passes
+    run, _ = fake_pytest(lambda folder: "pass" if folder.name == "03" else "fail 1")
+    monkeypatch.setattr(validate_agent, "run_pytest", run)
+
+    report = validate_agent.process_case("case", make_args(tmp_path, speculative=3), None, None, None)
+
+    assert (report.outcome, report.attempts) == ("valid", 2)
+    assert (case / "002" / "script.py").read_text() == SCRIPT
+    assert not (case / "candidates" / "001").exists()
+    assert (tmp_path / "valid" / "case" / "script.py").exists()
+
+class FakeClient:
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.prompts = []
+
+    def complete_json(self, system, user):
+        self.prompts.append(user)
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+def test_request_fix_candidates_drops_failed_and_malformed_responses():
+    client = FakeClient([candidate("a"), {"script_py": "b"}, TimeoutError("slow"), candidate("d")])
+
+    candidates = validate_agent.request_fix_candidates(client, "fix it", 4)
+
+    assert [c["script_py"] for c in candidates] == ["a", "d"]
+    # Each request is told which of the candidates it is, so they differ
+    assert len(set(client.prompts)) == 4
+
+def test_request_fix_candidates_uses_the_batch_call_when_available():
+    class BatchClient:
+        def complete_json_batch(self, prompts, return_exceptions=False):
+            assert return_exceptions
+            return [candidate(str(i)) if i else ValueError("bad json") for i, _ in enumerate(prompts)]
+
+    assert [c["script_py"] for c in validate_agent.request_fix_candidates(BatchClient(), "fix it", 3)] == ["1", "2"]
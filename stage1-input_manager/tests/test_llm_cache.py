@@ -0,0 +1,52 @@
+import json
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from llm_cache import CacheMiss, ResponseCache, request_key
+from openai_client import OpenAIClient
+
+def test_request_key_is_stable():
+    # Recorded caches are looked up by this key, so its format must not drift between releases
+    key = request_key("gpt-4o-mini", 0.2, "sys", "user")
+    assert key == "8733a4e4a398d7b4fefde09b9770e745edc2771880db1c9ea5a6c99e351d33b3"
+    assert key == request_key("gpt-4o-mini", 0.2, "sys", "user")
+    assert len({key, request_key("gpt-4o", 0.2, "sys", "user"), request_key("gpt-4o-mini", 0.3, "sys", "user"),
+                request_key("gpt-4o-mini", 0.2, "sys2", "user"), request_key("gpt-4o-mini", 0.2, "sys", "user2")}) == 5
+
+class FakeCompletions:
+    def __init__(self):
+        self.calls = 0
+
+    def create(self, **kwargs):
+        self.calls += 1
+        content = f'```json\n{{"call": {self.calls}}}\n```'
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+def test_record_then_replay(tmp_path, monkeypatch):
+    completions = FakeCompletions()
+    monkeypatch.setattr(OpenAIClient, "_connect",
+                        lambda self, api_key: SimpleNamespace(chat=SimpleNamespace(completions=completions)))
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    cache = ResponseCache(tmp_path / "cache", ttl_seconds=60)
+
+    recorder = OpenAIClient(cache=cache, cache_mode="record")
+    assert recorder.complete_json("sys", "user") == {"call": 1}
+    # record always calls the API and overwrites the entry
+    assert recorder.complete_json("sys", "user") == {"call": 2}
+    assert OpenAIClient(cache=cache, cache_mode="cache").complete_json("sys", "user") == {"call": 2}
+    assert completions.calls == 2
+
+    # replay needs no API key and serves entries past their TTL
+    monkeypatch.delenv("OPENAI_API_KEY")
+    path = cache._path(request_key("gpt-4o-mini", 0.2, "sys", "user"))
+    entry = json.loads(path.read_text(encoding="utf-8"))
+    path.write_text(json.dumps({**entry, "created_at": time.time() - 3600}), encoding="utf-8")
+    assert cache.get(path.stem) is None
+    replayer = OpenAIClient(cache=cache, cache_mode="replay")
+    assert replayer.client is None
+    assert replayer.complete_json("sys", "user") == {"call": 2}
+    with pytest.raises(CacheMiss):
+        replayer.complete_json("sys", "other user")
+    assert completions.calls == 2
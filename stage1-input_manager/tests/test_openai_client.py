@@ -0,0 +1,117 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+import pytest
+
+import openai_client
+from openai_client import AsyncOpenAIClient, PooledOpenAIClient, TokenBucket
+
+COMPLETION = {
+    "id": "chatcmpl-stub", "object": "chat.completion", "created": 0, "model": "stub",
+    "choices": [{"index": 0, "finish_reason": "stop",
+                 "message": {"role": "assistant", "content": '{"ok": true}'}}],
+}
+
+class StubServer(ThreadingHTTPServer):
+    """Chat Completions stand-in: answers the first request with 429, every later one with COMPLETION."""
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), StubHandler)
+        self.arrivals = []
+        self.limited_at = None
+        self.lock = threading.Lock()
+
+class StubHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        with self.server.lock:
+            first = self.server.limited_at is None
+            now = time.monotonic()
+            if first:
+                self.server.limited_at = now
+            else:
+                self.server.arrivals.append(now)
+        status, body = (429, {"error": {"message": "slow down", "type": "rate_limit"}}) if first else (200, COMPLETION)
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def server():
+    server = StubServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def test_one_429_delays_every_pooled_call(server, monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    # Backoff after the first retry becomes exactly 1s
+    monkeypatch.setattr(openai_client.random, "random", lambda: 0.0)
+    client = PooledOpenAIClient(model="stub", base_url=f"http://127.0.0.1:{server.server_port}/v1",
+                                max_concurrency=4, requests_per_second=0)
+    try:
+        limited = threading.Thread(target=client.complete_json, args=("system", "limited"))
+        limited.start()
+        deadline = time.monotonic() + 10
+        while client.client.bucket.blocked_until == 0:
+            assert time.monotonic() < deadline, "429 never reached the rate limiter"
+            time.sleep(0.01)
+        results = client.complete_json_batch([("system", f"user {i}") for i in range(3)])
+        limited.join()
+    finally:
+        client.close()
+
+    assert results == [{"ok": True}] * 3
+    # The retry plus the three calls issued during the backoff
+    assert len(server.arrivals) == 4
+    assert min(server.arrivals) - server.limited_at >= 0.9
+
+def test_token_bucket_honours_penalty_without_rate_limit():
+    async def wait():
+        bucket = TokenBucket(0)
+        bucket.penalize(0.2)
+        started = time.monotonic()
+        await bucket.acquire()
+        return time.monotonic() - started
+
+    assert asyncio.run(wait()) >= 0.19
+
+def test_tokens_are_taken_only_once_a_slot_is_free(monkeypatch):
+    sent = []
+
+    async def create(**kwargs):
+        sent.append(time.monotonic())
+        await asyncio.sleep(0.1)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content='{"ok": true}'))])
+
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.setattr(AsyncOpenAIClient, "_connect",
+                        lambda self, api_key: SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create))))
+    # A burst of 100 tokens is available, but only one request may be in flight
+    client = AsyncOpenAIClient(model="stub", max_concurrency=1, requests_per_second=100)
+    granted = []
+    acquire = client.bucket.acquire
+
+    async def traced_acquire():
+        await acquire()
+        granted.append(time.monotonic())
+    client.bucket.acquire = traced_acquire
+
+    results = asyncio.run(client.complete_json_batch([("system", f"user {i}") for i in range(4)]))
+
+    assert results == [{"ok": True}] * 4
+    # Each token is spent when its request goes out, not while it queued for the slot
+    assert max(s - g for g, s in zip(granted, sent)) < 0.05
@@ -0,0 +1,44 @@
+import os
+import sys
+
+from pytest_worker import PytestWorkerPool
+
+def make_version(case, name):
+    """A version folder with one passing test and a '.venv' whose python is this interpreter."""
+    version = case / name
+    (version / ".venv" / "bin").mkdir(parents=True)
+    os.symlink(sys.executable, version / ".venv" / "bin" / "python")
+    (version / "test_ok.py").write_text("def test_ok():\n    assert True\n")
+    return version
+
+def run(pool, version):
+    exit_code, output = pool.run(version, version / ".venv", ["-q", "-p", "no:cacheprovider"])
+    assert exit_code == 0, output
+
+def idle_workers(pool):
+    return [w for idle in pool._idle.values() for w in idle]
+
+def test_new_version_closes_idle_workers_of_the_previous_one(tmp_path):
+    case = tmp_path / "case"
+    first, second = make_version(case, "001"), make_version(case, "002")
+    pool = PytestWorkerPool(max_idle=4, timeout=60)
+    try:
+        run(pool, first)
+        [old] = idle_workers(pool)
+        run(pool, second)
+        assert not old.alive
+        assert old.proc.wait(timeout=10) is not None
+        assert list(pool._idle) == [str(second / ".venv" / "bin" / "python")]
+    finally:
+        pool.close()
+
+def test_idle_workers_are_capped(tmp_path):
+    pool = PytestWorkerPool(max_idle=1, timeout=60)
+    try:
+        versions = [make_version(tmp_path / f"case_{i}", "001") for i in range(2)]
+        for version in versions:
+            run(pool, version)
+        assert len(idle_workers(pool)) == 1
+        assert list(pool._idle) == [str(versions[-1] / ".venv" / "bin" / "python")]
+    finally:
+        pool.close()
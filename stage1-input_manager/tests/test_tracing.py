@@ -0,0 +1,86 @@
+import asyncio
+import json
+import threading
+
+import tracing
+
+def events(tracer, ph):
+    return {e["name"]: e for e in tracer.trace()["traceEvents"] if e["ph"] == ph}
+
+def test_spans_nest_within_their_thread(tmp_path):
+    tracer = tracing.Tracer(tmp_path / "trace.json", "validate")
+    with tracer.span("case", "validate", case="a"):
+        with tracer.span("venv", "validate") as s:
+            s["cached"] = True
+        with tracer.span("pytest", "validate") as s:
+            s["exit_code"] = 1
+
+    spans = events(tracer, "X")
+    case, venv, pytest = spans["case"], spans["venv"], spans["pytest"]
+    # Children start after and end before their parent, on the same thread
+    for child in (venv, pytest):
+        assert child["tid"] == case["tid"]
+        assert case["ts"] <= child["ts"] and child["ts"] + child["dur"] <= case["ts"] + case["dur"]
+    assert venv["ts"] + venv["dur"] <= pytest["ts"]
+    assert case["args"]["case"] == "a" and venv["args"]["cached"] is True
+    assert events(tracer, "M")["process_name"]["args"] == {"name": "validate"}
+
+def test_concurrent_spans_are_async_slices(tmp_path):
+    tracer = tracing.Tracer(tmp_path / "trace.json", "deploy")
+
+    async def service(name):
+        with tracer.span("service", "deploy", concurrent=True, service=name):
+            await asyncio.sleep(0.01)
+
+    async def fleet():
+        await asyncio.gather(service("a"), service("b"))
+
+    asyncio.run(fleet())
+    begins = [e for e in tracer.trace()["traceEvents"] if e["ph"] == "b"]
+    ends = {e["id"]: e for e in tracer.trace()["traceEvents"] if e["ph"] == "e"}
+    assert sorted(e["args"]["service"] for e in begins) == ["a", "b"]
+    assert all(ends[e["id"]]["ts"] >= e["ts"] for e in begins)
+    assert tracer.summary()["deploy"]["service"]["count"] == 2
+
+def test_summary_totals_per_stage_and_name(tmp_path):
+    tracer = tracing.Tracer(tmp_path / "trace.json", "pipeline")
+    for chars, error in ((10, None), (32, ValueError)):
+        try:
+            with tracer.span("complete_json", "validate", prompt_chars=chars):
+                if error:
+                    raise error("bad")
+        except ValueError:
+            pass
+
+    def render():
+        with tracer.span("render", "generate", bytes=5):
+            pass
+
+    thread = threading.Thread(target=render)
+    thread.start()
+    thread.join()
+
+    summary = tracer.summary()
+    llm = summary["validate"]["complete_json"]
+    assert (llm["count"], llm["errors"], llm["prompt_chars"]) == (2, 1, 42)
+    assert llm["max_seconds"] <= llm["seconds"] and llm["mean_seconds"] == round(llm["seconds"] / 2, 4)
+    assert summary["generate"]["render"]["bytes"] == 5
+
+def test_save_writes_trace_and_summary(tmp_path):
+    tracer = tracing.Tracer(tmp_path / "out" / "trace.json", "generate")
+    with tracer.span("render", "generate", bytes=3):
+        pass
+
+    summary_path = tracer.save()
+
+    assert summary_path == tmp_path / "out" / "trace.summary.json"
+    trace = json.loads((tmp_path / "out" / "trace.json").read_text())
+    assert trace["displayTimeUnit"] == "ms"
+    assert [e["name"] for e in trace["traceEvents"] if e["ph"] == "X"] == ["render"]
+    assert json.loads(summary_path.read_text())["generate"]["render"]["count"] == 1
+
+def test_span_is_a_no_op_while_disabled(monkeypatch):
+    monkeypatch.setattr(tracing, "_tracer", None)
+    with tracing.span("venv", "validate") as s:
+        s["exit_code"] = 0
+    assert s is tracing.NULL_SPAN and not tracing.enabled()
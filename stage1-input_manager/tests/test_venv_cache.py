@@ -0,0 +1,64 @@
+import os
+import time
+
+import venv_cache
+from venv_cache import VenvCache, requirements_key
+
+def fake_build(venv_dir, req, wheelhouse=None):
+    (venv_dir / "bin").mkdir(parents=True)
+    (venv_dir / "bin" / "activate").write_text(f"VIRTUAL_ENV={venv_dir}\n")
+    (venv_dir / "lib").mkdir()
+    (venv_dir / "lib" / "pkg.py").write_text(req.read_text() * 100)
+    return True
+
+def use(cache, tmp_path, requirements, age):
+    """Materialize a venv for requirements, then date its last use age seconds back."""
+    req = tmp_path / f"requirements-{len(list(tmp_path.glob('requirements-*')))}.txt"
+    req.write_text(requirements)
+    cache.materialize(req, tmp_path / "venvs" / req.stem)
+    meta = cache.root / requirements_key(requirements) / venv_cache.META_FILE
+    os.utime(meta, (time.time() - age,) * 2)
+    return requirements_key(requirements)
+
+def test_prune_evicts_least_recently_used(tmp_path, monkeypatch):
+    monkeypatch.setattr(venv_cache, "build_venv", fake_build)
+    cache = VenvCache(tmp_path / "cache", max_entries=2)
+    a = use(cache, tmp_path, "requests\n", age=300)
+    b = use(cache, tmp_path, "numpy\n", age=200)
+    # A hit refreshes a's last use, so b is now the oldest
+    a = use(cache, tmp_path, "# same set\nRequests\n", age=100)
+    c = use(cache, tmp_path, "pandas\n", age=0)
+    assert {e.key for e in cache.entries()} == {a, c}
+
+    # The byte cap evicts oldest first but never an entry in keep
+    sizes = {e.key: e.size_bytes for e in cache.entries()}
+    assert cache.prune(keep={a}, max_entries=0, max_bytes=sizes[a]) == [c]
+    assert [e.key for e in cache.entries()] == [a]
+
+def test_prune_removes_abandoned_builds(tmp_path):
+    cache = VenvCache(tmp_path / "cache")
+    partial, fresh = cache.root / "partial", cache.root / "building"
+    partial.mkdir()
+    fresh.mkdir()
+    os.utime(partial, (time.time() - 7200,) * 2)
+    assert cache.prune() == ["partial"]
+    assert fresh.is_dir()
+
+def test_clones_share_a_read_only_entry(tmp_path, monkeypatch):
+    monkeypatch.setattr(venv_cache, "build_venv", fake_build)
+    cache = VenvCache(tmp_path / "cache")
+    key = use(cache, tmp_path, "requests\n", age=0)
+    clone = tmp_path / "venvs" / "requirements-0"
+    entry = cache.root / key
+
+    # site-packages is shared and read-only, so an in-place write cannot reach the entry
+    assert os.path.samefile(clone / "lib" / "pkg.py", entry / "lib" / "pkg.py")
+    assert not (entry / "lib" / "pkg.py").stat().st_mode & 0o222
+    # Files embedding the venv path are private, writable copies
+    assert not os.path.samefile(clone / "bin" / "activate", entry / "bin" / "activate")
+    assert (clone / "bin" / "activate").read_text() == f"VIRTUAL_ENV={clone}\n"
+    assert (clone / "bin" / "activate").stat().st_mode & 0o200
+    # pip replaces files: doing so in a clone leaves the entry alone
+    (clone / "lib" / "pkg.py").unlink()
+    (clone / "lib" / "pkg.py").write_text("upgraded")
+    assert (entry / "lib" / "pkg.py").read_text().startswith("requests")
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+Span tracing for the pipeline stages.
+
+    enable("trace.json", "validate")          # or TRACE_PATH / --trace
+    with span("pip install", "validate", requirements=3) as s:
+        cp = subprocess.run(...)
+        s["exit_code"] = cp.returncode
+
+Spans are written as Chrome trace JSON (open in https://ui.perfetto.dev or
+chrome://tracing) plus <trace>.summary.json with per-stage totals. Until
+enable() is called span() returns a shared no-op, so instrumented code pays
+one global lookup per span.
+
+Stage 2 and stage 3 import this module from the stage 1 folder (through their
+shared.py), so the orchestrator's stages share one tracer and one trace file.
+"""
+import atexit
+import itertools
+import json
+import os
+import subprocess
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Numeric span args that are added up in the summary
+SUMMED_ARGS = ("prompt_chars", "response_chars", "bytes")
+
+def _peak_rss_mb(who) -> float:
+    # ru_maxrss is in KB on Linux (bytes on macOS; close enough for spotting hot spots)
+    return round(resource.getrusage(who).ru_maxrss / 1024, 1)
+
+class _NullSpan:
+    """What span() returns while tracing is disabled: accepts and drops everything."""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def __setitem__(self, key, value):
+        pass
+
+    def update(self, *args, **kwargs):
+        pass
+
+NULL_SPAN = _NullSpan()
+
+class Span(dict):
+    """An open span; items set on it become the span's args."""
+    __slots__ = ("tracer", "name", "cat", "concurrent", "start")
+
+    def __init__(self, tracer: "Tracer", name: str, cat: str, concurrent: bool, args: dict):
+        super().__init__(args)
+        self.tracer, self.name, self.cat, self.concurrent = tracer, name, cat, concurrent
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self["error"] = exc_type.__name__
+        self.tracer.record(self.name, self.cat, self.start, self.concurrent, dict(self))
+        return False
+
+class Tracer:
+    """
+    Collects spans in memory. A span normally belongs to the thread that ran
+    it; concurrent=True spans (asyncio tasks, which overlap on one thread) are
+    written as async slices instead so they do not break the thread's nesting.
+    """
+    def __init__(self, path: Path, process_name: str):
+        self.path = Path(path)
+        self.process_name = process_name
+        self.pid = os.getpid()
+        self.origin = time.perf_counter()
+        self.events: List[dict] = []
+        self.threads: Dict[int, str] = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def span(self, name: str, cat: str, concurrent: bool = False, **args) -> Span:
+        return Span(self, name, cat, concurrent, args)
+
+    def record(self, name: str, cat: str, start: float, concurrent: bool = False, args: Optional[dict] = None):
+        """Add a finished span that started at time.perf_counter() value start and ends now."""
+        end = time.perf_counter()
+        args = args if args is not None else {}
+        if resource is not None:
+            args["peak_rss_mb"] = _peak_rss_mb(resource.RUSAGE_SELF)
+            args["children_peak_rss_mb"] = _peak_rss_mb(resource.RUSAGE_CHILDREN)
+        ts = round((start - self.origin) * 1e6, 1)
+        dur = round((end - start) * 1e6, 1)
+        tid = threading.get_native_id()
+        event = {"name": name, "cat": cat, "pid": self.pid, "tid": tid, "ts": ts, "args": args}
+        with self._lock:
+            if tid not in self.threads:
+                self.threads[tid] = threading.current_thread().name
+            if concurrent:
+                span_id = next(self._ids)
+                self.events.append({**event, "ph": "b", "id": span_id})
+                self.events.append({"name": name, "cat": cat, "pid": self.pid, "tid": tid, "ph": "e",
+                                    "id": span_id, "ts": round(ts + dur, 1)})
+            else:
+                self.events.append({**event, "ph": "X", "dur": dur})
+
+    def trace(self) -> dict:
+        with self._lock:
+            events = list(self.events)
+            threads = dict(self.threads)
+        meta = [{"name": "process_name", "ph": "M", "pid": self.pid, "args": {"name": self.process_name}}]
+        meta += [{"name": "thread_name", "ph": "M", "pid": self.pid, "tid": tid, "args": {"name": name}}
+                 for tid, name in threads.items()]
+        return {"traceEvents": meta + events, "displayTimeUnit": "ms"}
+
+    def summary(self) -> dict:
+        """Count, total/mean/max seconds, errors, summed sizes and peak RSS per stage and span name."""
+        stages: Dict[str, dict] = {}
+        with self._lock:
+            events = [e for e in self.events if e["ph"] in ("X", "b")]
+            ends = {e["id"]: e["ts"] for e in self.events if e["ph"] == "e"}
+        for e in events:
+            dur = (e["dur"] if e["ph"] == "X" else ends[e["id"]] - e["ts"]) / 1e6
+            stat = stages.setdefault(e["cat"], {}).setdefault(
+                e["name"], {"count": 0, "seconds": 0.0, "max_seconds": 0.0, "errors": 0})
+            stat["count"] += 1
+            stat["seconds"] += dur
+            stat["max_seconds"] = max(stat["max_seconds"], dur)
+            args = e["args"]
+            if "error" in args or args.get("exit_code", 0) != 0:
+                stat["errors"] += 1
+            for key in SUMMED_ARGS:
+                if key in args:
+                    stat[key] = stat.get(key, 0) + args[key]
+            if "peak_rss_mb" in args:
+                stat["peak_rss_mb"] = max(stat.get("peak_rss_mb", 0), args["peak_rss_mb"],
+                                          args["children_peak_rss_mb"])
+        for spans in stages.values():
+            for stat in spans.values():
+                stat["mean_seconds"] = stat["seconds"] / stat["count"]
+                for key in ("seconds", "max_seconds", "mean_seconds"):
+                    stat[key] = round(stat[key], 4)
+        return stages
+
+    def save(self) -> Path:
+        """Write the trace and its summary; returns the summary path."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.path.write_text(json.dumps(self.trace()), encoding="utf-8")
+        summary_path = self.path.with_name(f"{self.path.stem}.summary.json")
+        summary_path.write_text(json.dumps(self.summary(), indent=2), encoding="utf-8")
+        return summary_path
+
+_tracer: Optional[Tracer] = None
+
+def enable(path, process_name: str) -> Tracer:
+    """Start tracing; the trace is saved and summarized when the process exits."""
+    global _tracer
+    if _tracer is None:
+        _tracer = Tracer(Path(path), process_name)
+        atexit.register(finish)
+    return _tracer
+
+def disable() -> Optional[Tracer]:
+    """Stop tracing without saving; returns the tracer with what it collected."""
+    global _tracer
+    tracer, _tracer = _tracer, None
+    return tracer
+
+def enabled() -> bool:
+    return _tracer is not None
+
+def span(name: str, cat: str, concurrent: bool = False, **args):
+    """Context manager timing a block; yields a dict-like whose items are stored with the span."""
+    if _tracer is None:
+        return NULL_SPAN
+    return _tracer.span(name, cat, concurrent, **args)
+
+def record(name: str, cat: str, start: float, concurrent: bool = False, **args):
+    """Record a span that started at time.perf_counter() value start and ends now."""
+    if _tracer is not None:
+        _tracer.record(name, cat, start, concurrent, args)
+
+def run(cmd, name: str, cat: str, **kwargs) -> subprocess.CompletedProcess:
+    """subprocess.run(cmd, **kwargs) traced as span name, with its exit code."""
+    with span(name, cat) as s:
+        cp = subprocess.run(cmd, **kwargs)
+        s["exit_code"] = cp.returncode
+    return cp
+
+def print_summary(stages: dict):
+    for stage, spans in stages.items():
+        print(f"⏱️ {stage}")
+        for name, stat in sorted(spans.items(), key=lambda kv: -kv[1]["seconds"]):
+            extra = "".join(f", {key} {stat[key]}" for key in SUMMED_ARGS if key in stat)
+            errors = f", {stat['errors']} failed" if stat["errors"] else ""
+            print(f"   {name:<28} {stat['count']:>5}x {stat['seconds']:>9.2f}s total {stat['mean_seconds']:>8.3f}s mean "
+                  f"{stat['max_seconds']:>8.3f}s max{errors}{extra}")
+
+def finish():
+    """Save the trace and print its summary (runs at exit once tracing is enabled)."""
+    global _tracer
+    if _tracer is None:
+        return
+    tracer, _tracer = _tracer, None
+    summary_path = tracer.save()
+    print_summary(tracer.summary())
+    print(f"🧭 Trace written to {tracer.path} (summary: {summary_path})")
@@ -2,18 +2,26 @@
 import os
 import shutil
 import subprocess
-import sys
+import threading
 import ast
 import inspect
+import json
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Tuple
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import tracing
+from blob_store import MANIFEST_FILE, BlobStore, link_file, load_manifest
+from pytest_worker import PytestWorkerPool
+from venv_cache import VenvCache, build_venv
+from wheelhouse import Wheelhouse
 
 @dataclass
 class TestResult:
     success: bool
     output_path: Path
     raw_output: str
+    report_path: Optional[Path] = None  # JUnit XML written by pytest
 
 @dataclass
 class ValidationResult:
@@ -21,20 +29,58 @@ class ValidationResult:
     has_run: bool
     run_is_async: bool
     has_correct_return_type: bool
+    has_valid_signature: bool = True
+    is_resumable: bool = False
+    is_sharded: bool = False
+    is_consumer: bool = False
+    # Resumable, but ResultDto has no resume_token field: the token is the count of results
+    # already delivered, so run() must skip exactly that many or resumed results are re-published
+    resumes_by_count: bool = False
 
 def ensure_dir(p: Path):
     p.mkdir(parents=True, exist_ok=True)
 
+def replace_text(path: Path, content: str):
+    """Write content to a fresh file; version files may be hardlinks shared with other versions."""
+    if path.exists() or path.is_symlink():
+        path.unlink()
+    path.write_text(content, encoding="utf-8")
+
 def copy_tree(src: Path, dst: Path):
     if dst.exists():
         shutil.rmtree(dst)
     shutil.copytree(src, dst)
 
-def copy_valid_version(version_folder: Path, dest: Path):
+def stored_files(version_folder: Path, blob_store: Optional[BlobStore]) -> Set[str]:
+    """Files of a version that are still hardlinks of their blob store object (none without a store)."""
+    if blob_store is None or not (version_folder / MANIFEST_FILE).exists():
+        return set()
+    stored = set()
+    for rel, digest in load_manifest(version_folder).items():
+        try:
+            if os.path.samefile(version_folder / rel, blob_store.object_path(digest)):
+                stored.add(rel)
+        except OSError:
+            pass
+    return stored
+
+def copy_valid_version(version_folder: Path, dest: Path, blob_store: Optional[BlobStore] = None):
+    """
+    Copy a version's files to dest. Files held by the blob store are linked
+    instead; anything else is copied, so dest never shares an inode with a
+    file that may still be written in place.
+    """
     if dest.exists():
         shutil.rmtree(dest)
 
     ensure_dir(dest)
+    stored = stored_files(version_folder, blob_store)
+
+    def export(src: Path):
+        if src.name in stored:
+            link_file(src, dest / src.name)
+        else:
+            shutil.copy2(src, dest / src.name)
 
     # List of original files
     original_files = ["script.py", "requirements.txt", "readme.md"]
@@ -43,11 +89,11 @@ def copy_valid_version(version_folder: Path, dest: Path):
     for fname in original_files:
         src = version_folder / fname
         if src.exists():
-            shutil.copy2(src, dest / fname)
+            export(src)
 
     # Copy test files (anything starting with "test_" and ending in .py)
     for test_file in version_folder.glob("test_*.py"):
-        shutil.copy2(test_file, dest / test_file.name)
+        export(test_file)
         
     return
 
@@ -62,11 +108,17 @@ def validate_script_contract(script_path: str) -> ValidationResult:
     has_run = False
     run_is_async = False
     has_correct_return_type = False
+    has_valid_signature = True
+    is_resumable = False
+    is_sharded = False
+    is_consumer = False
+    result_fields = set()
 
     for node in tree.body:
         # Look for dataclass ResultDto
         if isinstance(node, ast.ClassDef) and node.name == "ResultDto":
             has_result_dto = True
+            result_fields = {f["name"] for f in _dataclass_fields(node)}
 
         # Look for async def run()
         if isinstance(node, ast.AsyncFunctionDef) and node.name == "run":
@@ -77,14 +129,118 @@ def validate_script_contract(script_path: str) -> ValidationResult:
                 ann = ast.unparse(node.returns)
                 if "AsyncGenerator" in ann and "ResultDto" in ann:
                     has_correct_return_type = True
-                    
+            # run() takes no arguments, or optional resume_token / shard_index + shard_count
+            has_valid_signature, params = _run_signature(node.args)
+            is_resumable = has_valid_signature and "resume_token" in params
+            is_sharded = has_valid_signature and "shard_index" in params
+            is_consumer = has_valid_signature and "request" in params
+
     return ValidationResult(
         has_result_dto=has_result_dto,
         has_run=has_run,
         run_is_async=run_is_async,
-        has_correct_return_type=has_correct_return_type
+        has_correct_return_type=has_correct_return_type,
+        has_valid_signature=has_valid_signature,
+        is_resumable=is_resumable,
+        is_sharded=is_sharded,
+        is_consumer=is_consumer,
+        resumes_by_count=is_resumable and "resume_token" not in result_fields,
     )
 
+# run() parameters of the resumable, sharding and consumer (per-request) contracts
+RUN_PARAMS = ("resume_token", "shard_index", "shard_count", "request")
+
+def _run_signature(args: ast.arguments) -> Tuple[bool, Set[str]]:
+    """Returns (valid, parameter names) for run()."""
+    positional = args.posonlyargs + args.args
+    names = [p.arg for p in positional + args.kwonlyargs]
+    if args.vararg or args.kwarg or len(set(names)) != len(names) or set(names) - set(RUN_PARAMS):
+        return False, set()
+    # Consumer mode: run(request) is called once per input message
+    if "request" in names:
+        return names == ["request"], set(names)
+    # shard_index and shard_count only make sense together
+    if ("shard_index" in names) != ("shard_count" in names):
+        return False, set()
+    # Every parameter needs a default so run() stays callable bare (tests, non-sharded callers)
+    has_defaults = len(args.defaults) == len(positional) and all(d is not None for d in args.kw_defaults)
+    return has_defaults, set(names)
+
+
+RESULT_SCHEMA_FILE = "result_schema.json"
+
+# Annotation name -> field kind used by stage2's generated encoder
+FIELD_KINDS = {
+    "int": "integer", "float": "number", "str": "string", "bool": "boolean",
+    "datetime": "datetime", "date": "date", "time": "time",
+    "Decimal": "decimal", "UUID": "uuid", "bytes": "bytes",
+    "list": "array", "List": "array", "tuple": "array", "Tuple": "array",
+    "set": "array", "Set": "array", "Sequence": "array",
+    "dict": "object", "Dict": "object", "Mapping": "object",
+}
+
+def _field_kind(ann: ast.expr) -> Tuple[str, bool]:
+    """Returns (kind, nullable) for a field annotation."""
+    # Optional[X] / Union[X, None] / X | None
+    if isinstance(ann, ast.BinOp) and isinstance(ann.op, ast.BitOr):
+        parts = [ann.left, ann.right]
+    elif isinstance(ann, ast.Subscript) and ast.unparse(ann.value).split(".")[-1] in ("Optional", "Union"):
+        sl = ann.slice
+        parts = list(sl.elts) if isinstance(sl, ast.Tuple) else [sl]
+        if ast.unparse(ann.value).split(".")[-1] == "Optional":
+            parts.append(ast.Constant(None))
+    else:
+        parts = [ann]
+    nullable = any(isinstance(p, ast.Constant) and p.value is None for p in parts)
+    kinds = {_base_kind(p) for p in parts if not (isinstance(p, ast.Constant) and p.value is None)}
+    return (kinds.pop() if len(kinds) == 1 else "any"), nullable
+
+def _base_kind(ann: ast.expr) -> str:
+    node = ann.value if isinstance(ann, ast.Subscript) else ann
+    return FIELD_KINDS.get(ast.unparse(node).split(".")[-1], "any")
+
+def _dataclass_fields(node: ast.ClassDef) -> List[Dict[str, Any]]:
+    fields = []
+    for stmt in node.body:
+        if not (isinstance(stmt, ast.AnnAssign) and isinstance(stmt.target, ast.Name)):
+            continue
+        if "ClassVar" in ast.unparse(stmt.annotation):
+            continue
+        kind, nullable = _field_kind(stmt.annotation)
+        fields.append({
+            "name": stmt.target.id,
+            "annotation": ast.unparse(stmt.annotation),
+            "kind": kind,
+            "nullable": nullable,
+            "required": stmt.value is None,
+        })
+    return fields
+
+def extract_result_schema(script_path: str) -> Optional[Dict[str, Any]]:
+    """
+    Field schema of the ResultDto dataclass in script.py (None if it is not found),
+    plus the run() parameters and, for consumer-mode scripts, the RequestDto fields.
+    """
+    with open(script_path, "r") as f:
+        tree = ast.parse(f.read())
+
+    classes = {node.name: node for node in tree.body if isinstance(node, ast.ClassDef)}
+    if "ResultDto" not in classes:
+        return None
+    schema = {"name": "ResultDto", "fields": _dataclass_fields(classes["ResultDto"]), "run_params": []}
+    for node in tree.body:
+        if isinstance(node, ast.AsyncFunctionDef) and node.name == "run":
+            schema["run_params"] = sorted(_run_signature(node.args)[1])
+    if "RequestDto" in classes:
+        schema["request"] = {"name": "RequestDto", "fields": _dataclass_fields(classes["RequestDto"])}
+    return schema
+
+def export_valid_case(version_folder: Path, dest: Path, blob_store: Optional[BlobStore] = None):
+    """Copy a validated version to dest along with the ResultDto schema stage2 generates from."""
+    copy_valid_version(version_folder, dest, blob_store)
+    schema = extract_result_schema(version_folder / "script.py")
+    if schema is not None:
+        (dest / RESULT_SCHEMA_FILE).write_text(json.dumps(schema, indent=2), encoding="utf-8")
 
 def detect_current_version_folder(case_path: Path) -> Path:
     versions = [int(p.name) for p in case_path.iterdir() if p.is_dir() and p.name.isdigit()]
@@ -104,27 +260,59 @@ def detect_current_version_folder(case_path: Path) -> Path:
     else:
         return case_path / f"{max(versions):03d}"
 
-def create_venv_and_install(version_path: Path) -> Tuple[Path, str]:
+def create_venv_and_install(version_path: Path, cache: Optional[VenvCache] = None,
+                            wheelhouse: Optional[Wheelhouse] = None) -> Tuple[Path, str]:
     venv_dir = version_path / ".venv"
-    py = sys.executable
-    subprocess.run([py, "-m", "venv", str(venv_dir)], check=True)
-    pip = venv_dir / ("Scripts/pip.exe" if os.name == "nt" else "bin/pip")
     # Ensure requirements exists
     req = version_path / "requirements.txt"
     if not req.exists():
         req.write_text("", encoding="utf-8")
-    # Install deps (best-effort) and pytest
-    subprocess.run([str(pip), "install", "-r", str(req)], check=False)
-    subprocess.run([str(pip), "install", "pytest"], check=False)
+    with tracing.span("venv", "validate", cached=cache is not None):
+        if cache is not None:
+            cache.materialize(req, venv_dir)
+        else:
+            build_venv(venv_dir, req, wheelhouse)
+    pip = venv_dir / ("Scripts/pip.exe" if os.name == "nt" else "bin/pip")
     return venv_dir, str(pip)
 
-def run_pytest(version_path: Path, venv_dir: Path) -> TestResult:
+def run_pytest(version_path: Path, venv_dir: Path, cancel: Optional[threading.Event] = None,
+               workers: Optional[PytestWorkerPool] = None) -> TestResult:
     pytest = venv_dir / ("Scripts/pytest.exe" if os.name == "nt" else "bin/pytest")
     out_file = version_path / "test_output.txt"
-    cp = subprocess.run([str(pytest), "-q", "--maxfail=20"], cwd=str(version_path), capture_output=True, text=True)
-    out = (cp.stdout or "") + "\n" + (cp.stderr or "")
+    report_file = version_path / "test_report.xml"
+    if report_file.exists():
+        report_file.unlink()
+    args = ["-q", "--maxfail=20", f"--junitxml={report_file}"]
+    with tracing.span("pytest", "validate", warm_worker=workers is not None) as s:
+        reply = workers.run(version_path, venv_dir, args, cancel) if workers is not None else None
+        if cancel is not None and cancel.is_set():
+            s["cancelled"] = True
+            return TestResult(success=False, output_path=out_file, raw_output="cancelled")
+        if reply is not None:
+            returncode, stdout = reply
+            stderr = ""
+        elif cancel is None:
+            cp = subprocess.run([str(pytest), *args], cwd=str(version_path), capture_output=True, text=True)
+            stdout, stderr, returncode = cp.stdout, cp.stderr, cp.returncode
+        else:
+            # Poll so a competing run that already succeeded can stop this one
+            proc = subprocess.Popen([str(pytest), *args], cwd=str(version_path), stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+            while True:
+                try:
+                    stdout, stderr = proc.communicate(timeout=0.2)
+                    returncode = proc.returncode
+                    break
+                except subprocess.TimeoutExpired:
+                    if cancel.is_set():
+                        proc.kill()
+                        proc.communicate()
+                        s["cancelled"] = True
+                        return TestResult(success=False, output_path=out_file, raw_output="cancelled")
+        s["exit_code"] = returncode
+    out = (stdout or "") + "\n" + (stderr or "")
     out_file.write_text(out, encoding="utf-8")
-    return TestResult(success=cp.returncode == 0, output_path=out_file, raw_output=out)
+    return TestResult(success=returncode == 0, output_path=out_file, raw_output=out,
+                      report_path=report_file if report_file.exists() else None)
 
 def increment_version_folder(current: Path) -> Path:
     n = int(current.name)
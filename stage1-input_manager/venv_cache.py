@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+import hashlib
+import json
+import os
+import platform
+import shutil
+import stat
+import sys
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Optional
+
+import tracing
+
+META_FILE = "cache_meta.json"
+
+@dataclass
+class CacheEntry:
+    key: str
+    path: Path
+    size_bytes: int
+    created_at: float
+    last_used: float
+    requirements: str
+
+def normalize_requirements(text: str) -> str:
+    """Canonical form of a requirements file: no comments/blank lines, sorted, deduplicated."""
+    lines = set()
+    for line in text.splitlines():
+        if line.lstrip().startswith("#"):
+            continue
+        line = line.split(" #", 1)[0].strip()
+        if not line:
+            continue
+        line = " ".join(line.split())
+        if not line.startswith("-") and "://" not in line:
+            line = line.lower().replace("_", "-")
+        lines.add(line)
+    return "\n".join(sorted(lines))
+
+def requirements_key(text: str) -> str:
+    """Hash of the normalized requirements plus the interpreter the venv is built from."""
+    h = hashlib.sha256()
+    h.update(normalize_requirements(text).encode("utf-8"))
+    h.update(f"\0{sys.version}\0{sys.executable}\0{platform.machine()}".encode("utf-8"))
+    return h.hexdigest()[:24]
+
+def tree_size(path: Path) -> int:
+    total = 0
+    for root, _dirs, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return total
+
+def build_venv(venv_dir: Path, req: Path, wheelhouse=None) -> bool:
+    """Create a venv at venv_dir and install req plus pytest. Returns False if an install failed."""
+    tracing.run([sys.executable, "-m", "venv", str(venv_dir)], "venv create", "validate", check=True)
+    pip = venv_dir / ("Scripts/pip.exe" if os.name == "nt" else "bin/pip")
+    if wheelhouse is not None:
+        text = req.read_text(encoding="utf-8") if req.exists() else ""
+        if wheelhouse.install(str(pip), text) and wheelhouse.install(str(pip), "pytest"):
+            return True
+        if wheelhouse.offline:
+            return False
+    # Install deps (best-effort) and pytest
+    r1 = tracing.run([str(pip), "install", "-r", str(req)], "pip install", "validate", check=False)
+    r2 = tracing.run([str(pip), "install", "pytest"], "pip install", "validate", check=False)
+    return r1.returncode == 0 and r2.returncode == 0
+
+def freeze_tree(path: Path):
+    """Drop the write bits of every file under path; its hardlinked clones then refuse in-place writes."""
+    for root, _dirs, files in os.walk(path):
+        for name in files:
+            p = os.path.join(root, name)
+            if not os.path.islink(p):
+                os.chmod(p, stat.S_IMODE(os.lstat(p).st_mode) & ~0o222)
+
+def clone_venv(src: Path, dst: Path):
+    """
+    Materialize a copy of the venv at src under dst using hardlinks.
+    Launcher scripts and pyvenv.cfg embed the absolute venv path, so those are
+    rewritten as private, writable copies; everything else (site-packages)
+    shares inodes with the read-only cache entry. pip replaces files rather
+    than editing them, so installing into a clone leaves the entry intact, but
+    an in-place edit by root (who ignores the read-only bit) would reach every
+    clone. Falls back to a plain copy when src and dst are on different filesystems.
+    """
+    if dst.exists() or dst.is_symlink():
+        if dst.is_symlink() or dst.is_file():
+            dst.unlink()
+        else:
+            shutil.rmtree(dst)
+
+    old_prefix = str(src).encode()
+    new_prefix = str(dst).encode()
+    bin_dirs = {src / "bin", src / "Scripts"}
+
+    for root, dirs, files in os.walk(src):
+        root_path = Path(root)
+        target_root = dst / root_path.relative_to(src)
+        target_root.mkdir(parents=True, exist_ok=True)
+
+        for name in dirs + files:
+            s = root_path / name
+            d = target_root / name
+            if s.is_symlink():
+                link = os.readlink(s)
+                os.symlink(link.replace(str(src), str(dst)), d)
+                continue
+            if name in dirs:
+                continue
+
+            if root_path in bin_dirs or root_path == src:
+                data = s.read_bytes()
+                if old_prefix in data:
+                    d.write_bytes(data.replace(old_prefix, new_prefix))
+                    os.chmod(d, stat.S_IMODE(s.stat().st_mode) | stat.S_IWUSR)
+                    continue
+            try:
+                os.link(s, d)
+            except OSError:
+                shutil.copy2(s, d)
+
+        # os.walk does not descend into symlinked dirs; they were recreated above
+        dirs[:] = [n for n in dirs if not (root_path / n).is_symlink()]
+
+class VenvCache:
+    """
+    Shared store of virtualenvs keyed by requirements_key().
+    Each entry lives in <root>/<key>/ and is complete once cache_meta.json exists.
+    Its files are made read-only before it is published, since every clone shares them.
+    Entries are evicted least-recently-used first when max_entries or max_bytes is exceeded.
+    """
+    def __init__(self, root: Path, max_entries: int = 20, max_bytes: int = 0, wait_timeout: float = 600.0,
+                 wheelhouse=None):
+        self.root = Path(root).resolve()
+        self.wheelhouse = wheelhouse
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.wait_timeout = wait_timeout
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def materialize(self, req: Path, venv_dir: Path) -> Path:
+        """Populate venv_dir with an environment for req, building it in the store on a miss."""
+        text = req.read_text(encoding="utf-8") if req.exists() else ""
+        key = requirements_key(text)
+        entry = self.root / key
+
+        deadline = time.time() + self.wait_timeout
+        while True:
+            if (entry / META_FILE).exists():
+                self._touch(entry)
+                clone_venv(entry, venv_dir)
+                return venv_dir
+            try:
+                entry.mkdir()
+            except FileExistsError:
+                # Another process is building this key; wait for it to finish
+                if time.time() > deadline:
+                    break
+                time.sleep(0.5)
+                continue
+
+            try:
+                ok = build_venv(entry, req, self.wheelhouse)
+            except Exception:
+                shutil.rmtree(entry, ignore_errors=True)
+                raise
+            if not ok:
+                # Keep the half-installed env for this attempt only; never cache it
+                clone_venv(entry, venv_dir)
+                shutil.rmtree(entry, ignore_errors=True)
+                return venv_dir
+
+            freeze_tree(entry)
+            self._write_meta(entry, key, text)
+            clone_venv(entry, venv_dir)
+            self.prune(keep={key})
+            return venv_dir
+
+        # Timed out waiting on another builder: build privately
+        build_venv(venv_dir, req, self.wheelhouse)
+        return venv_dir
+
+    def entries(self) -> List[CacheEntry]:
+        result = []
+        for p in self.root.iterdir():
+            meta_path = p / META_FILE
+            if not p.is_dir() or not meta_path.exists():
+                continue
+            try:
+                meta = json.loads(meta_path.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                continue
+            result.append(CacheEntry(
+                key=p.name,
+                path=p,
+                size_bytes=int(meta.get("size_bytes", 0)),
+                created_at=float(meta.get("created_at", 0)),
+                last_used=meta_path.stat().st_mtime,
+                requirements=meta.get("requirements", ""),
+            ))
+        return result
+
+    def prune(self, keep=(), max_entries: Optional[int] = None, max_bytes: Optional[int] = None,
+              stale_after: float = 3600.0) -> List[str]:
+        """Evict LRU entries above the limits and remove abandoned partial builds. Returns removed keys."""
+        max_entries = self.max_entries if max_entries is None else max_entries
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        removed = []
+
+        now = time.time()
+        for p in self.root.iterdir():
+            if p.is_dir() and not (p / META_FILE).exists() and now - p.stat().st_mtime > stale_after:
+                shutil.rmtree(p, ignore_errors=True)
+                removed.append(p.name)
+
+        entries = sorted(self.entries(), key=lambda e: e.last_used)
+        total = sum(e.size_bytes for e in entries)
+        count = len(entries)
+        for e in entries:
+            over_count = max_entries and count > max_entries
+            over_size = max_bytes and total > max_bytes
+            if not (over_count or over_size):
+                break
+            if e.key in keep:
+                continue
+            shutil.rmtree(e.path, ignore_errors=True)
+            removed.append(e.key)
+            count -= 1
+            total -= e.size_bytes
+        return removed
+
+    def clear(self) -> List[str]:
+        removed = []
+        for p in self.root.iterdir():
+            if p.is_dir():
+                shutil.rmtree(p, ignore_errors=True)
+                removed.append(p.name)
+        return removed
+
+    @staticmethod
+    def _touch(entry: Path):
+        os.utime(entry / META_FILE, None)
+
+    @staticmethod
+    def _write_meta(entry: Path, key: str, text: str):
+        meta = {
+            "key": key,
+            "requirements": normalize_requirements(text),
+            "python": sys.version,
+            "created_at": time.time(),
+            "size_bytes": tree_size(entry),
+        }
+        (entry / META_FILE).write_text(json.dumps(meta, indent=2), encoding="utf-8")
+
+def _format_bytes(n: int) -> str:
+    for unit in ("B", "KB", "MB", "GB"):
+        if n < 1024:
+            return f"{n:.0f}{unit}"
+        n /= 1024
+    return f"{n:.1f}TB"
+
+def main():
+    import argparse
+    from dotenv import load_dotenv
+
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Inspect and prune the shared venv cache")
+    parser.add_argument("--cache-path", default=os.getenv("VENV_CACHE_PATH"), help="Venv cache path")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("list", help="List cached environments, most recently used first")
+    prune = sub.add_parser("prune", help="Evict least recently used environments")
+    prune.add_argument("--max-entries", type=int, default=int(os.getenv("VENV_CACHE_MAX_ENTRIES", "20")), help="0 = unlimited")
+    prune.add_argument("--max-bytes", type=int, default=int(os.getenv("VENV_CACHE_MAX_BYTES", "0")), help="0 = unlimited")
+    sub.add_parser("clear", help="Remove every cached environment")
+
+    args = parser.parse_args()
+    if not args.cache_path:
+        parser.error("--cache-path or VENV_CACHE_PATH is required")
+
+    cache = VenvCache(Path(args.cache_path))
+
+    if args.command == "list":
+        entries = sorted(cache.entries(), key=lambda e: e.last_used, reverse=True)
+        for e in entries:
+            used = time.strftime("%Y-%m-%d %H:%M", time.localtime(e.last_used))
+            reqs = ", ".join(e.requirements.splitlines()) or "(empty)"
+            print(f"{e.key}  {_format_bytes(e.size_bytes):>7}  last used {used}  {reqs}")
+        total = sum(e.size_bytes for e in entries)
+        print(f"{len(entries)} entries, {_format_bytes(total)} total")
+    elif args.command == "prune":
+        removed = cache.prune(max_entries=args.max_entries, max_bytes=args.max_bytes)
+        print(f"Removed {len(removed)} entries")
+    elif args.command == "clear":
+        removed = cache.clear()
+        print(f"Removed {len(removed)} entries")
+
+if __name__ == "__main__":
+    main()
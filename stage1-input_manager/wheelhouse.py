@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+import hashlib
+import json
+import os
+import platform
+import sys
+import tempfile
+from pathlib import Path
+from typing import List, Optional
+
+import tracing
+from venv_cache import normalize_requirements
+
+def wheelhouse_key(text: str) -> str:
+    """Hash of the normalized requirements plus the wheel compatibility of this interpreter."""
+    h = hashlib.sha256()
+    h.update(normalize_requirements(text).encode("utf-8"))
+    h.update(f"\0{sys.implementation.cache_tag}\0{sys.platform}\0{platform.machine()}".encode("utf-8"))
+    return h.hexdigest()[:24]
+
+class Wheelhouse:
+    """
+    Local wheel directory plus a resolution cache of pinned lock files.
+
+    <root>/wheels/        built/downloaded wheels, shared by every stage
+    <root>/locks/<key>.txt  `name==version` pins resolved for one requirements set
+
+    Once a lock exists, installs for that requirements set need no index access.
+    With offline=True the index is never contacted; resolution is attempted from
+    the wheels already present. stage is the trace category of the pip calls.
+    """
+    def __init__(self, root: Path, offline: bool = False, stage: str = "validate"):
+        self.root = Path(root).resolve()
+        self.wheels_dir = self.root / "wheels"
+        self.locks_dir = self.root / "locks"
+        self.offline = offline
+        self.stage = stage
+        self.wheels_dir.mkdir(parents=True, exist_ok=True)
+        self.locks_dir.mkdir(parents=True, exist_ok=True)
+
+    def find_links_args(self) -> List[str]:
+        return ["--no-index", "--find-links", str(self.wheels_dir)]
+
+    def lock(self, text: str) -> Optional[Path]:
+        """Return the lock file for a requirements text, resolving and building wheels on a miss."""
+        lock_path = self.locks_dir / f"{wheelhouse_key(text)}.txt"
+        if lock_path.exists():
+            return lock_path
+        if not normalize_requirements(text):
+            lock_path.write_text("", encoding="utf-8")
+            return lock_path
+
+        with tempfile.TemporaryDirectory() as tmp:
+            req = Path(tmp) / "requirements.txt"
+            req.write_text(text, encoding="utf-8")
+
+            index_args = ["--no-index"] if self.offline else []
+            cp = tracing.run(
+                [sys.executable, "-m", "pip", "wheel", "-q", "-r", str(req),
+                 "-w", str(self.wheels_dir), "--find-links", str(self.wheels_dir), *index_args],
+                "pip wheel", self.stage, capture_output=True, text=True,
+            )
+            if cp.returncode != 0:
+                return None
+
+            pins = self._resolve(req)
+            if pins is None:
+                return None
+
+        tmp_lock = lock_path.with_suffix(f".{os.getpid()}.tmp")
+        tmp_lock.write_text("\n".join(pins) + "\n", encoding="utf-8")
+        os.replace(tmp_lock, lock_path)
+        return lock_path
+
+    def lock_file(self, req: Path) -> Optional[Path]:
+        text = req.read_text(encoding="utf-8") if req.exists() else ""
+        return self.lock(text)
+
+    def install(self, pip: str, text: str) -> bool:
+        """Install a requirements text into the env owning `pip`, from the wheelhouse only."""
+        lock_path = self.lock(text)
+        if lock_path is None:
+            return False
+        cp = tracing.run([pip, "install", *self.find_links_args(), "-r", str(lock_path)], "pip install", self.stage, check=False)
+        return cp.returncode == 0
+
+    def _resolve(self, req: Path) -> Optional[List[str]]:
+        """Resolve req against the local wheels only and return sorted `name==version` pins."""
+        with tempfile.TemporaryDirectory() as tmp:
+            report = Path(tmp) / "report.json"
+            cp = tracing.run(
+                [sys.executable, "-m", "pip", "install", "-q", "--dry-run", "--ignore-installed",
+                 *self.find_links_args(), "--report", str(report), "-r", str(req)],
+                "pip resolve", self.stage, capture_output=True, text=True,
+            )
+            if cp.returncode != 0 or not report.exists():
+                return None
+            data = json.loads(report.read_text(encoding="utf-8"))
+        pins = {f"{item['metadata']['name']}=={item['metadata']['version']}" for item in data.get("install", [])}
+        return sorted(pins, key=str.lower)
+
+def main():
+    import argparse
+    from dotenv import load_dotenv
+
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Populate and inspect the shared wheelhouse")
+    parser.add_argument("--wheelhouse", default=os.getenv("WHEELHOUSE_PATH"), help="Wheelhouse path")
+    parser.add_argument("--offline", action="store_true", default=os.getenv("WHEELHOUSE_OFFLINE", "false").lower() == "true")
+    sub = parser.add_subparsers(dest="command", required=True)
+    lock = sub.add_parser("lock", help="Build wheels and a pinned lock for a requirements file")
+    lock.add_argument("-r", "--requirement", required=True)
+    sub.add_parser("list", help="List wheels and locks")
+
+    args = parser.parse_args()
+    if not args.wheelhouse:
+        parser.error("--wheelhouse or WHEELHOUSE_PATH is required")
+
+    wh = Wheelhouse(Path(args.wheelhouse), offline=args.offline)
+
+    if args.command == "lock":
+        lock_path = wh.lock_file(Path(args.requirement))
+        if lock_path is None:
+            print(f"❌ Could not resolve {args.requirement} against {wh.root}")
+            sys.exit(1)
+        print(lock_path.read_text(encoding="utf-8"), end="")
+    elif args.command == "list":
+        wheels = sorted(p.name for p in wh.wheels_dir.glob("*.whl"))
+        locks = sorted(wh.locks_dir.glob("*.txt"))
+        for name in wheels:
+            print(name)
+        print(f"{len(wheels)} wheels, {len(locks)} locks in {wh.root}")
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,100 @@
+import json
 import os
-import shutil
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from jinja2 import Environment, FileSystemLoader
 
+from shared import Wheelhouse, tracing
+from generation_manifest import GenerationManifest, MANIFEST_FILE, file_digest, text_digest
+
+def render_text(env, template_name, context) -> str:
+    with tracing.span("render", "generate", template=template_name) as s:
+        text = env.get_template(template_name).render(context)
+        s["bytes"] = len(text)
+    return text
+
 def render_template(env, template_name, context, output_path):
-    template = env.get_template(template_name)
     with open(output_path, "w") as f:
-        f.write(template.render(context))
+        f.write(render_text(env, template_name, context))
 
 def ensure_dir(p: Path):
     p.mkdir(parents=True, exist_ok=True)
 
+def prefetch_wheels(req_file: Path, wheelhouse: Path, offline: bool = False) -> bool:
+    """Build wheels and the pinned lock for req_file in the shared wheelhouse (stage 1's), so the deployer can check it with --no-index"""
+    return Wheelhouse(wheelhouse, offline, stage="generate").lock_file(req_file) is not None
+
+# Requirement sets already locked in a wheelhouse by this process (batch mode shares them)
+_prefetched = set()
+_prefetch_lock = threading.Lock()
+
+def prefetch_wheels_once(req_file: Path, wheelhouse: Path, offline: bool, digest: str) -> bool:
+    """prefetch_wheels, run one at a time (concurrent builds into one wheels folder would race) and once per digest."""
+    with _prefetch_lock:
+        if digest in _prefetched:
+            return True
+        ok = prefetch_wheels(req_file, wheelhouse, offline)
+        if ok:
+            _prefetched.add(digest)
+        return ok
+
+RESULT_SCHEMA_FILE = "result_schema.json"
+MESSAGE_FORMATS = ("json", "msgpack")
+
+# ResultDto field kind (from stage1's result_schema.json) -> JSON schema for asyncapi.yml
+KIND_SCHEMAS = {
+    "integer": {"type": "integer"},
+    "number": {"type": "number"},
+    "string": {"type": "string"},
+    "boolean": {"type": "boolean"},
+    "datetime": {"type": "string", "format": "date-time"},
+    "date": {"type": "string", "format": "date"},
+    "time": {"type": "string", "format": "time"},
+    "decimal": {"type": "string", "format": "decimal"},
+    "uuid": {"type": "string", "format": "uuid"},
+    "bytes": {"type": "string", "contentEncoding": "base64"},
+    "array": {"type": "array"},
+    "object": {"type": "object"},
+}
+
+# Field kind -> encoding expression for the generated encoder ({v} is the attribute access)
+KIND_ENCODERS = {
+    "datetime": "{v}.isoformat()",
+    "date": "{v}.isoformat()",
+    "time": "{v}.isoformat()",
+    "decimal": "str({v})",
+    "uuid": "str({v})",
+    "bytes": "base64.b64encode({v}).decode()",
+}
+
+def load_result_schema(service_path: Path):
+    """ResultDto field schema written by stage1, or None for cases validated before it existed."""
+    schema_file = service_path / RESULT_SCHEMA_FILE
+    if not schema_file.exists():
+        return None
+    return json.loads(schema_file.read_text(encoding="utf-8"))
+
+def result_fields(schema) -> list:
+    """Per-field encoder expression and JSON schema, as rendered into the templates."""
+    fields = []
+    for f in schema["fields"] if schema else []:
+        name, kind = f["name"], f["kind"]
+        v = f"result.{name}"
+        if kind in ("integer", "number", "string", "boolean"):
+            expr = v
+        elif kind in KIND_ENCODERS:
+            expr = f"(None if {v} is None else {KIND_ENCODERS[kind].format(v=v)})"
+        else:
+            expr = f"_to_plain({v})"
+        field_schema = dict(KIND_SCHEMAS.get(kind, {}))
+        if f["nullable"] and "type" in field_schema:
+            field_schema["type"] = [field_schema["type"], "null"]
+        fields.append({"name": name, "expr": expr, "schema": field_schema, "required": f["required"]})
+    return fields
+
 def load_config_from_env(DEBUG):
     """Load configuration defaults from .env file"""
     if DEBUG == 0:
@@ -20,9 +104,147 @@ def load_config_from_env(DEBUG):
     return {
         "source_path": os.getenv("SOURCE_PATH"),
         "output_path": os.getenv("OUTPUT_PATH"),
-        "rabbitmq_network": os.getenv("RABBITMQ_NETWORK")
+        "rabbitmq_network": os.getenv("RABBITMQ_NETWORK"),
+        "wheelhouse_path": os.getenv("WHEELHOUSE_PATH"),
+        "wheelhouse_offline": os.getenv("WHEELHOUSE_OFFLINE", "false").lower() == "true",
+        "message_format": os.getenv("MESSAGE_FORMAT", "json"),
+        "metrics_port": int(os.getenv("METRICS_PORT", "9100")),
+        "replicas": int(os.getenv("SERVICE_REPLICAS", "1")),
+        "shard_workers": os.getenv("SHARD_WORKERS", "1"),
+        "consumer_prefetch": int(os.getenv("CONSUMER_PREFETCH", "32")),
+        "consumer_concurrency": int(os.getenv("CONSUMER_CONCURRENCY", "16")),
+        "jobs": int(os.getenv("GENERATOR_JOBS", "0")) or (os.cpu_count() or 1),
+        "compile_bytecode": os.getenv("DOCKER_COMPILE_BYTECODE", "true").lower() == "true",
+        "docker_user": os.getenv("DOCKER_USER", "app"),
+        "trace_path": os.getenv("TRACE_PATH"),
     }
 
+# Template -> generated file, relative to the service output folder
+TEMPLATES = {
+    "Dockerfile.j2": "Dockerfile",
+    "dockerignore.j2": ".dockerignore",
+    "docker-compose.yml.j2": "docker-compose.yml",
+    "service.env.j2": ".env",
+    "asyncapi.yml.j2": "asyncapi.yml",
+    "service_wrapper.py.j2": "service_wrapper.py",
+}
+
+def create_environment() -> Environment:
+    """Template environment shared by every service generated in this process; templates are compiled once."""
+    templates_dir = Path(__file__).parent / "templates"
+    return Environment(loader=FileSystemLoader(str(templates_dir)), auto_reload=False)
+
+def template_digests(env: Environment) -> dict:
+    return {name: text_digest(env.loader.get_source(env, name)[0]) for name in TEMPLATES}
+
+def source_files(source_service_path: Path) -> list:
+    """(source file, path relative to the service folder) for every file of the validated case."""
+    return [(p, p.relative_to(source_service_path).as_posix())
+            for p in sorted(source_service_path.rglob("*")) if p.is_file() and "__pycache__" not in p.parts]
+
+def service_requirements(content: str, message_format: str) -> str:
+    """requirements.txt with the packages the wrapper needs appended."""
+    if "aio-pika" not in content:
+        content += "\naio-pika\n"
+    if message_format == "msgpack" and "msgpack" not in content:
+        content += "\nmsgpack\n"
+    return content
+
+def generate_service(env: Environment, digests: dict, service_name: str, args,
+                     copy_pool: ThreadPoolExecutor) -> GenerationManifest:
+    """
+    Generate one service into OUTPUT_PATH/<service_name>. Outputs whose inputs
+    (source file content, template source and render context) are unchanged
+    since the last run are skipped, so they keep their mtimes.
+    """
+    started = time.perf_counter()
+    source_service_path = Path(args.source_path).resolve() / service_name
+    output_service_path = Path(args.output_path).resolve() / service_name
+    ensure_dir(output_service_path)
+    if args.force:
+        (output_service_path / MANIFEST_FILE).unlink(missing_ok=True)
+    manifest = GenerationManifest(output_service_path)
+
+    routing_key = args.routing_key if args.routing_key else f"{service_name}.result"
+
+    # Copy all source files (requirements.txt is written below with the wrapper's packages)
+    files = [(src, rel) for src, rel in source_files(source_service_path) if rel != "requirements.txt"]
+    with tracing.span("copy sources", "generate", files=len(files)):
+        list(copy_pool.map(lambda f: manifest.copy(*f), files))
+    manifest.prune("copy", [rel for _, rel in files])
+
+    # Ensure aio-pika is in requirements.txt
+    source_req = source_service_path / "requirements.txt"
+    req_file = output_service_path / "requirements.txt"
+    if source_req.exists():
+        req_input = text_digest(file_digest(source_req), args.message_format)
+        manifest.write_text("requirements.txt", req_input, lambda: service_requirements(
+            source_req.read_text(), args.message_format), kind="requirements")
+
+    # Make the final dependency set available offline to the deployer
+    if args.wheelhouse and req_file.exists():
+        wheelhouse = Path(args.wheelhouse).resolve()
+        wheels_input = text_digest(file_digest(req_file), str(wheelhouse), str(args.offline))
+        if not manifest.step_done("wheelhouse", wheels_input) or not (wheelhouse / "wheels").is_dir():
+            if prefetch_wheels_once(req_file, wheelhouse, args.offline, wheels_input):
+                manifest.record_step("wheelhouse", wheels_input)
+            else:
+                print(f"⚠️ Could not populate wheelhouse {args.wheelhouse} for {service_name}")
+
+    schema = load_result_schema(source_service_path)
+    if schema is None:
+        print(f"⚠️ No {RESULT_SCHEMA_FILE} for {service_name}; using the generic message encoder")
+    # run(request): the service consumes {service_name}.requests instead of producing on its own
+    consumer_mode = bool(schema) and "request" in schema.get("run_params", [])
+
+    context = {
+        "service_name": service_name,
+        "image_tag": args.image_tag,
+        "routing_key": routing_key,
+        "rabbitmq_network": args.rabbitmq_network,
+        "message_format": args.message_format,
+        "result_fields": result_fields(schema),
+        "metrics_port": args.metrics_port,
+        "replicas": max(1, args.replicas),
+        "shard_workers": args.shard_workers,
+        "consumer_mode": consumer_mode,
+        "request_fields": result_fields(schema.get("request")) if consumer_mode else [],
+        "consumer_prefetch": max(1, args.consumer_prefetch),
+        "consumer_concurrency": max(1, args.consumer_concurrency),
+        "compile_bytecode": args.compile_bytecode,
+        "docker_user": "" if args.docker_user == "root" else args.docker_user,
+        "manifest_file": MANIFEST_FILE,
+    }
+
+    # Render templates
+    context_digest = text_digest(json.dumps(context, sort_keys=True, default=str))
+    for template_name, rel in TEMPLATES.items():
+        manifest.write_text(rel, text_digest(digests[template_name], context_digest),
+                            lambda: render_text(env, template_name, context))
+
+    manifest.save()
+    tracing.record("service", "generate", started, service=service_name,
+                   written=manifest.written, unchanged=manifest.unchanged)
+    return manifest
+
+# RabbitMQ stack rendered next to the services; the deployer starts it before them
+RABBITMQ_TEMPLATES = {
+    "docker-compose.rabbitmq.yml.j2": "docker-compose.yml",
+    "rabbitmq.env.j2": ".env",
+}
+
+def generate_rabbitmq(env: Environment, args) -> GenerationManifest:
+    manifest = GenerationManifest(Path(args.output_path).resolve() / "rabbitmq")
+    ensure_dir(manifest.service_dir)
+    context = {"rabbitmq_network": args.rabbitmq_network}
+    context_digest = text_digest(json.dumps(context, sort_keys=True))
+    for template_name, rel in RABBITMQ_TEMPLATES.items():
+        template_digest = text_digest(env.loader.get_source(env, template_name)[0])
+        manifest.write_text(rel, text_digest(template_digest, context_digest),
+                            lambda: render_text(env, template_name, context))
+    manifest.save()
+    return manifest
+
 def main():
 
     import argparse
@@ -32,63 +254,65 @@ def main():
     env_config = load_config_from_env(DEBUG)
 
     parser = argparse.ArgumentParser(description="Microservice Generator Agent")
-    parser.add_argument("--service-name", required=True, help="Name of the service to generate")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--service-name", nargs="+", help="Name(s) of the service(s) to generate")
+    target.add_argument("--all", action="store_true", help="Generate every service found in the source path")
     parser.add_argument("--source-path", default=env_config["source_path"], help="Service source path")
     parser.add_argument("--output-path", default=env_config["output_path"], help="Output service path")
     parser.add_argument("--image-tag", default="latest", help="Docker image tag")
     parser.add_argument("--rabbitmq-network", type=str, default=env_config["rabbitmq_network"], help="RabbitMQ network name")
-    parser.add_argument("--routing-key", type=str, required=False, help="RabbitMQ routing key")
+    parser.add_argument("--routing-key", type=str, required=False, help="RabbitMQ routing key (single service only)")
+    parser.add_argument("--wheelhouse", default=env_config["wheelhouse_path"], help="Shared wheelhouse path")
+    parser.add_argument("--offline", action="store_true", default=env_config["wheelhouse_offline"], help="Resolve only from the wheelhouse")
+    parser.add_argument("--message-format", choices=MESSAGE_FORMATS, default=env_config["message_format"], help="Default wire format of published messages")
+    parser.add_argument("--metrics-port", type=int, default=env_config["metrics_port"], help="Port of the service's Prometheus metrics endpoint (0 = disabled)")
+    parser.add_argument("--replicas", type=int, default=env_config["replicas"], help="Containers per service; each owns a partition of the shards of a sharded run()")
+    parser.add_argument("--shard-workers", default=env_config["shard_workers"], help="Shard processes per container for a sharded run() (number or 'auto' = CPU count)")
+    parser.add_argument("--consumer-prefetch", type=int, default=env_config["consumer_prefetch"], help="Unacked input messages per consumer-mode service (prefetch_count)")
+    parser.add_argument("--consumer-concurrency", type=int, default=env_config["consumer_concurrency"], help="Concurrent run(request) calls per consumer-mode service")
+    parser.add_argument("--compile-bytecode", action=argparse.BooleanOptionalAction, default=env_config["compile_bytecode"], help="Precompile the service's bytecode in the image")
+    parser.add_argument("--docker-user", default=env_config["docker_user"], help="Non-root user the container runs as ('' or 'root' = root)")
+    parser.add_argument("--jobs", type=int, default=env_config["jobs"], help="Services generated (and files copied) in parallel")
+    parser.add_argument("--force", action="store_true", help="Ignore the generation manifests and rewrite every output")
+    parser.add_argument("--trace", default=env_config["trace_path"], help="Write a Chrome trace of every step and a per-stage summary to this file")
     parser.add_argument("--verbose", action="store_true")
 
     args = parser.parse_args()
+    if args.trace:
+        tracing.enable(args.trace, "generate")
 
-    service_name = args.service_name
     source_path = Path(args.source_path).resolve()
-    output_path = Path(args.output_path).resolve()
-    source_service_path = source_path / args.service_name
-    output_service_path = output_path / args.service_name
-
-    ensure_dir(output_service_path)
-
-    image_tag = args.image_tag
-    routing_key = args.routing_key if args.routing_key else f"{service_name}.result"
-    rabbitmq_network = args.rabbitmq_network
+    if args.all:
+        service_names = sorted(p.name for p in source_path.iterdir() if (p / "script.py").is_file())
+    else:
+        service_names = args.service_name
+    if args.routing_key and len(service_names) > 1:
+        parser.error("--routing-key can only be used with a single service")
 
+    env = create_environment()
+    digests = template_digests(env)
+    jobs = max(1, args.jobs)
 
-    # Copy all source files
-    for item in source_service_path.iterdir():
-        if item.is_file():
-            shutil.copy(item, output_service_path / item.name)
-        elif item.is_dir():
-            shutil.copytree(item, output_service_path / item.name, dirs_exist_ok=True)
+    def generate(service_name):
+        try:
+            return generate_service(env, digests, service_name, args, copy_pool)
+        except Exception as e:
+            print(f"❌ Service {service_name} failed: {e}")
+            return None
 
-    # Ensure aio-pika is in requirements.txt
-    req_file = output_service_path / "requirements.txt"
-    if req_file.exists():
-        with open(req_file, "r+") as f:
-            content = f.read()
-            if "aio-pika" not in content:
-                f.write("\naio-pika\n")
+    with ThreadPoolExecutor(jobs) as copy_pool, ThreadPoolExecutor(jobs) as service_pool:
+        results = list(service_pool.map(generate, service_names))
+    generate_rabbitmq(env, args)
 
-    # Setup Jinja2
-    templates_dir = Path(__file__).parent / "templates"
-    env = Environment(loader=FileSystemLoader(str(templates_dir)))
-
-    context = {
-        "service_name": service_name,
-        "image_tag": image_tag,
-        "routing_key": routing_key,
-        "rabbitmq_network": rabbitmq_network
-    }
-
-    # Render templates
-    render_template(env, "Dockerfile.j2", context, output_service_path / "Dockerfile")
-    render_template(env, "docker-compose.yml.j2", context, output_service_path / "docker-compose.yml")
-    render_template(env, "service.env.j2", context, output_service_path / ".env")
-    render_template(env, "asyncapi.yml.j2", context, output_service_path / "asyncapi.yml")
-    render_template(env, "service_wrapper.py.j2", context, output_service_path / "service_wrapper.py")
-
-    print(f"✅ Service {service_name} generated successfully at {output_service_path}")
+    output_path = Path(args.output_path).resolve()
+    for service_name, manifest in zip(service_names, results):
+        if manifest is not None:
+            print(f"✅ Service {service_name} generated successfully at {output_path / service_name} "
+                  f"({manifest.written} written, {manifest.unchanged} unchanged)")
+    if len(service_names) > 1:
+        print(f"📦 {sum(m is not None for m in results)}/{len(service_names)} services generated")
+    if any(m is None for m in results):
+        sys.exit(1)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+Throughput benchmark for the generated service wrapper.
+
+Generates a service around a synthetic run() (configurable message count,
+rate and payload size), runs its service_wrapper.py in a subprocess against
+the in-memory broker stand-in and reports msgs/sec, end-to-end and publish
+latency percentiles and memory. Results can be saved as a baseline and later
+runs compared against it.
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from jinja2 import Environment, FileSystemLoader
+
+from agent import render_template, result_fields
+
+SYNTHETIC_SCRIPT = '''\
+import asyncio
+import os
+import time
+from dataclasses import dataclass
+from typing import AsyncGenerator
+
+@dataclass
+class ResultDto:
+    seq: int
+    sent_at: float
+    payload: str
+
+async def run() -> AsyncGenerator[ResultDto, None]:
+    count = int(os.environ["BENCH_MESSAGES"])
+    rate = float(os.environ["BENCH_RATE"])
+    payload = "x" * int(os.environ["BENCH_PAYLOAD_BYTES"])
+    interval = 1 / rate if rate else 0
+    started = time.perf_counter()
+    for i in range(count):
+        if interval:
+            delay = started + i * interval - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        yield ResultDto(i, time.perf_counter(), payload)
+    # Stay idle instead of letting the wrapper restart run()
+    await asyncio.Event().wait()
+'''
+
+SYNTHETIC_SCHEMA = {"name": "ResultDto", "fields": [
+    {"name": "seq", "annotation": "int", "kind": "integer", "nullable": False, "required": True},
+    {"name": "sent_at", "annotation": "float", "kind": "number", "nullable": False, "required": True},
+    {"name": "payload", "annotation": "str", "kind": "string", "nullable": False, "required": True},
+]}
+
+# metric -> True if higher is better
+COMPARED_METRICS = {
+    "msgs_per_sec": True,
+    "p50_ms": False,
+    "p99_ms": False,
+    "publish_p50_ms": False,
+    "publish_p99_ms": False,
+    "peak_rss_mb": False,
+}
+
+def generate_service(service_dir: Path, message_format: str):
+    service_dir.mkdir(parents=True, exist_ok=True)
+    (service_dir / "script.py").write_text(SYNTHETIC_SCRIPT, encoding="utf-8")
+    env = Environment(loader=FileSystemLoader(str(Path(__file__).parent / "templates")))
+    context = {
+        "service_name": "bench",
+        "routing_key": "bench.result",
+        "message_format": message_format,
+        "metrics_port": 0,
+        "result_fields": result_fields(SYNTHETIC_SCHEMA),
+    }
+    render_template(env, "service_wrapper.py.j2", context, service_dir / "service_wrapper.py")
+
+def percentile(values, q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+def _rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def worker(service_dir: Path, messages: int, timeout: float) -> dict:
+    """Runs inside the benchmark subprocess: import the wrapper on the stand-in broker and time it."""
+    import inmemory_broker
+
+    broker = inmemory_broker.install()
+    sys.path.insert(0, str(service_dir))
+    os.chdir(service_dir)
+    import service_wrapper
+
+    if service_wrapper.message_format == "msgpack":
+        import msgpack
+        decode = msgpack.unpackb
+    else:
+        decode = json.loads
+
+    latencies = []
+    done = asyncio.Event()
+    queues = []
+
+    def dropped() -> int:
+        return sum(q.dropped for q in queues)
+
+    def check_done():
+        # Messages dropped by QUEUE_POLICY=drop-oldest are never delivered but count as handled
+        if broker.count + dropped() >= messages:
+            done.set()
+
+    class CountingQueue(service_wrapper.PublishQueue):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            queues.append(self)
+
+        async def put(self, item):
+            await super().put(item)
+            check_done()
+
+    service_wrapper.PublishQueue = CountingQueue
+
+    def on_message(message):
+        latencies.append(time.perf_counter() - decode(message.body)["data"]["sent_at"])
+        check_done()
+
+    broker.on_message = on_message
+    rss_before = _rss_mb()
+
+    async def bench():
+        task = asyncio.create_task(service_wrapper.main())
+        started = time.perf_counter()
+        timed_out = False
+        try:
+            await asyncio.wait_for(done.wait(), timeout)
+        except asyncio.TimeoutError:
+            timed_out = True
+        finally:
+            elapsed = time.perf_counter() - started
+            task.cancel()
+        return elapsed, timed_out
+
+    elapsed, timed_out = asyncio.run(bench())
+    return {
+        "messages": broker.count,
+        "dropped": dropped(),
+        "timed_out": timed_out,
+        "seconds": round(elapsed, 4),
+        "msgs_per_sec": round(broker.count / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "publish_p50_ms": round(percentile(broker.publish_latencies, 0.50) * 1000, 3),
+        "publish_p99_ms": round(percentile(broker.publish_latencies, 0.99) * 1000, 3),
+        "peak_rss_mb": round(_rss_mb(), 1),
+        "rss_growth_mb": round(_rss_mb() - rss_before, 1),
+    }
+
+def run_scenario(args) -> dict:
+    with tempfile.TemporaryDirectory(prefix="wrapper-bench-") as tmp:
+        service_dir = Path(tmp) / "bench"
+        generate_service(service_dir, args.message_format)
+        env = dict(os.environ)
+        env.update({
+            "BENCH_MESSAGES": str(args.messages),
+            "BENCH_RATE": str(args.rate),
+            "BENCH_PAYLOAD_BYTES": str(args.payload_bytes),
+            "BENCH_CONFIRM_LATENCY_MS": str(args.confirm_latency_ms),
+            "MESSAGE_FORMAT": args.message_format,
+            "METRICS_PORT": "0",
+            "QUEUE_REPORT_SECONDS": "0",
+            "LOGS_DIR": str(Path(tmp) / "logs"),
+            "SPILL_PATH": str(Path(tmp) / "spill" / "messages.jsonl"),
+            "CHECKPOINT_PATH": str(Path(tmp) / "state" / "checkpoint.json"),
+        })
+        # Wrapper settings passed through as-is (PUBLISH_WINDOW, PUBLISHER_TASKS, ...)
+        for item in args.set or []:
+            key, _, value = item.partition("=")
+            env[key] = value
+        cmd = [sys.executable, str(Path(__file__).resolve()), "--worker", str(service_dir),
+               "--messages", str(args.messages), "--timeout", str(args.timeout)]
+        proc = subprocess.run(cmd, env=env, capture_output=True, text=True, cwd=str(Path(__file__).parent))
+        if proc.returncode != 0:
+            raise RuntimeError(f"Benchmark worker failed:\n{proc.stderr[-2000:]}")
+        return json.loads(proc.stdout.strip().splitlines()[-1])
+
+def scenario_name(args) -> str:
+    name = f"{args.message_format}-{args.messages}msgs-rate{args.rate:g}-{args.payload_bytes}B-lat{args.confirm_latency_ms:g}ms"
+    return name + "".join(f"-{item}" for item in sorted(args.set or []))
+
+def compare(result: dict, baseline: dict, tolerance: float):
+    """Returns a list of (metric, baseline, current, change, regressed)."""
+    rows = []
+    for metric, higher_is_better in COMPARED_METRICS.items():
+        old, new = baseline.get(metric), result.get(metric)
+        if not old or new is None:
+            continue
+        change = (new - old) / old
+        regressed = change < -tolerance if higher_is_better else change > tolerance
+        rows.append((metric, old, new, change, regressed))
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the generated service wrapper against an in-memory broker")
+    parser.add_argument("--messages", type=int, default=20000, help="Messages produced by the synthetic run()")
+    parser.add_argument("--rate", type=float, default=0, help="Target messages/sec from run() (0 = as fast as possible)")
+    parser.add_argument("--payload-bytes", type=int, default=256, help="Payload size of each result")
+    parser.add_argument("--confirm-latency-ms", type=float, default=1.0, help="Simulated broker confirm latency")
+    parser.add_argument("--message-format", choices=("json", "msgpack"), default="json")
+    parser.add_argument("--set", action="append", metavar="KEY=VALUE", help="Wrapper .env setting, e.g. PUBLISH_WINDOW=64 (repeatable)")
+    parser.add_argument("--save", help="Store the result in this baseline file")
+    parser.add_argument("--baseline", help="Compare against this baseline file")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative regression per metric")
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        import inmemory_broker
+        inmemory_broker.broker.confirm_latency = float(os.environ.get("BENCH_CONFIRM_LATENCY_MS", "0")) / 1000
+        print(json.dumps(worker(Path(args.worker), args.messages, args.timeout)))
+        return
+
+    name = scenario_name(args)
+    print(f"⏱️ Running {name}")
+    result = run_scenario(args)
+    for key, value in result.items():
+        print(f"  {key:>16}: {value}")
+    if result["timed_out"]:
+        print(f"⚠️ Timed out after {args.timeout:g}s with {result['messages'] + result['dropped']}/{args.messages} messages handled")
+
+    regressed = False
+    if args.baseline:
+        baseline_file = Path(args.baseline)
+        baselines = json.loads(baseline_file.read_text(encoding="utf-8")) if baseline_file.exists() else {}
+        baseline = baselines.get("scenarios", {}).get(name)
+        if baseline is None:
+            print(f"⚠️ No baseline for {name} in {baseline_file}")
+        else:
+            for metric, old, new, change, bad in compare(result, baseline, args.tolerance):
+                regressed |= bad
+                print(f"  {'❌' if bad else '✅'} {metric:>16}: {old} → {new} ({change:+.1%})")
+
+    if args.save:
+        save_file = Path(args.save)
+        baselines = json.loads(save_file.read_text(encoding="utf-8")) if save_file.exists() else {}
+        baselines.setdefault("scenarios", {})[name] = {**result, "recorded_at": time.strftime("%Y-%m-%dT%H:%M:%S")}
+        save_file.parent.mkdir(parents=True, exist_ok=True)
+        save_file.write_text(json.dumps(baselines, indent=2), encoding="utf-8")
+        print(f"💾 Saved baseline for {name} to {save_file}")
+
+    sys.exit(1 if regressed else 0)
+
+if __name__ == "__main__":
+    main()
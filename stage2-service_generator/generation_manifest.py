@@ -0,0 +1,113 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Optional
+
+from shared import file_digest
+
+MANIFEST_FILE = ".generator-manifest.json"
+
+def text_digest(*parts: str) -> str:
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(part.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+def _stat(path: Path) -> Optional[list]:
+    try:
+        st = path.stat()
+    except OSError:
+        return None
+    return [st.st_size, st.st_mtime_ns]
+
+class GenerationManifest:
+    """
+    Input hashes of a generated service's outputs, kept in <service>/.generator-manifest.json.
+
+    An output is up to date when its recorded input hash matches and the file
+    still has the size and mtime it had when it was written, so neither manual
+    edits nor deleted files go unnoticed. Up-to-date outputs are not rewritten
+    and keep their mtimes.
+    """
+    def __init__(self, service_dir: Path):
+        self.service_dir = Path(service_dir)
+        self.path = self.service_dir / MANIFEST_FILE
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+            self.entries: Dict[str, dict] = data["outputs"]
+            self.steps: Dict[str, str] = data.get("steps", {})
+        except (OSError, ValueError, KeyError):
+            self.entries, self.steps = {}, {}
+        self.written = 0
+        self.unchanged = 0
+        # Source files are copied from several threads
+        self._lock = threading.Lock()
+
+    def is_current(self, rel: str, input_hash: str) -> bool:
+        entry = self.entries.get(rel)
+        current = entry is not None and entry["input"] == input_hash and _stat(self.service_dir / rel) == entry["stat"]
+        if current:
+            with self._lock:
+                self.unchanged += 1
+        return current
+
+    def record(self, rel: str, input_hash: str, kind: str, written: bool = True):
+        entry = {"input": input_hash, "kind": kind, "stat": _stat(self.service_dir / rel)}
+        with self._lock:
+            self.entries[rel] = entry
+            if written:
+                self.written += 1
+            else:
+                self.unchanged += 1
+
+    def write_text(self, rel: str, input_hash: str, render: Callable[[], str], kind: str = "render") -> bool:
+        """Write render() to rel unless its inputs or the rendered text are unchanged. Returns True if written."""
+        if self.is_current(rel, input_hash):
+            return False
+        content = render()
+        target = self.service_dir / rel
+        # New inputs can still render the same text (e.g. a setting the template doesn't use)
+        try:
+            same = target.read_text() == content
+        except (OSError, UnicodeDecodeError):
+            same = False
+        if not same:
+            target.parent.mkdir(parents=True, exist_ok=True)
+            with open(target, "w") as f:
+                f.write(content)
+        self.record(rel, input_hash, kind, written=not same)
+        return not same
+
+    def copy(self, src: Path, rel: str) -> bool:
+        """Copy src to rel (keeping its mtime) unless its content is unchanged. Returns True if copied."""
+        digest = file_digest(src)
+        if self.is_current(rel, digest):
+            return False
+        target = self.service_dir / rel
+        target.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copy2(src, target)
+        self.record(rel, digest, "copy")
+        return True
+
+    def prune(self, kind: str, keep: Iterable[str]):
+        """Delete outputs of kind that are no longer produced (e.g. files removed from the source)."""
+        keep = set(keep)
+        for rel in [r for r, e in self.entries.items() if e["kind"] == kind and r not in keep]:
+            (self.service_dir / rel).unlink(missing_ok=True)
+            del self.entries[rel]
+
+    def step_done(self, name: str, input_hash: str) -> bool:
+        """True if a side-effect step (e.g. the wheel prefetch) already ran for these inputs."""
+        return self.steps.get(name) == input_hash
+
+    def record_step(self, name: str, input_hash: str):
+        self.steps[name] = input_hash
+
+    def save(self):
+        tmp = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        tmp.write_text(json.dumps({"outputs": self.entries, "steps": self.steps}, indent=2, sort_keys=True), encoding="utf-8")
+        os.replace(tmp, self.path)
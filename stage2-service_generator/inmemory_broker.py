@@ -0,0 +1,189 @@
+"""
+In-process stand-in for the parts of aio_pika the generated service_wrapper.py uses.
+
+Installed as `aio_pika` (see install()), it lets a generated service run with no
+RabbitMQ: exchanges keep published messages in memory and every publish is
+"confirmed" after a configurable simulated broker latency. Queues bound to an
+exchange receive matching messages (topic patterns with * and #), so
+consumer-mode services can be driven as well.
+"""
+import asyncio
+import enum
+import random
+import re
+import sys
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+class ExchangeType(str, enum.Enum):
+    FANOUT = "fanout"
+    DIRECT = "direct"
+    TOPIC = "topic"
+    HEADERS = "headers"
+
+class Message:
+    def __init__(self, body: bytes, content_type: Optional[str] = None, message_id: Optional[str] = None, **kwargs):
+        self.body = body
+        self.content_type = content_type
+        self.message_id = message_id
+        self.headers = kwargs.get("headers") or {}
+        self.correlation_id = kwargs.get("correlation_id")
+        self.reply_to = kwargs.get("reply_to")
+        self.routing_key = None
+
+class Broker:
+    """Shared state of the stand-in: settings, received messages and their confirm latency."""
+    def __init__(self, confirm_latency: float = 0.0, jitter: float = 0.0, keep_messages: bool = False):
+        self.confirm_latency = confirm_latency
+        self.jitter = jitter
+        self.keep_messages = keep_messages
+        self.messages: List[Message] = []
+        self.count = 0
+        self.publish_latencies: List[float] = []
+        self.on_message: Optional[Callable[[Message], None]] = None
+        self.connections = 0
+        self.queues: Dict[str, "Queue"] = {}
+        self.bindings: List[Tuple[str, "re.Pattern", "Queue"]] = []
+
+    async def confirm(self):
+        delay = self.confirm_latency + (random.random() * self.jitter if self.jitter else 0.0)
+        await asyncio.sleep(delay)
+
+    def deliver(self, message: Message, started: float):
+        self.count += 1
+        self.publish_latencies.append(time.perf_counter() - started)
+        if self.keep_messages:
+            self.messages.append(message)
+        if self.on_message is not None:
+            self.on_message(message)
+
+    def route(self, exchange: str, routing_key: str, message: Message):
+        if exchange == "":
+            # Default exchange: routing key is the queue name
+            if routing_key in self.queues:
+                self.queues[routing_key].put(message)
+            return
+        for name, pattern, queue in self.bindings:
+            if name == exchange and pattern.fullmatch(routing_key):
+                queue.put(message)
+
+    def queue(self, name: str) -> "Queue":
+        return self.queues.setdefault(name, Queue(name))
+
+def _topic_pattern(binding_key: str) -> "re.Pattern":
+    parts = [r"[^.]+" if w == "*" else r".*" if w == "#" else re.escape(w) for w in binding_key.split(".")]
+    return re.compile(r"\.".join(parts))
+
+broker = Broker()
+
+class IncomingMessage(Message):
+    """A queued message as seen by a consumer."""
+    def __init__(self, message: Message, redelivered: bool = False):
+        super().__init__(message.body, message.content_type, message.message_id, headers=message.headers,
+                         correlation_id=message.correlation_id, reply_to=message.reply_to)
+        self.routing_key = message.routing_key
+        self.redelivered = redelivered
+        self.queue: Optional["Queue"] = None
+        self.acked = None
+
+    async def ack(self):
+        self.acked = True
+
+    async def nack(self, requeue: bool = True):
+        self.acked = False
+        if requeue and self.queue is not None:
+            self.queue.put(self, redelivered=True)
+
+    reject = nack
+
+class Queue:
+    def __init__(self, name: str):
+        self.name = name
+        self._messages: asyncio.Queue = asyncio.Queue()
+
+    def put(self, message: Message, redelivered: bool = False):
+        incoming = IncomingMessage(message, redelivered)
+        incoming.queue = self
+        self._messages.put_nowait(incoming)
+
+    async def get(self, timeout: Optional[float] = None) -> IncomingMessage:
+        return await asyncio.wait_for(self._messages.get(), timeout)
+
+    async def bind(self, exchange, routing_key: str = "#", **kwargs):
+        name = exchange.name if isinstance(exchange, Exchange) else exchange
+        broker.bindings.append((name, _topic_pattern(routing_key), self))
+
+    def iterator(self, **kwargs) -> "QueueIterator":
+        return QueueIterator(self)
+
+class QueueIterator:
+    def __init__(self, queue: Queue):
+        self.queue = queue
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> IncomingMessage:
+        return await self.queue.get()
+
+class Exchange:
+    def __init__(self, name: str, type: ExchangeType):
+        self.name = name
+        self.type = type
+
+    async def publish(self, message: Message, routing_key: str, mandatory: bool = True, **kwargs):
+        started = time.perf_counter()
+        message.routing_key = routing_key
+        await broker.confirm()
+        broker.deliver(message, started)
+        broker.route(self.name, routing_key, message)
+
+class Channel:
+    def __init__(self, connection: "Connection"):
+        self.connection = connection
+        self.return_callbacks = set()
+        self.is_closed = False
+        self.default_exchange = Exchange("", ExchangeType.DIRECT)
+        self.prefetch_count = 0
+
+    async def set_qos(self, prefetch_count: int = 0, **kwargs):
+        self.prefetch_count = prefetch_count
+
+    async def declare_queue(self, name: str = "", **kwargs) -> Queue:
+        return broker.queue(name or f"amq.gen-{len(broker.queues)}")
+
+    async def declare_exchange(self, name: str, type=ExchangeType.DIRECT, **kwargs) -> Exchange:
+        return Exchange(name, ExchangeType(type))
+
+    async def close(self):
+        self.is_closed = True
+
+class Connection:
+    def __init__(self, url: str):
+        self.url = url
+        self.is_closed = False
+        self.reconnect_callbacks = set()
+        self.close_callbacks = set()
+
+    async def channel(self, publisher_confirms: bool = True, on_return_raises: bool = False, **kwargs) -> Channel:
+        return Channel(self)
+
+    async def close(self):
+        self.is_closed = True
+
+async def connect_robust(url: str = "", **kwargs) -> Connection:
+    broker.connections += 1
+    return Connection(url)
+
+connect = connect_robust
+
+def install() -> Broker:
+    """Make `import aio_pika` resolve to this module; returns the shared broker."""
+    sys.modules["aio_pika"] = sys.modules[__name__]
+    return broker
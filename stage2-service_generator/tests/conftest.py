@@ -0,0 +1,56 @@
+import importlib.util
+import sys
+from pathlib import Path
+
+import pytest
+
+# Stage modules import each other by bare name, as when run from the stage folder
+STAGE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(STAGE_DIR))
+
+import inmemory_broker
+
+def load_agent(name: str = "generate_agent"):
+    """This stage's agent.py under the module name orchestrator/stages.py gives it; every stage has an agent.py."""
+    if name not in sys.modules:
+        spec = importlib.util.spec_from_file_location(name, STAGE_DIR / "agent.py")
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[name] = module
+        spec.loader.exec_module(module)
+    return sys.modules[name]
+
+agent = load_agent()
+
+def render_wrapper(service_dir: Path, script: str, schema=None, request_schema=None, **context) -> Path:
+    """Write script.py and render service_wrapper.py next to it, as generate_service does."""
+    service_dir.mkdir(parents=True, exist_ok=True)
+    (service_dir / "script.py").write_text(script, encoding="utf-8")
+    context = {"service_name": "svc", "routing_key": "svc.result", "message_format": "json", "metrics_port": 0,
+               "result_fields": agent.result_fields(schema), "consumer_mode": request_schema is not None,
+               "request_fields": agent.result_fields(request_schema), **context}
+    agent.render_template(agent.create_environment(), "service_wrapper.py.j2", context, service_dir / "service_wrapper.py")
+    return service_dir / "service_wrapper.py"
+
+@pytest.fixture
+def broker(monkeypatch):
+    """A fresh in-memory broker installed as aio_pika."""
+    monkeypatch.setattr(inmemory_broker, "broker", inmemory_broker.Broker(keep_messages=True))
+    monkeypatch.setitem(sys.modules, "aio_pika", inmemory_broker)
+    return inmemory_broker.broker
+
+@pytest.fixture
+def load_wrapper(tmp_path, monkeypatch, broker):
+    """Render a service around script and import its service_wrapper.py as a module (main() is not run)."""
+    def load(script: str, env=None, service_dir=None, **render_args):
+        path = render_wrapper(service_dir or tmp_path / "svc", script, **render_args)
+        monkeypatch.chdir(path.parent)
+        monkeypatch.syspath_prepend(str(path.parent))
+        monkeypatch.delitem(sys.modules, "script", raising=False)
+        for key, value in {"MESSAGE_LOG_SAMPLE_RATE": "0", **(env or {})}.items():
+            monkeypatch.setenv(key, value)
+        spec = importlib.util.spec_from_file_location("service_wrapper", path)
+        module = importlib.util.module_from_spec(spec)
+        monkeypatch.setitem(sys.modules, "service_wrapper", module)
+        spec.loader.exec_module(module)
+        return module
+    return load
@@ -0,0 +1,111 @@
+import asyncio
+import json
+
+import inmemory_broker
+
+SCRIPT = """
+import asyncio
+from dataclasses import dataclass
+
+@dataclass
+class RequestDto:
+    n: int
+
+@dataclass
+class ResultDto:
+    i: int
+
+async def run(request: RequestDto):
+    if request.n < 0:
+        raise ValueError("negative")
+    for i in range(request.n):
+        await asyncio.sleep(0.01)
+        yield ResultDto(i)
+"""
+
+REQUEST_SCHEMA = {"name": "RequestDto", "fields": [
+    {"name": "n", "annotation": "int", "kind": "integer", "nullable": False, "required": True}]}
+
+def load_consumer(load_wrapper):
+    return load_wrapper(SCRIPT, request_schema=REQUEST_SCHEMA, routing_key="svc.result")
+
+def request(n, **properties):
+    return inmemory_broker.Message(json.dumps({"n": n}).encode(), "application/json", **properties)
+
+async def drain(queue):
+    messages = []
+    while True:
+        try:
+            messages.append(await queue.get(timeout=0.05))
+        except asyncio.TimeoutError:
+            return messages
+
+def test_reply_to_and_correlation_id_round_trip(load_wrapper, broker):
+    wrapper = load_consumer(load_wrapper)
+    assert wrapper.consumer_mode
+
+    async def scenario():
+        consumer = asyncio.create_task(wrapper.consume_main())
+        await asyncio.sleep(0.05)
+        events = inmemory_broker.Exchange("events", inmemory_broker.ExchangeType.TOPIC)
+        await events.publish(request(2, correlation_id="c-1", reply_to="replies"), routing_key="svc.request")
+        replies = broker.queue("replies")
+        first = await replies.get(timeout=1)
+        second = await replies.get(timeout=1)
+        consumer.cancel()
+        await asyncio.gather(consumer, return_exceptions=True)
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert [json.loads(m.body)["data"] for m in (first, second)] == [{"i": 0}, {"i": 1}]
+    assert {m.correlation_id for m in (first, second)} == {"c-1"}
+    assert [m.message_id for m in (first, second)] == ["svc:c-1:1", "svc:c-1:2"]
+
+def test_ack_after_results_and_failed_requests_are_retried_once(load_wrapper, broker):
+    wrapper = load_consumer(load_wrapper)
+    inbox = broker.queue("svc.requests")
+    results = broker.queue("results")
+
+    async def scenario():
+        events = inmemory_broker.Exchange("events", inmemory_broker.ExchangeType.TOPIC)
+        await results.bind(events, routing_key="svc.result")
+        default = inmemory_broker.Exchange("", inmemory_broker.ExchangeType.DIRECT)
+        inbox.put(request(1, message_id="ok"))
+        inbox.put(request(-1, message_id="bad"))
+
+        ok = await inbox.get(timeout=1)
+        await wrapper.handle_request(ok, events, default)
+        bad = await inbox.get(timeout=1)
+        await wrapper.handle_request(bad, events, default)
+        # The failed request is requeued once, then rejected
+        redelivered = await inbox.get(timeout=1)
+        await wrapper.handle_request(redelivered, events, default)
+        return ok, bad, redelivered, await drain(results), await drain(inbox)
+
+    ok, bad, redelivered, published, left = asyncio.run(scenario())
+    assert ok.acked is True
+    # Without reply_to results go to the service routing key, correlated by message id
+    assert [(json.loads(m.body)["data"], m.correlation_id) for m in published] == [({"i": 0}, "ok")]
+    assert bad.acked is False and redelivered.redelivered and redelivered.message_id == "bad"
+    assert redelivered.acked is False and left == []
+    assert wrapper.ERRORS.value == 2
+
+def test_stop_waits_for_requests_in_flight(load_wrapper, broker):
+    wrapper = load_consumer(load_wrapper)
+
+    async def scenario():
+        consumer = asyncio.create_task(wrapper.consume_main())
+        await asyncio.sleep(0.05)
+        events = inmemory_broker.Exchange("events", inmemory_broker.ExchangeType.TOPIC)
+        await events.publish(request(5, correlation_id="c-1", reply_to="replies"), routing_key="svc.request")
+        replies = broker.queue("replies")
+        first = await replies.get(timeout=1)
+        # What SIGTERM does through stop_on_sigterm
+        consumer.cancel()
+        await asyncio.gather(consumer, return_exceptions=True)
+        # Everything is out by the time consume_main() returns
+        return [first] + [replies._messages.get_nowait() for _ in range(replies._messages.qsize())]
+
+    replies = asyncio.run(scenario())
+    assert [json.loads(m.body)["data"]["i"] for m in replies] == [0, 1, 2, 3, 4]
+    assert broker.queue("svc.requests")._messages.empty()
@@ -0,0 +1,60 @@
+import os
+
+from generation_manifest import GenerationManifest, MANIFEST_FILE, text_digest
+
+def render_counter():
+    calls = []
+
+    def render(text):
+        def go():
+            calls.append(text)
+            return text
+        return go
+    return calls, render
+
+def test_unchanged_outputs_are_skipped(tmp_path):
+    service = tmp_path / "service"
+    src = tmp_path / "script.py"
+    src.write_text("print('hi')\n")
+    calls, render = render_counter()
+
+    manifest = GenerationManifest(service)
+    assert manifest.write_text("Dockerfile", text_digest("tpl", "ctx"), render("FROM python\n"))
+    assert manifest.copy(src, "script.py")
+    manifest.save()
+    mtime = (service / "Dockerfile").stat().st_mtime_ns
+
+    # Same inputs on the next run: nothing is rendered, copied or touched
+    manifest = GenerationManifest(service)
+    assert not manifest.write_text("Dockerfile", text_digest("tpl", "ctx"), render("FROM python\n"))
+    assert not manifest.copy(src, "script.py")
+    assert (manifest.written, manifest.unchanged) == (0, 2)
+    assert calls == ["FROM python\n"]
+    assert (service / "Dockerfile").stat().st_mtime_ns == mtime
+
+    # New inputs that render the same text leave the file alone
+    assert not manifest.write_text("Dockerfile", text_digest("tpl", "ctx2"), render("FROM python\n"))
+    assert (service / "Dockerfile").stat().st_mtime_ns == mtime
+
+    # A manual edit or a deleted output is regenerated
+    (service / "Dockerfile").write_text("FROM scratch\n")
+    os.remove(service / "script.py")
+    assert manifest.write_text("Dockerfile", text_digest("tpl", "ctx2"), render("FROM python\n"))
+    assert manifest.copy(src, "script.py")
+    assert (service / "Dockerfile").read_text() == "FROM python\n"
+
+def test_prune_and_steps(tmp_path):
+    service = tmp_path / "service"
+    for name in ("a.py", "b.py"):
+        (tmp_path / name).write_text(name)
+    manifest = GenerationManifest(service)
+    manifest.copy(tmp_path / "a.py", "a.py")
+    manifest.copy(tmp_path / "b.py", "b.py")
+    manifest.record_step("wheelhouse", "w1")
+    manifest.prune("copy", ["a.py"])
+    manifest.save()
+
+    assert sorted(p.name for p in service.iterdir()) == sorted([MANIFEST_FILE, "a.py"])
+    manifest = GenerationManifest(service)
+    assert set(manifest.entries) == {"a.py"}
+    assert manifest.step_done("wheelhouse", "w1") and not manifest.step_done("wheelhouse", "w2")
@@ -0,0 +1,90 @@
+import asyncio
+
+SCRIPT = """
+from dataclasses import dataclass
+
+@dataclass
+class ResultDto:
+    n: int
+
+async def run():
+    for i in range(3):
+        yield ResultDto(i)
+"""
+
+class FlakyExchange:
+    """Exchange that fails to publish the message ids in fail, once each."""
+    def __init__(self, fail=()):
+        self.fail = set(fail)
+        self.published = []
+
+    async def publish(self, message, routing_key, mandatory=True):
+        await asyncio.sleep(0.01)
+        if message.message_id in self.fail:
+            self.fail.discard(message.message_id)
+            raise ConnectionError(f"lost {message.message_id}")
+        self.published.append(message.message_id)
+
+def test_coalescing_holds_until_full_or_next_loop_turn(load_wrapper):
+    wrapper = load_wrapper(SCRIPT)
+    items = [wrapper.Outgoing(b"{}", f"m{i}") for i in range(5)]
+
+    async def scenario():
+        exchange = FlakyExchange()
+        publisher = wrapper.Publisher(exchange, "svc.result", True, window=8, coalesce=3, linger=0)
+        for item in items[:2]:
+            await publisher.publish(item)
+        # Below the coalesce size nothing is sent until the event loop runs again
+        assert not publisher._pending and len(publisher._held) == 2
+        await publisher.publish(items[2])
+        # A full group is sent at once, even with linger 0
+        assert len(publisher._pending) == 3 and not publisher._held
+        for item in items[3:]:
+            await publisher.publish(item)
+        await asyncio.sleep(0.05)
+        assert exchange.published == ["m0", "m1", "m2", "m3", "m4"]
+        await publisher.drain()
+
+    asyncio.run(scenario())
+
+def test_unconfirmed_messages_are_handed_back(load_wrapper):
+    wrapper = load_wrapper(SCRIPT)
+    items = [wrapper.Outgoing(b"{}", f"m{i}") for i in range(4)]
+
+    async def scenario():
+        exchange = FlakyExchange(fail={"m1"})
+        publisher = wrapper.Publisher(exchange, "svc.result", True, window=8, coalesce=1, linger=0)
+        for item in items[:3]:
+            await publisher.publish(item)
+        await asyncio.sleep(0.05)
+        try:
+            await publisher.publish(items[3])
+        except ConnectionError:
+            pass
+        else:
+            raise AssertionError("the failed publish was not surfaced")
+        return exchange, publisher.abort()
+
+    exchange, unsent = asyncio.run(scenario())
+    assert exchange.published == ["m0", "m2"]
+    # m3 was refused by the publish() that surfaced the error, so it is handed back too
+    assert [item.message_id for item in unsent] == ["m1", "m3"]
+
+def test_publish_loop_fails_while_idle(load_wrapper):
+    wrapper = load_wrapper(SCRIPT)
+
+    async def scenario():
+        pq = wrapper.PublishQueue(10, "block", wrapper.Path("spill.jsonl"))
+        publisher = wrapper.Publisher(FlakyExchange(fail={"m0"}), "svc.result", True, window=8, coalesce=1, linger=0)
+        worker = asyncio.create_task(wrapper.publish_loop(pq, publisher))
+        await pq.put(wrapper.Outgoing(b"{}", "m0"))
+        # Nothing else is queued: the worker still ends with the error instead of waiting for the next message
+        try:
+            await asyncio.wait_for(worker, 1)
+        except ConnectionError:
+            pass
+        else:
+            raise AssertionError("the failed publish was not surfaced")
+        return [item.message_id for item in publisher.abort()]
+
+    assert asyncio.run(scenario()) == ["m0"]
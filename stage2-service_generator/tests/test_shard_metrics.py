@@ -0,0 +1,51 @@
+import socket
+from urllib.request import urlopen
+
+import pytest
+
+SCRIPT = """
+from dataclasses import dataclass
+
+@dataclass
+class ResultDto:
+    n: int
+
+async def run(shard_index: int = 0, shard_count: int = 1):
+    yield ResultDto(shard_index)
+"""
+
+SHARDS = {"SHARD_WORKERS": "2", "SHARD_REPLICAS": "2", "SHARD_REPLICA_INDEX": "1", "METRICS_PORT": "9100"}
+
+def scrape(server) -> str:
+    with urlopen(f"http://127.0.0.1:{server.server_address[1]}/metrics", timeout=2) as resp:
+        return resp.read().decode()
+
+def test_shard_processes_serve_metrics_after_the_supervisor_port(load_wrapper):
+    wrapper = load_wrapper(SCRIPT, env={**SHARDS, "SHARD_LOCAL_INDEX": "1"})
+    assert wrapper.sharded and (wrapper.shard_index, wrapper.shard_count) == (3, 4)
+    assert wrapper.metrics_port == 9102
+
+def test_supervisor_merges_shard_metrics(load_wrapper):
+    wrapper = load_wrapper(SCRIPT, env=SHARDS)
+    wrapper.MESSAGES_PUBLISHED.inc(3)
+    # Local shard 0 is this module's own endpoint; shard 1 (the next port) is down
+    shard0 = wrapper.start_metrics_server(0)
+    port = shard0.server_address[1]
+    with socket.socket() as s:
+        if s.connect_ex(("127.0.0.1", port + 1)) == 0:
+            shard0.shutdown()
+            pytest.skip(f"port {port + 1} is in use")
+    wrapper.shard_metrics_base = port
+    supervisor = wrapper.start_metrics_server(0, wrapper.ShardMetricsHandler)
+    try:
+        lines = scrape(supervisor).splitlines()
+    finally:
+        supervisor.shutdown()
+        shard0.shutdown()
+
+    # Shards are numbered globally: replica 1 with 2 workers owns shards 2 and 3
+    assert 'service_shard_up{shard="2"} 1' in lines
+    assert 'service_shard_up{shard="3"} 0' in lines
+    assert 'service_messages_published_total{shard="2"} 3' in lines
+    assert 'service_publish_seconds_bucket{shard="2",le="+Inf"} 0' in lines
+    assert lines.count("# TYPE service_messages_published_total counter") == 1
@@ -0,0 +1,49 @@
+import asyncio
+
+SCRIPT = """
+from dataclasses import dataclass
+
+@dataclass
+class ResultDto:
+    n: int
+
+async def run():
+    yield ResultDto(0)
+"""
+
+async def take(pq, n):
+    """Refill from the spill file and take n messages off the queue."""
+    refill = asyncio.create_task(pq.refill())
+    try:
+        ids = []
+        for _ in range(n):
+            ids.append((await asyncio.wait_for(pq.queue.get(), 1)).message_id)
+            pq.queue.task_done()
+        return ids
+    finally:
+        refill.cancel()
+
+def test_spilled_messages_keep_their_order_across_a_restart(load_wrapper, tmp_path):
+    wrapper = load_wrapper(SCRIPT)
+    spill = tmp_path / "spill" / "messages.jsonl"
+
+    async def first_run():
+        pq = wrapper.PublishQueue(2, "spill", spill)
+        for i in range(5):
+            await pq.put(wrapper.Outgoing(b"{}", f"m{i}"))
+        assert pq.stats()["depth"] == 2 and pq.stats()["spilled"] == 3
+        assert await take(pq, 1) == ["m0"]
+
+    async def second_run():
+        # The queued messages died with the process; the spill file did not
+        pq = wrapper.PublishQueue(2, "spill", spill)
+        assert pq.stats()["spilled"] == 3
+        # The queue has room, but a new message must not overtake the spilled ones
+        await pq.put(wrapper.Outgoing(b"{}", "m5"))
+        assert await take(pq, 4) == ["m2", "m3", "m4", "m5"]
+        await asyncio.wait_for(pq.join(), 1)
+        assert pq.stats()["spilled"] == 0
+
+    asyncio.run(first_run())
+    asyncio.run(second_run())
+    assert spill.read_bytes() == b""
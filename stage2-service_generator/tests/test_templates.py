@@ -0,0 +1,43 @@
+import pytest
+
+from generate_agent import MANIFEST_FILE, create_environment
+
+def render(template: str, **context) -> str:
+    return create_environment().get_template(template).render(**context)
+
+def test_compose_builds_the_image_once_for_all_replicas():
+    compose = render("docker-compose.yml.j2", service_name="svc", image_tag="latest", replicas=3,
+                     metrics_port=0, rabbitmq_network="net")
+    services = compose.split("\n  svc-")[1:]
+    assert [s.split(":", 1)[0] for s in services] == ["0", "1", "2"]
+    assert ["build: ." in s for s in services] == [True, False, False]
+    assert all("image: svc:latest" in s for s in services)
+
+@pytest.mark.parametrize("compile_bytecode", [True, False])
+@pytest.mark.parametrize("docker_user", ["app", ""])
+def test_dockerfile_caches_wheels_and_drops_root(compile_bytecode, docker_user):
+    dockerfile = render("Dockerfile.j2", compile_bytecode=compile_bytecode, docker_user=docker_user)
+    lines = dockerfile.splitlines()
+
+    # pip's cache is a BuildKit cache mount in the wheel stage; the runtime stage installs from the wheels only
+    assert lines[0] == "# syntax=docker/dockerfile:1"
+    assert "RUN --mount=type=cache,target=/root/.cache/pip \\" in lines
+    install = next(line for line in lines if "pip install" in line)
+    assert "--no-index --find-links /wheels" in install
+    assert ("--no-compile" in install) != compile_bytecode
+    assert ("RUN python -m compileall -q -j 0 /app" in lines) == compile_bytecode
+    # The user is switched to last, after the files it must own are in place
+    if docker_user:
+        assert [line for line in lines if line.startswith("USER")] == ["USER app"]
+        assert lines.index("USER app") > lines.index("COPY . .")
+        assert "chown app:app logs spill state" in dockerfile
+    else:
+        assert "USER" not in dockerfile and "useradd" not in dockerfile
+    assert lines[-1] == 'CMD ["python", "service_wrapper.py"]'
+
+def test_dockerignore_keeps_tests_and_build_files_out_of_the_image():
+    entries = render("dockerignore.j2", manifest_file=MANIFEST_FILE).splitlines()[1:]
+    for entry in ("test_*.py", "conftest.py", "__pycache__/", "*.py[cod]", ".venv/", "logs/", "spill/", "state/",
+                  ".env", "Dockerfile", "docker-compose.yml", MANIFEST_FILE):
+        assert entry in entries
+    assert not {"script.py", "service_wrapper.py", "requirements.txt"} & set(entries)
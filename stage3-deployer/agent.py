@@ -1,13 +1,26 @@
+import asyncio
+import contextlib
+import fnmatch
+import hashlib
+import json
 import os
-import subprocess
+import shlex
 import logging
+import threading
+import time
+from dataclasses import dataclass, field
 from pathlib import Path
 from datetime import datetime
+from typing import Dict, List, Optional
+
+from shared import Wheelhouse, file_digest, tracing
 
 def setup_logger(log_dir: Path, name: str, filename: str) -> logging.Logger:
     log_dir.mkdir(parents=True, exist_ok=True)
     logger = logging.getLogger(name)
     logger.setLevel(logging.INFO)
+    if logger.handlers:
+        return logger
     fh = logging.FileHandler(log_dir / filename)
     fh.setLevel(logging.INFO)
     formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
@@ -15,67 +28,375 @@ def setup_logger(log_dir: Path, name: str, filename: str) -> logging.Logger:
     logger.addHandler(fh)
     return logger
 
-def run_command(cmd, cwd=None):
-    result = subprocess.run(cmd, cwd=cwd, shell=True,
-                            stdout=subprocess.PIPE, stderr=subprocess.PIPE,
-                            text=True)
-    return result.returncode, result.stdout, result.stderr
+# Services checked at once would otherwise race building the same wheels into one folder
+_wheelhouse_lock = threading.Lock()
 
-def deploy_service(service_path: str, logs_path: str):
-    service_path = Path(service_path).resolve()
+def lock_requirements(wheelhouse: Wheelhouse, req: Path) -> Optional[Path]:
+    """The wheelhouse's pinned lock for req, as stage 2 wrote it (resolved from the local wheels on a miss)."""
+    with _wheelhouse_lock:
+        return wheelhouse.lock_file(req)
 
-    # Load environment
-    log_dir = Path(logs_path) / service_path.name
-    op_logger = setup_logger(log_dir, "operations", "operations.log")
-    err_logger = setup_logger(log_dir, "errors", "errors.log")
+async def run_command_async(cmd, cwd=None):
+    """Run a shell command on an asyncio subprocess, so many services can be checked at once."""
+    proc = await asyncio.create_subprocess_shell(cmd, cwd=cwd,
+                                                 stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+    out, err = await proc.communicate()
+    return proc.returncode, out.decode(errors="replace"), err.decode(errors="replace")
 
-    op_logger.info(f"Starting deployment process for {service_path.name}")
+# Stacks without a Dockerfile (e.g. the RabbitMQ stack from docker-compose.rabbitmq.yml.j2)
+# only run prebuilt images; they are deployed in an earlier tier than the services using them.
+INFRA_TIER = 0
+SERVICE_TIER = 1
 
-    # --- Pre-deployment checks ---
-    required_files = ["Dockerfile", "docker-compose.yml", ".env", "requirements.txt"]
+def deploy_tier(service_path: Path) -> int:
+    return SERVICE_TIER if (service_path / "Dockerfile").exists() else INFRA_TIER
+
+@dataclass
+class DeployResult:
+    service: str
+    status: str = "pending"  # deployed, unchanged, failed, blocked
+    message: str = ""
+    timings: Dict[str, float] = field(default_factory=dict)
+    cached: List[str] = field(default_factory=list)  # checks skipped because their inputs passed before
+    action: str = ""  # build, up or skip
+    started: float = field(default_factory=time.perf_counter)
+    total: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return self.status in ("deployed", "unchanged")
+
+# Never part of a fingerprint: runtime output of the service and generator bookkeeping
+FINGERPRINT_EXCLUDED_DIRS = {"logs", "spill", "state", ".venv", "__pycache__", ".pytest_cache"}
+FINGERPRINT_EXCLUDED_FILES = {".generator-manifest.json"}
+# Files that configure the containers rather than go into the image
+RUNTIME_FILES = ("docker-compose.yml", ".env")
+
+def _dockerignored(rel: str, patterns: List[str]) -> bool:
+    parts = rel.split("/")
+    prefixes = ["/".join(parts[:i]) for i in range(1, len(parts) + 1)]
+    return any(fnmatch.fnmatch(prefix, p) for p in patterns for prefix in prefixes)
+
+def fingerprint_service(service_path: Path, wheelhouse_path: Optional[str] = None) -> Dict[str, str]:
+    """
+    Digests of the inputs of each deployment step:
+    config (compose file + .env, which is also all the running containers get
+    outside the image), syntax (script.py), dependencies (requirements.txt +
+    wheelhouse contents) and image (everything that goes into the build
+    context, honouring .dockerignore).
+    """
+    files = {}
+    for p in sorted(service_path.rglob("*")):
+        rel = p.relative_to(service_path).as_posix()
+        if p.is_file() and not FINGERPRINT_EXCLUDED_DIRS & set(rel.split("/")[:-1]) and p.name not in FINGERPRINT_EXCLUDED_FILES:
+            files[rel] = file_digest(p)
+
+    def combine(rels, *extra) -> str:
+        h = hashlib.sha256()
+        for rel in rels:
+            if rel in files:
+                h.update(f"{rel}\0{files[rel]}\0".encode())
+        for e in extra:
+            h.update(f"{e}\0".encode())
+        return h.hexdigest()
+
+    ignore_file = service_path / ".dockerignore"
+    patterns = [l.strip().rstrip("/") for l in ignore_file.read_text().splitlines()
+                if l.strip() and not l.startswith("#")] if ignore_file.exists() else []
+    # The Dockerfile and .dockerignore shape the image even when they exclude themselves from the context
+    build_context = [rel for rel in files if rel in ("Dockerfile", ".dockerignore")
+                     or (rel not in RUNTIME_FILES and not _dockerignored(rel, patterns))]
+
+    wheels = []
+    if wheelhouse_path:
+        wheels_dir = Path(wheelhouse_path).resolve() / "wheels"
+        wheels = sorted(p.name for p in wheels_dir.glob("*.whl")) if wheels_dir.is_dir() else []
+    return {
+        "config": combine(RUNTIME_FILES),
+        "syntax": combine(["script.py"]),
+        "dependencies": combine(["requirements.txt"], str(wheelhouse_path or ""), *wheels),
+        "image": combine(build_context),
+    }
+
+class DeployLedger:
+    """
+    Per service: the fingerprints its checks last passed with, and its last
+    successful deploys. Kept in one JSON file (DEPLOY_LEDGER_PATH).
+    """
+    HISTORY = 20
+
+    def __init__(self, path: Optional[Path] = None):
+        self.path = Path(path) if path else None
+        self.services: Dict[str, dict] = {}
+        # The orchestrator deploys from several threads into one ledger
+        self._lock = threading.RLock()
+        if self.path and self.path.exists():
+            try:
+                self.services = json.loads(self.path.read_text(encoding="utf-8"))["services"]
+            except (OSError, ValueError, KeyError):
+                self.services = {}
+
+    def _entry(self, service: str) -> dict:
+        return self.services.setdefault(service, {"checks": {}, "deploys": []})
+
+    def check_passed(self, service: str, step: str, digest: str) -> bool:
+        return self.services.get(service, {}).get("checks", {}).get(step) == digest
+
+    def record_check(self, service: str, step: str, digest: str):
+        with self._lock:
+            self._entry(service)["checks"][step] = digest
+
+    def last_deploy(self, service: str) -> Optional[dict]:
+        deploys = self.services.get(service, {}).get("deploys")
+        return deploys[-1] if deploys else None
+
+    def record_deploy(self, service: str, fingerprint: Dict[str, str], action: str):
+        with self._lock:
+            deploys = self._entry(service)["deploys"]
+            deploys.append({"at": datetime.now().isoformat(timespec="seconds"), "action": action,
+                            "image": fingerprint["image"], "config": fingerprint["config"]})
+            del deploys[:-self.HISTORY]
+
+    def save(self):
+        if self.path is None:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            tmp = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+            tmp.write_text(json.dumps({"services": self.services}, indent=2), encoding="utf-8")
+            os.replace(tmp, self.path)
+
+class FleetLimits:
+    """Concurrency limits shared by every service of a fleet deployment."""
+    def __init__(self, check_jobs: int = 0, build_jobs: int = 4):
+        # Checks mostly wait on subprocesses: default like ThreadPoolExecutor
+        self.checks = asyncio.Semaphore(max(1, check_jobs or min(32, (os.cpu_count() or 1) + 4)))
+        self.builds = asyncio.Semaphore(max(1, build_jobs))
+
+async def _timed(result: DeployResult, step: str, cmd: str, cwd=None, slots: Optional[asyncio.Semaphore] = None):
+    async with slots or contextlib.nullcontext():
+        started = time.perf_counter()
+        with tracing.span(step, "deploy", concurrent=True, service=result.service, command=cmd) as s:
+            code, out, err = await run_command_async(cmd, cwd=cwd)
+            s["exit_code"] = code
+        result.timings[step] = round(time.perf_counter() - started, 3)
+    return code, out, err
+
+async def precheck_service(service_path: Path, wheelhouse_path: Optional[str], result: DeployResult,
+                           op_logger: logging.Logger, err_logger: logging.Logger, limits: FleetLimits,
+                           ledger: "DeployLedger", fingerprint: Dict[str, str], force: bool = False) -> bool:
+    """
+    Run the independent pre-deployment checks of one service concurrently.
+    A check whose inputs are unchanged since it last passed is skipped unless force is set.
+    """
+    tier = deploy_tier(service_path)
+    required_files = ["docker-compose.yml"] if tier == INFRA_TIER else ["Dockerfile", "docker-compose.yml", ".env", "requirements.txt"]
     for f in required_files:
         if not (service_path / f).exists():
             msg = f"Missing required file: {f}"
             err_logger.error(msg)
             op_logger.error("Deployment failed due to missing file.")
-            return
+            result.message = msg
+            return False
 
-    # Validate docker-compose syntax
-    code, out, err = run_command("docker compose config", cwd=service_path)
-    if code != 0:
-        err_logger.error(f"docker-compose config failed:\n{err}")
-        op_logger.error("Deployment aborted due to invalid docker-compose.yml")
-        return
-    op_logger.info("docker-compose.yml validated successfully")
-
-    # Validate Python syntax
-    script_file = service_path / "script.py"
-    if script_file.exists():
-        code, out, err = run_command(f"python -m py_compile {script_file}")
+    async def compose_config():
+        code, out, err = await _timed(result, "config", "docker compose config", service_path, limits.checks)
+        if code != 0:
+            err_logger.error(f"docker-compose config failed:\n{err}")
+            op_logger.error("Deployment aborted due to invalid docker-compose.yml")
+            return "invalid docker-compose.yml"
+        op_logger.info("docker-compose.yml validated successfully")
+
+    async def python_syntax():
+        script_file = service_path / "script.py"
+        if not script_file.exists():
+            return
+        code, out, err = await _timed(result, "syntax", f"python -m py_compile {shlex.quote(str(script_file))}", None, limits.checks)
         if code != 0:
             err_logger.error(f"Python syntax error:\n{err}")
             op_logger.error("Deployment aborted due to Python syntax errors")
-            return
+            return "Python syntax errors"
         op_logger.info("Python syntax validated successfully")
 
-    # Validate dependencies
-    code, out, err = run_command(f"pip install --dry-run -r requirements.txt", cwd=service_path)
-    if code != 0:
-        err_logger.error(f"Dependency resolution failed:\n{err}")
-        op_logger.error("Deployment aborted due to dependency errors")
-        return
-    op_logger.info("Dependencies validated successfully")
+    async def dependencies():
+        # Validate dependencies (offline against the shared wheelhouse and its lock when configured)
+        pip_cmd = "pip install --dry-run -r requirements.txt"
+        if wheelhouse_path:
+            wheelhouse = Wheelhouse(Path(wheelhouse_path), offline=True, stage="deploy")
+            lock_path = await asyncio.to_thread(lock_requirements, wheelhouse, service_path / "requirements.txt")
+            if lock_path is None:
+                err_logger.error(f"Could not resolve requirements.txt from the wheelhouse {wheelhouse.root}")
+                op_logger.error("Deployment aborted due to dependency errors")
+                return "dependency errors"
+            pip_cmd = shlex.join(["pip", "install", "--dry-run", *wheelhouse.find_links_args(), "-r", str(lock_path)])
+        code, out, err = await _timed(result, "dependencies", pip_cmd, service_path, limits.checks)
+        if code != 0:
+            err_logger.error(f"Dependency resolution failed:\n{err}")
+            op_logger.error("Deployment aborted due to dependency errors")
+            return "dependency errors"
+        op_logger.info("Dependencies validated successfully")
+
+    async def unless_passed(step, check):
+        if not force and ledger.check_passed(result.service, step, fingerprint[step]):
+            result.cached.append(step)
+            op_logger.info(f"Skipping {step} check: inputs unchanged since it last passed")
+            return None
+        error = await check()
+        if error is None:
+            ledger.record_check(result.service, step, fingerprint[step])
+        return error
+
+    checks = [("config", compose_config)] if tier == INFRA_TIER else \
+        [("config", compose_config), ("syntax", python_syntax), ("dependencies", dependencies)]
+    errors = [e for e in await asyncio.gather(*(unless_passed(step, check) for step, check in checks)) if e]
+    result.message = ", ".join(errors)
+    return not errors
+
+async def deploy_service_async(service_path, logs_path: str, wheelhouse_path: str = None,
+                               limits: Optional[FleetLimits] = None,
+                               ready: Optional[asyncio.Event] = None,
+                               upstream: Optional[List[DeployResult]] = None,
+                               ledger: Optional["DeployLedger"] = None, force: bool = False) -> DeployResult:
+    """
+    Check and deploy one service. In a fleet, the build waits until `ready` is
+    set (every earlier tier has finished) and is skipped if any upstream
+    deployment failed; pre-checks start right away.
+
+    With a ledger, unchanged checks are skipped and the deployment is
+    downgraded: no rebuild if the image inputs match the last successful
+    deploy, and nothing at all if the runtime config matches too and the
+    containers are running. force ignores the ledger.
+    """
+    service_path = Path(service_path).resolve()
+    limits = limits or FleetLimits()
+    ledger = ledger or DeployLedger()
+    result = DeployResult(service_path.name)
+
+    # Load environment
+    log_dir = Path(logs_path) / service_path.name
+    op_logger = setup_logger(log_dir, f"operations.{service_path.name}", "operations.log")
+    err_logger = setup_logger(log_dir, f"errors.{service_path.name}", "errors.log")
+
+    op_logger.info(f"Starting deployment process for {service_path.name}")
+    with tracing.span("fingerprint", "deploy", service=result.service):
+        fingerprint = fingerprint_service(service_path, wheelhouse_path)
+
+    # --- Pre-deployment checks ---
+    if not await precheck_service(service_path, wheelhouse_path, result, op_logger, err_logger, limits,
+                                  ledger, fingerprint, force):
+        result.status = "failed"
+        return _finish(result, ledger)
+
+    if ready is not None:
+        waited = time.perf_counter()
+        await ready.wait()
+        result.timings["wait"] = round(time.perf_counter() - waited, 3)
+    failed_upstream = [r.service for r in upstream or [] if not r.ok]
+    if failed_upstream:
+        op_logger.error(f"Deployment skipped: {', '.join(failed_upstream)} failed to deploy")
+        result.status = "blocked"
+        result.message = f"waiting on failed {', '.join(failed_upstream)}"
+        return _finish(result, ledger)
 
     # --- Deployment ---
-    op_logger.info("Starting Docker deployment...")
-    code, out, err = run_command("docker compose up -d --build", cwd=service_path)
+    result.action = "build"
+    last = None if force else ledger.last_deploy(result.service)
+    if last and last["image"] == fingerprint["image"]:
+        result.action = "up"
+        # Ledgers written before the config digest was recorded lack it; those restart once
+        if last.get("config") == fingerprint["config"]:
+            code, out, err = await _timed(result, "status", "docker compose ps --status running -q", service_path, limits.checks)
+            if code == 0 and out.strip():
+                result.action = "skip"
+    if result.action == "skip":
+        op_logger.info("Deployment skipped: unchanged since the last successful deploy and running")
+        result.status = "unchanged"
+        return _finish(result, ledger)
+
+    op_logger.info("Starting Docker deployment..." if result.action == "build" else
+                   "Starting Docker deployment without rebuild: image inputs unchanged since the last deploy")
+    cmd = "docker compose up -d --build" if result.action == "build" else "docker compose up -d"
+    code, out, err = await _timed(result, "build", cmd, service_path, limits.builds)
     if code != 0:
         err_logger.error(f"Docker deployment failed:\n{err}")
         op_logger.error("Deployment failed during docker compose up")
-        return
+        result.status = "failed"
+        result.message = "docker compose up failed"
+        return _finish(result, ledger)
 
     op_logger.info(f"Deployment succeeded for {service_path.name}")
     op_logger.info(out)
+    ledger.record_deploy(result.service, fingerprint, result.action)
+    result.status = "deployed"
+    return _finish(result, ledger)
+
+def _finish(result: DeployResult, ledger: "DeployLedger") -> DeployResult:
+    result.total = round(time.perf_counter() - result.started, 3)
+    tracing.record("service", "deploy", result.started, concurrent=True, service=result.service,
+                   status=result.status, action=result.action, cached=len(result.cached))
+    ledger.save()
+    return result
+
+def deploy_service(service_path: str, logs_path: str, wheelhouse_path: str = None,
+                   ledger: Optional["DeployLedger"] = None, force: bool = False) -> DeployResult:
+    return asyncio.run(deploy_service_async(service_path, logs_path, wheelhouse_path, ledger=ledger, force=force))
+
+def fleet_service_paths(roots: List[str]) -> List[Path]:
+    """Every folder with a docker-compose.yml directly under the given fleet roots."""
+    paths = []
+    for root in roots:
+        paths += sorted(p for p in Path(root).resolve().iterdir() if (p / "docker-compose.yml").is_file())
+    return paths
+
+async def deploy_fleet(service_paths: List[Path], logs_path: str, wheelhouse_path: str = None,
+                       check_jobs: int = 0, build_jobs: int = 4,
+                       ledger: Optional["DeployLedger"] = None, force: bool = False) -> List[DeployResult]:
+    """
+    Deploy many services: all pre-checks run concurrently, builds go through a
+    pool of build_jobs, and each tier (infrastructure, then services) is
+    deployed only after the previous tier has finished.
+    """
+    limits = FleetLimits(check_jobs, build_jobs)
+    ledger = ledger or DeployLedger()
+    tiers = sorted({deploy_tier(Path(p)) for p in service_paths})
+    ready = {tier: asyncio.Event() for tier in tiers}
+    # Results of every finished tier; a tier's builds start once the tiers before it are in here
+    upstream: List[DeployResult] = []
+    tasks = {tier: [asyncio.create_task(deploy_service_async(
+        p, logs_path, wheelhouse_path, limits, ready[tier], upstream, ledger, force))
+                    for p in service_paths if deploy_tier(Path(p)) == tier]
+             for tier in tiers}
+
+    results = []
+    for tier in tiers:
+        ready[tier].set()
+        tier_results = await asyncio.gather(*tasks[tier])
+        upstream.extend(tier_results)
+        results += tier_results
+    return results
+
+STEPS = ("config", "syntax", "dependencies", "wait", "status", "build")
+STATUS_ICONS = {"deployed": "✅", "unchanged": "💤", "failed": "❌", "blocked": "⏸️"}
+
+def print_report(results: List[DeployResult], wall_time: float):
+    print(f"{'service':<32} {'result':<11} {'action':<6} " + " ".join(f"{s:>12}" for s in STEPS) + f" {'total':>9}")
+    for r in results:
+        steps = " ".join(f"{r.timings[s]:>11.2f}s" if s in r.timings else f"{'cached' if s in r.cached else '-':>12}"
+                         for s in STEPS)
+        print(f"{r.service:<32} {STATUS_ICONS.get(r.status, '')} {r.status:<9} {r.action or '-':<6} {steps} {r.total:>8.2f}s"
+              + (f"  {r.message}" if r.message and not r.ok else ""))
+    deployed = sum(r.ok for r in results)
+    serial = sum(r.timings.get(s, 0) for r in results for s in STEPS if s != "wait")
+    print(f"📦 {deployed}/{len(results)} deployed or unchanged in {wall_time:.2f}s (steps total {serial:.2f}s)")
+
+def write_report(results: List[DeployResult], wall_time: float, report_path: Path):
+    report_path.parent.mkdir(parents=True, exist_ok=True)
+    report_path.write_text(json.dumps({
+        "finished_at": datetime.now().isoformat(timespec="seconds"),
+        "wall_time": round(wall_time, 3),
+        "services": [{"service": r.service, "status": r.status, "action": r.action, "message": r.message,
+                      "timings": r.timings, "cached": r.cached, "total": r.total} for r in results],
+    }, indent=2), encoding="utf-8")
 
 def load_config_from_env(DEBUG):
     """Load configuration defaults from .env file"""
@@ -85,7 +406,13 @@ def load_config_from_env(DEBUG):
 
     return {
         "source_path": os.getenv("SOURCE_PATH"),
-        "logs_path": os.getenv("DEPLOY_LOGS_PATH")
+        "service_path": os.getenv("SERVICE_PATH"),
+        "logs_path": os.getenv("DEPLOY_LOGS_PATH"),
+        "wheelhouse_path": os.getenv("WHEELHOUSE_PATH"),
+        "check_jobs": int(os.getenv("DEPLOY_CHECK_JOBS", "0")),
+        "build_jobs": int(os.getenv("DEPLOY_BUILD_JOBS", "4")),
+        "ledger_path": os.getenv("DEPLOY_LEDGER_PATH"),
+        "trace_path": os.getenv("TRACE_PATH"),
     }
 
 if __name__ == "__main__":
@@ -96,6 +423,27 @@ if __name__ == "__main__":
     env_config = load_config_from_env(DEBUG)
     
     parser = argparse.ArgumentParser(description="Deploy a microservice with validation")
-    parser.add_argument("service_path", type=str, default=env_config["service_path"], help="Path to the service folder to deploy")
+    parser.add_argument("service_path", type=str, nargs="*", default=[env_config["service_path"]], help="Path(s) to the service folder(s) to deploy")
+    parser.add_argument("--wheelhouse", default=env_config["wheelhouse_path"], help="Shared wheelhouse path")
+    parser.add_argument("--fleet", action="store_true", help="Treat each path as a folder of services and deploy all of them")
+    parser.add_argument("--check-jobs", type=int, default=env_config["check_jobs"], help="Concurrent pre-check commands (0 = CPU count + 4, at most 32)")
+    parser.add_argument("--build-jobs", type=int, default=env_config["build_jobs"], help="Concurrent docker compose builds")
+    parser.add_argument("--report", help="Write the per-service timing report to this JSON file")
+    parser.add_argument("--ledger", default=env_config["ledger_path"], help="Deploy ledger file (default: <DEPLOY_LOGS_PATH>/deploy_ledger.json)")
+    parser.add_argument("--trace", default=env_config["trace_path"], help="Write a Chrome trace of every step and a per-stage summary to this file")
+    parser.add_argument("--force", action="store_true", help="Run every check and rebuild, ignoring the deploy ledger")
     args = parser.parse_args()
-    deploy_service(args.service_path, env_config["logs_path"])
+    if args.trace:
+        tracing.enable(args.trace, "deploy")
+
+    ledger = DeployLedger(Path(args.ledger) if args.ledger else Path(env_config["logs_path"]) / "deploy_ledger.json")
+
+    service_paths = fleet_service_paths(args.service_path) if args.fleet else [Path(p) for p in args.service_path]
+    started = time.perf_counter()
+    results = asyncio.run(deploy_fleet(service_paths, env_config["logs_path"], args.wheelhouse,
+                                       args.check_jobs, args.build_jobs, ledger, args.force))
+    wall_time = time.perf_counter() - started
+    print_report(results, wall_time)
+    if args.report:
+        write_report(results, wall_time, Path(args.report))
+    raise SystemExit(0 if all(r.ok for r in results) else 1)
@@ -0,0 +1,19 @@
+"""
+Modules this stage shares with stage 1: tracing, file_digest() and the wheelhouse.
+
+They live in the stage 1 folder, which is put on sys.path here and nowhere
+else; import them from this module. The folder is appended, so this stage's
+own modules come first.
+"""
+import sys
+from pathlib import Path
+
+STAGE1_PATH = str(Path(__file__).resolve().parent.parent / "stage1-input_manager")
+if STAGE1_PATH not in sys.path:
+    sys.path.append(STAGE1_PATH)
+
+import tracing
+from blob_store import file_digest
+from wheelhouse import Wheelhouse
+
+__all__ = ["STAGE1_PATH", "Wheelhouse", "file_digest", "tracing"]
@@ -0,0 +1,135 @@
+import asyncio
+import json
+import sys
+from pathlib import Path
+
+import pytest
+
+from deploy_agent import DeployLedger, deploy_fleet, deploy_service
+
+# Stand-in for the docker CLI: logs "<service> <step> <start> <end>" per call and holds
+# `compose config` / `compose up` for a moment so overlapping calls can be counted
+STUB_DOCKER = f"""#!{sys.executable}
+import os, sys, time
+from pathlib import Path
+
+service = Path.cwd().name
+step = "up" if "up" in sys.argv else sys.argv[2]
+started = time.time()
+if step in ("config", "up"):
+    time.sleep(0.2)
+if step == "ps":
+    print("c0ffee")  # the service's container is running
+with open(os.environ["STUB_DOCKER_LOG"], "a") as f:
+    f.write(f"{{service}} {{step}} {{started}} {{time.time()}}\\n")
+sys.exit(1 if step == "up" and service == os.environ.get("STUB_DOCKER_FAIL") else 0)
+"""
+
+def make_service(root: Path, name: str, infra: bool = False) -> Path:
+    path = root / name
+    path.mkdir(parents=True)
+    (path / "docker-compose.yml").write_text("services: {}\n")
+    if not infra:
+        (path / "Dockerfile").write_text("FROM python:3.11-slim\n")
+        (path / ".env").write_text("SERVICE_NAME=x\n")
+        (path / "requirements.txt").write_text("")
+        (path / "script.py").write_text("async def run():\n    yield 1\n")
+    return path
+
+def max_overlap(calls) -> int:
+    edges = sorted([(start, 1) for start, _ in calls] + [(end, -1) for _, end in calls])
+    running = peak = 0
+    for _, delta in edges:
+        running += delta
+        peak = max(peak, running)
+    return peak
+
+@pytest.fixture
+def stub_docker(tmp_path, monkeypatch):
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    (bin_dir / "docker").write_text(STUB_DOCKER)
+    (bin_dir / "pip").write_text("#!/bin/sh\nexit 0\n")
+    for tool in bin_dir.iterdir():
+        tool.chmod(0o755)
+    log = tmp_path / "docker.log"
+    monkeypatch.setenv("PATH", f"{bin_dir}:{Path(sys.executable).parent}:/usr/bin:/bin")
+    monkeypatch.setenv("STUB_DOCKER_LOG", str(log))
+    monkeypatch.setenv("STUB_DOCKER_FAIL", "svc_1")
+
+    def calls():
+        entries = [line.split() for line in log.read_text().splitlines()]
+        return [(service, step, float(start), float(end)) for service, step, start, end in entries]
+    return calls
+
+def test_fleet_deploys_infrastructure_first_within_limits(tmp_path, stub_docker):
+    fleet = tmp_path / "fleet"
+    paths = [make_service(fleet, "rabbitmq", infra=True)] + [make_service(fleet, f"svc_{i}") for i in range(4)]
+    ledger = DeployLedger(tmp_path / "ledger.json")
+
+    results = asyncio.run(deploy_fleet(paths, str(tmp_path / "logs"), check_jobs=2, build_jobs=2, ledger=ledger))
+
+    status = {r.service: r.status for r in results}
+    # The failing service does not take the rest of its tier down with it
+    assert status == {"rabbitmq": "deployed", "svc_0": "deployed", "svc_1": "failed",
+                      "svc_2": "deployed", "svc_3": "deployed"}
+    calls = stub_docker()
+    ups = {service: (start, end) for service, step, start, end in calls if step == "up"}
+    assert ups["rabbitmq"][1] <= min(start for service, (start, _) in ups.items() if service != "rabbitmq")
+    assert max_overlap([(start, end) for service, (start, end) in ups.items() if service != "rabbitmq"]) == 2
+    assert max_overlap([(start, end) for _, step, start, end in calls if step == "config"]) <= 2
+
+def test_dependencies_checked_against_the_wheelhouse_lock(tmp_path, stub_docker):
+    pip_log = tmp_path / "pip.log"
+    (tmp_path / "bin" / "pip").write_text(f"#!{sys.executable}\nimport json, sys\n"
+                                          f"open({str(pip_log)!r}, 'a').write(json.dumps(sys.argv[1:]) + '\\n')\n")
+    service = make_service(tmp_path / "fleet", "svc_0")
+    wheelhouse = tmp_path / "shared wheels"
+
+    results = asyncio.run(deploy_fleet([service], str(tmp_path / "logs"), str(wheelhouse)))
+
+    assert results[0].status == "deployed"
+    # The pinned lock stage 2 would have written; a path with a space stays one argument
+    locks = list((wheelhouse / "locks").glob("*.txt"))
+    assert len(locks) == 1
+    assert json.loads(pip_log.read_text()) == ["install", "--dry-run", "--no-index", "--find-links",
+                                               str(wheelhouse / "wheels"), "-r", str(locks[0])]
+
+def test_ledger_skips_what_is_unchanged(tmp_path, stub_docker):
+    service = make_service(tmp_path / "fleet", "svc_0")
+    log = tmp_path / "docker.log"
+
+    def deploy(force=False):
+        log.write_text("")
+        # Reloaded each time: the ledger carries over between runs through its file
+        result = deploy_service(str(service), str(tmp_path / "logs"), ledger=DeployLedger(tmp_path / "ledger.json"),
+                                force=force)
+        return result, [step for _, step, _, _ in stub_docker()]
+
+    result, steps = deploy()
+    assert (result.status, result.action, result.cached) == ("deployed", "build", [])
+    assert steps == ["config", "up"]
+
+    # Nothing changed and the container runs: every check and the deploy are skipped
+    result, steps = deploy()
+    assert (result.status, result.action) == ("unchanged", "skip")
+    assert sorted(result.cached) == ["config", "dependencies", "syntax"]
+    assert steps == ["ps"]
+
+    # script.py goes into the image: its check runs again and the image is rebuilt
+    (service / "script.py").write_text("async def run():\n    yield 2\n")
+    result, steps = deploy()
+    assert (result.status, result.action) == ("deployed", "build")
+    assert sorted(result.cached) == ["config", "dependencies"] and "syntax" in result.timings
+    assert steps == ["up"]
+
+    # Only the runtime config changed: restart without a rebuild
+    (service / ".env").write_text("SERVICE_NAME=y\n")
+    result, steps = deploy()
+    assert (result.status, result.action) == ("deployed", "up")
+    assert steps == ["config", "up"]
+
+    # force ignores the ledger
+    result, steps = deploy(force=True)
+    assert (result.status, result.action, result.cached) == ("deployed", "build", [])
+    assert steps == ["config", "up"]